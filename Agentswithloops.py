@@ -1,12 +1,9 @@
 import os
 import warnings
 from dotenv import load_dotenv
-from typing import List
 from colorama import Fore
-from haystack import Pipeline, component
-from haystack.components.builders.prompt_builder import PromptBuilder
-from haystack.components.generators.openai import OpenAIGenerator
 from haystack.utils.auth import Secret
+from entity_extraction import BatchEntityExtractor, build_self_reflecting_agent, extract_entities
 
 warnings.filterwarnings('ignore')
 load_dotenv()  # Changed from load_env() to load_dotenv()
@@ -16,63 +13,8 @@ openai_api_key = Secret.from_env_var("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("The OPENAI_API_KEY environment variable is not set.")
 
-# Create an EntitiesValidator component
-@component
-class EntitiesValidator:
-    @component.output_types(entities_to_validate=str, entities=str)
-    def run(self, replies: List[str]):
-        if 'DONE' in replies[0]:
-            return {"entities": replies[0].replace('DONE', '')}
-        else:
-            print(Fore.RED + "Reflecting on entities\n", replies[0])
-            return {"entities_to_validate": replies[0]}
-
-entities_validator = EntitiesValidator()
-
-# Create a Prompt Template with an 'if' block
-template = """
-{% if entities_to_validate %}
-    Here was the text you were provided:
-    {{ text }}
-    Here are the entities you previously extracted: 
-    {{ entities_to_validate[0] }}
-    Are these the correct entities? 
-    Things to check for:
-    - Entity categories should exactly be "Person", "Location" and "Date"
-    - There should be no extra categories
-    - There should be no duplicate entities
-    - If there are no appropriate entities for a category, the category should have an empty list
-    If you are done say 'DONE' and return your new entities in the next line
-    If not, simply return the best entities you can come up with.
-    Entities:
-{% else %}
-    Extract entities from the following text
-    Text: {{ text }} 
-    The entities should be presented as key-value pairs in a JSON object.
-    Example: 
-    {
-        "Person": ["value1", "value2"], 
-        "Location": ["value3", "value4"],
-        "Date": ["value5", "value6"]
-    }
-    If there are no possibilities for a particular category, return an empty list for this
-    category
-    Entities:
-{% endif %}
-"""
-
 # Create a Self-Reflecting Agent
-prompt_template = PromptBuilder(template=template)
-llm = OpenAIGenerator(api_key=openai_api_key)
-
-self_reflecting_agent = Pipeline(max_loops_allowed=10)
-self_reflecting_agent.add_component("prompt_builder", prompt_template)
-self_reflecting_agent.add_component("entities_validator", entities_validator)
-self_reflecting_agent.add_component("llm", llm)
-
-self_reflecting_agent.connect("prompt_builder.prompt", "llm.prompt")
-self_reflecting_agent.connect("llm.replies", "entities_validator.replies")
-self_reflecting_agent.connect("entities_validator.entities_to_validate", "prompt_builder.entities_to_validate")
+self_reflecting_agent = build_self_reflecting_agent(api_key=openai_api_key)
 
 # Save the pipeline diagram as an image
 self_reflecting_agent.draw("self_reflecting_agent_pipeline.png")
@@ -86,8 +28,9 @@ comprising 19% of the population of Turkey,[4] and is the most populous city in
 and the world's fifteenth-largest city.
 """
 
-result1 = self_reflecting_agent.run({"prompt_builder": {"text": text1}})
-print(Fore.GREEN + result1['entities_validator']['entities'])
+result1 = extract_entities(self_reflecting_agent, text1)
+print(Fore.GREEN + result1['entities'])
+print(result1['metrics'])
 
 text2 = """
 Stefano: Hey all, let's start the all hands for June 6th 2024
@@ -99,5 +42,26 @@ Esmail: Before we end this call, we should add a new Generator component for Lla
 Tuana: Thanks all, I think we're done here, we can create some issues in GitHub about these.
 """
 
-result2 = self_reflecting_agent.run({"prompt_builder": {"text": text2}})
-print(Fore.GREEN + result2['entities_validator']['entities'])
+result2 = extract_entities(self_reflecting_agent, text2)
+print(Fore.GREEN + result2['entities'])
+print(result2['metrics'])
+
+# Batch extraction: many reflection loops run at once, results stream out in input order
+batch_texts = [
+    """
+Haystack is an open source framework by deepset, a company based in Berlin, for building
+LLM applications with pipelines of components such as retrievers and generators.
+""",
+    """
+The Eiffel Tower in Paris was completed in 1889 for the World's Fair and designed by the
+engineering company of Gustave Eiffel. It is 330 metres tall.
+""",
+    """
+Ada Lovelace worked with Charles Babbage on the Analytical Engine in London and published
+the first algorithm intended to be carried out by such a machine in 1843.
+""",
+]
+batch_extractor = BatchEntityExtractor(max_workers=int(os.getenv("AGENT_MAX_WORKERS", "8")), api_key=openai_api_key)
+for result in batch_extractor.run(batch_texts):
+    print(Fore.GREEN + str(result.get('entities', result.get('error'))))
+
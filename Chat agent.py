@@ -1,13 +1,16 @@
 import os
 import warnings
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from haystack import Pipeline, component
 from haystack.utils.auth import Secret
 from haystack.components.generators import OpenAIGenerator
 from haystack.dataclasses import ChatMessage
 from haystack.components.joiners import BranchJoiner
 import json
+from chat_streaming import StreamingFunctionDispatcher
+from conversation_memory import ConversationMemory
+from tool_execution import ToolExecutor
 
 warnings.filterwarnings("ignore")
 load_dotenv()
@@ -16,13 +19,17 @@ openai_api_key = Secret.from_env_var("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("The OPENAI_API_KEY environment variable is not set.")
 
+# All function calls in the messages are started at once on the tool executor and their
+# replies are collected in order
 @component
 class SimpleFunctionCaller:
-    def __init__(self, available_functions: Dict[str, Any]):
+    def __init__(self, available_functions: Dict[str, Any], tool_executor: Optional[ToolExecutor] = None):
         self.available_functions = available_functions
+        self.tool_executor = tool_executor or ToolExecutor(available_functions)
 
     def run(self, messages: List[ChatMessage]) -> Dict[str, List[ChatMessage]]:
         function_replies = []
+        calls = []
         for message in messages:
             if message.role == "assistant" and message.content:
                 try:
@@ -30,10 +37,8 @@ class SimpleFunctionCaller:
                     name = data["function"]["name"]
                     args = data["function"]["arguments"]
                     if name in self.available_functions:
-                        result = self.available_functions[name](**args)
-                        function_replies.append(
-                            ChatMessage(content=result, role="function", name="function_caller")
-                        )
+                        calls.append((len(function_replies), name, args))
+                        function_replies.append(None)
                 except (json.JSONDecodeError, KeyError) as e:
                     function_replies.append(
                         ChatMessage(
@@ -42,24 +47,11 @@ class SimpleFunctionCaller:
                             name="function_caller"
                         )
                     )
+        results = self.tool_executor.call_many([(name, args) for _, name, args in calls])
+        for (position, _, _), result in zip(calls, results):
+            function_replies[position] = ChatMessage(content=result, role="function", name="function_caller")
         return {"function_replies": function_replies}
 
-@component
-class ChatMessagePromptBuilder:
-    def run(self, messages: List[ChatMessage]) -> Dict[str, str]:
-        lines = []
-        for m in messages:
-            if m.role == "system":
-                lines.append(f"System: {m.content}")
-            elif m.role == "user":
-                lines.append(f"User: {m.content}")
-            elif m.role == "assistant":
-                lines.append(f"Assistant: {m.content}")
-            else:
-                lines.append(f"{m.role.capitalize()}: {m.content}")
-        prompt = "\n".join(lines)
-        return {"prompt": prompt}
-
 def rag_pipeline_func(query: str) -> str:
     return f"RAG pipeline result for query: {query}"
 
@@ -71,7 +63,15 @@ available_functions = {
     "get_current_weather": get_current_weather
 }
 
-function_caller = SimpleFunctionCaller(available_functions=available_functions)
+# RAG lookups are pure, so repeated queries are answered from the memo for TOOL_CACHE_TTL seconds
+tool_executor = ToolExecutor(
+    available_functions,
+    pure_functions={"rag_pipeline_func"},
+    ttl=float(os.getenv("TOOL_CACHE_TTL", "300")),
+    timeout=float(os.getenv("TOOL_TIMEOUT", "30")),
+)
+
+function_caller = SimpleFunctionCaller(available_functions=available_functions, tool_executor=tool_executor)
 
 replies = {
     "replies": [
@@ -87,9 +87,21 @@ results = function_caller.run(messages=replies["replies"])
 print(results["function_replies"])
 
 message_collector = BranchJoiner(type_=List[ChatMessage])
-prompt_builder = ChatMessagePromptBuilder()
-chat_generator = OpenAIGenerator(model="gpt-3.5-turbo", api_key=openai_api_key)
-function_caller = SimpleFunctionCaller(available_functions=available_functions)
+# Recent turns within a token budget plus a rolling summary of older ones; only new
+# messages are passed in on each turn
+prompt_builder = ConversationMemory(
+    max_tokens=int(os.getenv("CHAT_MEMORY_TOKENS", "2000")),
+    summarizer=OpenAIGenerator(model="gpt-3.5-turbo", api_key=openai_api_key, api_base_url=os.getenv("OPENAI_BASE_URL")),
+)
+# Replies are streamed: tokens are printed as they arrive and function calls are dispatched
+# as soon as their JSON is complete. OPENAI_BASE_URL can point to a local fake server.
+function_caller = StreamingFunctionDispatcher(available_functions=available_functions, tool_executor=tool_executor)
+chat_generator = OpenAIGenerator(
+    model="gpt-3.5-turbo",
+    api_key=openai_api_key,
+    api_base_url=os.getenv("OPENAI_BASE_URL"),
+    streaming_callback=function_caller.streaming_callback,
+)
 
 chat_agent = Pipeline()
 chat_agent.add_component("message_collector", message_collector)
@@ -111,7 +123,7 @@ chat_agent.connect(
 chat_agent.connect(
     "generator",
     "function_caller",
-    {"replies": "messages"}
+    {"replies": "replies"}
 )
 chat_agent.connect(
     "function_caller",
@@ -121,29 +133,30 @@ chat_agent.connect(
 
 chat_agent.draw("chat_agent_pipeline.png")
 
-messages = [
+prompt_builder.add([
     ChatMessage.from_system(
         """If needed, break down the user's question into simpler questions and follow-up questions that you can use with your tools.
 Don't make assumptions about what values to plug into functions. Ask for clarification if a user request is ambiguous.""",
         name="system"
     )
-]
+])
 
 while True:
     user_input = input("User: ")
     if user_input.lower() in {"exit", "quit"}:
         print("Exiting chat.")
+        print(tool_executor.stats())
         break
-    messages.append(ChatMessage.from_user(user_input, name="user"))
-    result = chat_agent.run({"message_collector": {"messages": messages}})
+    function_caller.start()
+    result = chat_agent.run({"message_collector": {"messages": [ChatMessage.from_user(user_input, name="user")]}})
     
     # Handle cases where generator might not return any replies
-    generator_output = result.get("generator", {})
+    # (the reply itself has already been printed while it streamed in)
+    generator_output = result.get("function_caller", {})
     replies = generator_output.get("replies", [])
     if not replies:
         print("Assistant: I'm sorry, I couldn't process that.")
         continue
     
     reply = replies[0]
-    print(f"Assistant: {reply.content}")
-    messages.append(ChatMessage(content=reply.content, role="assistant", name="assistant"))
+    prompt_builder.add([ChatMessage(content=reply, role="assistant", name="assistant")])
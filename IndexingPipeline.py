@@ -3,13 +3,18 @@ import os
 from glob import glob
 from haystack.components.embedders import OpenAIDocumentEmbedder
 from haystack.dataclasses import Document
-from haystack.document_stores.in_memory import InMemoryDocumentStore
 from haystack import Pipeline
 from haystack.components.converters.txt import TextFileToDocument
 from haystack.components.preprocessors.document_splitter import DocumentSplitter
-from haystack.components.writers import DocumentWriter
 from haystack.components.embedders import OpenAITextEmbedder
-from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
+from memmap_store import MemmapDocumentStore, MemmapEmbeddingRetriever
+from embedding_cache import EmbeddingCache, CachedDocumentEmbedder, CachedTextEmbedder
+from batch_search import BatchQueryEmbedder, BatchEmbeddingRetriever
+from parallel_preprocess import ParallelConvertSplit
+from streaming_ingest import StreamingIngestor, iter_files
+from incremental_indexing import IndexManifest, FileChangeDetector, ChunkEmbeddingReuser, IncrementalDocumentWriter
+from hybrid_retrieval import InvertedIndex, HybridDocumentWriter, HybridRetriever
+from embedding_scheduler import EmbeddingScheduler
 
 warnings.filterwarnings('ignore')
 
@@ -18,33 +23,62 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("The OPENAI_API_KEY environment variable is not set.")
 
+# Embeddings are cached by (model, text) in memory and on disk, so repeated chunks and queries skip the API
+embedding_cache = EmbeddingCache(path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"))
+
 # Embedding documents
-embedder = OpenAIDocumentEmbedder(model="text-embedding-3-small")
+embedder = CachedDocumentEmbedder(OpenAIDocumentEmbedder(model="text-embedding-3-small"), embedding_cache)
 documents = [Document(content="Haystack is an open source AI framework to build full AI applications in Python"),
              Document(content="You can build AI Pipelines by combining Components"),]
 embedder.run(documents=documents)
 
-# Initialize a Document Store
-document_store = InMemoryDocumentStore()
+# Initialize a Document Store kept on disk, so the index survives between runs
+document_store = MemmapDocumentStore(os.getenv("INDEX_PATH", "index"))
 
-# Setting up the indexing pipeline
+# Setting up the indexing pipeline. Only new or modified files are converted, and only
+# chunks whose content changed are sent to the embedder; chunks of deleted files are removed.
+manifest = IndexManifest(os.path.join(document_store.path, "files.json"))
+# BM25 index kept next to the document store and updated by the writers
+text_index = InvertedIndex(os.path.join(document_store.path, "bm25.pkl"), document_store=document_store)
+detector = FileChangeDetector(manifest=manifest)
 converter = TextFileToDocument()
 splitter = DocumentSplitter()
-embedder = OpenAIDocumentEmbedder()
-writer = DocumentWriter(document_store=document_store)
+# Conversion and splitting are CPU-bound, so they run sharded across a process pool
+preprocessor = ParallelConvertSplit(converter=converter, splitter=splitter)
+reuser = ChunkEmbeddingReuser(manifest=manifest, document_store=document_store)
+# Chunks are embedded in token-sized batches, several at a time, within the account's
+# tokens-per-minute limit; finished batches are checkpointed in the embedding cache
+embedder = CachedDocumentEmbedder(
+    EmbeddingScheduler(tokens_per_minute=int(os.getenv("OPENAI_TPM", "1000000")), checkpoint=embedding_cache),
+    embedding_cache,
+)
+writer = IncrementalDocumentWriter(manifest=manifest, document_store=document_store, text_index=text_index)
 
 indexing_pipeline = Pipeline()
-indexing_pipeline.add_component("converter", converter)
-indexing_pipeline.add_component("splitter", splitter)
+indexing_pipeline.add_component("detector", detector)
+indexing_pipeline.add_component("preprocessor", preprocessor)
+indexing_pipeline.add_component("reuser", reuser)
 indexing_pipeline.add_component("embedder", embedder)
 indexing_pipeline.add_component("writer", writer)
-indexing_pipeline.connect("converter", "splitter")
-indexing_pipeline.connect("splitter", "embedder")
+indexing_pipeline.connect("detector.sources", "preprocessor.sources")
+indexing_pipeline.connect("detector.meta", "preprocessor.meta")
+indexing_pipeline.connect("preprocessor", "reuser")
+indexing_pipeline.connect("reuser", "embedder")
 indexing_pipeline.connect("embedder", "writer")
 
 # Process all text files in the specified directory
-text_files = glob('C:\\Users\\devna\\OneDrive\\Desktop\\New folder\\*.txt')  # Change the path to your directory of the folder with your text files
-indexing_pipeline.run({"converter": {"sources": text_files}})
+text_files_pattern = 'C:\\Users\\devna\\OneDrive\\Desktop\\New folder\\*.txt'  # Change the path to your directory of the folder with your text files
+if os.getenv("STREAMING_INGEST"):
+    # Streaming mode for large corpora: files are read lazily and sent through the same stages
+    # in micro-batches, so memory stays flat; progress and throughput are printed while it runs
+    ingestor = StreamingIngestor(converter=converter, splitter=splitter, embedder=embedder,
+                                 writer=HybridDocumentWriter(document_store=document_store, text_index=text_index),
+                                 change_detector=detector, reuser=reuser)
+    ingestor.run(iter_files(text_files_pattern))
+else:
+    text_files = glob(text_files_pattern)
+    indexing_result = indexing_pipeline.run({"detector": {"sources": text_files}})
+    print(indexing_result["writer"])
 
 # Retrieve and display documents
 filtered_documents = document_store.filter_documents()
@@ -54,8 +88,8 @@ for i, doc in enumerate(filtered_documents):
     print(doc.content)
 
 # Creating a document search pipeline
-query_embedder = OpenAITextEmbedder()
-retriever = InMemoryEmbeddingRetriever(document_store=document_store)
+query_embedder = CachedTextEmbedder(OpenAITextEmbedder(), embedding_cache)
+retriever = MemmapEmbeddingRetriever(document_store=document_store, nprobe=8)
 
 document_search = Pipeline()
 document_search.add_component("query_embedder", query_embedder)
@@ -77,3 +111,34 @@ for i, document in enumerate(results["retriever"]["documents"]):
     print("\n--------------\n")
     print(f"DOCUMENT {i}")
     print(document.content)
+
+# Hybrid search: keyword lookups like this one are answered from the BM25 index without
+# embedding the query; otherwise BM25 and embedding results are fused
+hybrid_retriever = HybridRetriever(document_store=document_store, text_index=text_index,
+                                   text_embedder=query_embedder, embedding_retriever=retriever)
+hybrid_document_search = Pipeline()
+hybrid_document_search.add_component("retriever", hybrid_retriever)
+results = hybrid_document_search.run({"retriever": {"query": "Davinci born", "top_k": 3}})
+print(f"Query embedding skipped: {results['retriever']['embedding_skipped']}")
+for i, document in enumerate(results["retriever"]["documents"]):
+    print("\n--------------\n")
+    print(f"DOCUMENT {i}")
+    print(document.content)
+
+# Batch search: all questions are embedded in one embedder call and scored with one matrix multiply
+batch_document_search = Pipeline()
+batch_document_search.add_component("query_embedder", BatchQueryEmbedder(CachedDocumentEmbedder(OpenAIDocumentEmbedder(), embedding_cache)))
+batch_document_search.add_component("retriever", BatchEmbeddingRetriever(document_store=document_store))
+batch_document_search.connect("query_embedder.embeddings", "retriever.query_embeddings")
+
+questions = ["How old was Davinci when he died?", "Where was Davinci born?"]
+results = batch_document_search.run({"query_embedder": {"queries": questions}, "retriever": {"top_k": 3}})
+for question, documents in zip(questions, results["retriever"]["documents"]):
+    print("\n--------------\n")
+    print(f"QUESTION: {question}")
+    for i, document in enumerate(documents):
+        print(f"DOCUMENT {i}")
+        print(document.content)
+
+print(embedding_cache.stats())
+print(hybrid_retriever.stats())
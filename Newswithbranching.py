@@ -1,18 +1,24 @@
 import os
 import warnings
-from dotenv import load_dotenv
-import requests
 from typing import List
-from haystack import Document, Pipeline, component
+from dotenv import load_dotenv
+from haystack import Pipeline, component
 from haystack.utils.auth import Secret
 from haystack.components.builders import PromptBuilder
 from haystack.components.converters import HTMLToDocument
-from haystack.components.fetchers import LinkContentFetcher
 from haystack.components.generators import OpenAIGenerator
-from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
-from haystack.components.writers import DocumentWriter
-from haystack.document_stores.in_memory import InMemoryDocumentStore
-from haystack.components.embedders import SentenceTransformersDocumentEmbedder, SentenceTransformersTextEmbedder
+from haystack.components.joiners import BranchJoiner, DocumentJoiner
+from parallel_preprocess import ParallelConvertSplit
+from ann_index import IVFDocumentStore, IVFEmbeddingRetriever
+from hackernews import HackernewsNewestFetcher
+from embedding_cache import EmbeddingCache, CachedDocumentEmbedder, CachedTextEmbedder
+from generator_cache import ResponseCache, CachedGenerator
+from hybrid_retrieval import InvertedIndex, HybridDocumentWriter, HybridRetriever
+from answer_cache import SemanticAnswerCache, AnswerCacheLookup, AnswerCacheWriter
+from context_packing import ContextPacker
+from model_pool import PooledDocumentEmbedder, PooledTextEmbedder
+from http_cache import HTTPCache, CachedLinkFetcher, PageDocumentRecorder
+from parallel_pipeline import run_pipelines
 
 warnings.filterwarnings('ignore')
 load_dotenv()
@@ -22,24 +28,45 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("The OPENAI_API_KEY environment variable is not set.")
 
+# Embeddings are cached by (model, text) in memory and on disk
+embedding_cache = EmbeddingCache(path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"))
+
+# LLM responses are cached by (model, prompt, generation kwargs) on disk
+response_cache = ResponseCache(path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite"))
+
+# Prompt budgets: retrieved documents are deduplicated and cut down to their query-relevant
+# sentences; fetched articles each get their leading sentences, so any number of pages fits
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "3000"))
+
 # Initialize Document Store
-document_store = InMemoryDocumentStore()
+document_store = IVFDocumentStore()
+# BM25 index built while writing, for keyword lookups that need no query embedding
+text_index = InvertedIndex()
 
 # Indexing Pipeline
-fetcher = LinkContentFetcher()
-converter = HTMLToDocument()
-embedder = SentenceTransformersDocumentEmbedder(model="sentence-transformers/all-MiniLM-L6-v2")
-writer = DocumentWriter(document_store=document_store)
+# Conditional GETs against an on-disk HTTP cache: unchanged pages replay their recorded
+# documents instead of being converted and embedded again
+fetcher = CachedLinkFetcher(HTTPCache(path=os.getenv("HTTP_CACHE_PATH", "http_cache")))
+converter = ParallelConvertSplit(converter=HTMLToDocument())
+# The document and query embedders share one copy of the model (backend from EMBEDDING_BACKEND: torch, onnx or onnx-int8)
+embedder = CachedDocumentEmbedder(PooledDocumentEmbedder(model="sentence-transformers/all-MiniLM-L6-v2"), embedding_cache)
+writer = HybridDocumentWriter(document_store=document_store, text_index=text_index)
 
 indexing = Pipeline()
 indexing.add_component("fetcher", fetcher)
 indexing.add_component("converter", converter)
 indexing.add_component("embedder", embedder)
+indexing.add_component("recorder", PageDocumentRecorder(fetcher.cache))
+indexing.add_component("joiner", DocumentJoiner())
 indexing.add_component("writer", writer)
 
 indexing.connect("fetcher.streams", "converter.sources")
 indexing.connect("converter", "embedder")
-indexing.connect("embedder", "writer")
+indexing.connect("embedder", "recorder")
+indexing.connect("recorder", "joiner")
+indexing.connect("fetcher.documents", "joiner")
+indexing.connect("joiner", "writer")
 
 indexing.run(
     {
@@ -64,32 +91,61 @@ Context:
 Question: {{ query }}
 """
 
-query_embedder = SentenceTransformersTextEmbedder(model="sentence-transformers/all-MiniLM-L6-v2")
-retriever = InMemoryEmbeddingRetriever(document_store=document_store)
+query_embedder = CachedTextEmbedder(PooledTextEmbedder(model="sentence-transformers/all-MiniLM-L6-v2"), embedding_cache)
+# Hybrid retrieval: BM25 and embedding results are fused; the query embedding computed for
+# the answer cache is reused, and semantic search only runs when the keyword match is not conclusive
+retriever = HybridRetriever(
+    document_store=document_store,
+    text_index=text_index,
+    text_embedder=query_embedder,
+    embedding_retriever=IVFEmbeddingRetriever(document_store=document_store, nprobe=8),
+)
 prompt_builder = PromptBuilder(template=prompt)
-generator = OpenAIGenerator()
+generator = CachedGenerator(OpenAIGenerator(), response_cache)
+# Paraphrases of an answered question are answered from the semantic answer cache right
+# after the query is embedded, without retrieval or generation
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")), document_store=document_store
+)
 
 rag = Pipeline()
 rag.add_component("query_embedder", query_embedder)
+rag.add_component("answer_cache", AnswerCacheLookup(answer_cache))
 rag.add_component("retriever", retriever)
+rag.add_component("packer", ContextPacker(max_tokens=RAG_CONTEXT_TOKENS))
 rag.add_component("prompt", prompt_builder)
 rag.add_component("generator", generator)
-
-rag.connect("query_embedder.embedding", "retriever.query_embedding")
-rag.connect("retriever.documents", "prompt.documents")
+rag.add_component("answer_writer", AnswerCacheWriter(answer_cache))
+rag.add_component("answer", BranchJoiner(List[str]))
+
+rag.connect("query_embedder.embedding", "answer_cache.embedding")
+rag.connect("answer_cache.query", "retriever.query")
+rag.connect("answer_cache.query_embedding", "retriever.query_embedding")
+rag.connect("answer_cache.query", "prompt.query")
+rag.connect("answer_cache.query", "packer.query")
+rag.connect("retriever.documents", "packer.documents")
+rag.connect("packer.documents", "prompt.documents")
 rag.connect("prompt", "generator")
-
-question = "How can I use Cohere with Haystack?"
-
-result = rag.run(
-    {
-        "query_embedder": {"text": question},
-        "retriever": {"top_k": 1},
-        "prompt": {"query": question},
-    }
-)
-
-print(result["generator"]["replies"][0])
+rag.connect("answer_cache.query_embedding", "answer_writer.query_embedding")
+rag.connect("answer_cache.params", "answer_writer.params")
+rag.connect("retriever.documents", "answer_writer.documents")
+rag.connect("generator.replies", "answer_writer.replies")
+rag.connect("answer_cache.replies", "answer.value")
+rag.connect("answer_writer.replies", "answer.value")
+
+for question in ["How can I use Cohere with Haystack?", "How do I use Cohere in Haystack"]:
+    result = rag.run(
+        {
+            "query_embedder": {"text": question},
+            "answer_cache": {"query": question, "params": {"top_k": 1}},
+            "retriever": {"top_k": 1},
+        }
+    )
+    print(result["answer"]["value"][0])
+print(embedding_cache.stats())
+print(generator.stats())
+print(retriever.stats())
+print(answer_cache.stats())
 
 # Custom Component: Greeter
 @component
@@ -98,45 +154,6 @@ class Greeter:
     def run(self, user_name: str):
         return {"greeting": f"Hello {user_name}"}
 
-# Custom Component: HackernewsNewestFetcher
-@component
-class HackernewsNewestFetcher:
-    def __init__(self):
-        fetcher = LinkContentFetcher()
-        converter = HTMLToDocument()
-
-        html_conversion_pipeline = Pipeline()
-        html_conversion_pipeline.add_component("fetcher", fetcher)
-        html_conversion_pipeline.add_component("converter", converter)
-
-        html_conversion_pipeline.connect("fetcher", "converter")
-        self.html_pipeline = html_conversion_pipeline
-        
-    @component.output_types(articles=List[Document])
-    def run(self, top_k: int):
-        articles = []
-        trending_list = requests.get(
-            url="https://hacker-news.firebaseio.com/v0/topstories.json?print=pretty"
-        )
-        for id in trending_list.json()[0:top_k]:
-            post = requests.get(
-                url=f"https://hacker-news.firebaseio.com/v0/item/{id}.json?print=pretty"
-            )
-            if "url" in post.json():
-                try:
-                    article = self.html_pipeline.run(
-                        {"fetcher": {"urls": [post.json()["url"]]}}
-                    )
-                    articles.append(article["converter"]["documents"][0])
-                except:
-                    print(f"Can't download {post}, skipped")
-            elif "text" in post.json():
-                try:
-                    articles.append(Document(content=post.json()["text"], meta= {"title": post.json()["title"]}))
-                except:
-                    print(f"Can't download {post}, skipped")
-        return {"articles": articles}
-
 # Summarizer Pipeline
 prompt_template = """  
 You will be provided a few of the top posts in HackerNews.  
@@ -151,23 +168,21 @@ Posts:
 
 prompt_builder = PromptBuilder(template=prompt_template)
 fetcher = HackernewsNewestFetcher()
-llm = OpenAIGenerator()
+llm = CachedGenerator(OpenAIGenerator(), response_cache)
 
 summarizer_pipeline = Pipeline()
 summarizer_pipeline.add_component("fetcher", fetcher)
+summarizer_pipeline.add_component("packer", ContextPacker(max_tokens=SUMMARY_CONTEXT_TOKENS))
 summarizer_pipeline.add_component("prompt", prompt_builder)
 summarizer_pipeline.add_component("llm", llm)
 
-summarizer_pipeline.connect("fetcher.articles", "prompt.articles")
+summarizer_pipeline.connect("fetcher.articles", "packer.documents")
+summarizer_pipeline.connect("packer.documents", "prompt.articles")
 summarizer_pipeline.connect("prompt", "llm")
 
 # Save the pipeline diagram as an image
 summarizer_pipeline.draw("summarizer_pipeline.png")
 
-summaries = summarizer_pipeline.run({"fetcher": {"top_k": 3}})
-
-print(summaries["llm"]["replies"][0])
-
 # Summarizer Pipeline with URLs
 prompt_template = """  
 You will be provided a few of the top posts in HackerNews, followed by their URL.  
@@ -182,16 +197,23 @@ Posts:
 
 prompt_builder = PromptBuilder(template=prompt_template)
 fetcher = HackernewsNewestFetcher()
-llm = OpenAIGenerator()
+llm = CachedGenerator(OpenAIGenerator(), response_cache)
 
-summarizer_pipeline = Pipeline()
-summarizer_pipeline.add_component("fetcher", fetcher)
-summarizer_pipeline.add_component("prompt", prompt_builder)
-summarizer_pipeline.add_component("llm", llm)
+url_summarizer_pipeline = Pipeline()
+url_summarizer_pipeline.add_component("fetcher", fetcher)
+url_summarizer_pipeline.add_component("packer", ContextPacker(max_tokens=SUMMARY_CONTEXT_TOKENS))
+url_summarizer_pipeline.add_component("prompt", prompt_builder)
+url_summarizer_pipeline.add_component("llm", llm)
 
-summarizer_pipeline.connect("fetcher.articles", "prompt.articles")
-summarizer_pipeline.connect("prompt", "llm")
+url_summarizer_pipeline.connect("fetcher.articles", "packer.documents")
+url_summarizer_pipeline.connect("packer.documents", "prompt.articles")
+url_summarizer_pipeline.connect("prompt", "llm")
 
-summaries = summarizer_pipeline.run({"fetcher": {"top_k": 2}})
+# The two summarizers are independent and run at the same time, so this takes as long as the slower one
+summaries, url_summaries = run_pipelines(
+    [(summarizer_pipeline, {"fetcher": {"top_k": 3}}), (url_summarizer_pipeline, {"fetcher": {"top_k": 2}})]
+)
 
-print(summaries["llm"]["replies"][0])
\ No newline at end of file
+print(summaries["llm"]["replies"][0])
+print(summaries["packer"]["stats"])
+print(url_summaries["llm"]["replies"][0])
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import warnings
+from typing import List
 from helper import load_env
 
 warnings.filterwarnings('ignore')
@@ -9,29 +10,53 @@ from haystack import Pipeline
 from haystack.utils.auth import Secret
 from haystack.components.builders import PromptBuilder
 from haystack.components.converters import HTMLToDocument
-from haystack.components.fetchers import LinkContentFetcher
 from haystack.components.generators import OpenAIGenerator
-from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
-from haystack.components.writers import DocumentWriter
-from haystack.document_stores.in_memory import InMemoryDocumentStore
-from haystack.components.embedders import SentenceTransformersDocumentEmbedder, SentenceTransformersTextEmbedder, CohereTextEmbedder
-
-document_store = InMemoryDocumentStore()
-
-fetcher = LinkContentFetcher()
-converter = HTMLToDocument()
-embedder = SentenceTransformersDocumentEmbedder(model_name_or_path="sentence-transformers/all-MiniLM-L6-v2")
-writer = DocumentWriter(document_store=document_store)
+from haystack.components.joiners import BranchJoiner, DocumentJoiner
+from haystack.components.embedders import CohereTextEmbedder
+from parallel_preprocess import ParallelConvertSplit
+from ann_index import IVFDocumentStore, IVFEmbeddingRetriever
+from batch_search import BatchQueryEmbedder, BatchEmbeddingRetriever
+from embedding_cache import EmbeddingCache, CachedDocumentEmbedder, CachedTextEmbedder
+from generator_cache import ResponseCache, CachedGenerator
+from hybrid_retrieval import InvertedIndex, HybridDocumentWriter, HybridRetriever
+from answer_cache import SemanticAnswerCache, AnswerCacheLookup, AnswerCacheWriter
+from context_packing import ContextPacker
+from model_pool import PooledDocumentEmbedder, PooledTextEmbedder
+from http_cache import HTTPCache, CachedLinkFetcher, PageDocumentRecorder
+from parallel_pipeline import run_pipelines
+
+embedding_cache = EmbeddingCache(path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"))
+# Identical prompts are answered from disk instead of calling OpenAI again
+response_cache = ResponseCache(path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite"))
+# Retrieved documents are deduplicated and cut down to their query-relevant sentences within this many prompt tokens
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+
+document_store = IVFDocumentStore()
+# BM25 index built while writing, for keyword lookups that need no query embedding
+text_index = InvertedIndex()
+
+# Conditional GETs against an on-disk HTTP cache: unchanged pages replay their recorded
+# documents instead of being converted and embedded again
+fetcher = CachedLinkFetcher(HTTPCache(path=os.getenv("HTTP_CACHE_PATH", "http_cache")))
+converter = ParallelConvertSplit(converter=HTMLToDocument())
+# The embedders below share one copy of the model (backend from EMBEDDING_BACKEND: torch, onnx or onnx-int8)
+embedder = CachedDocumentEmbedder(PooledDocumentEmbedder(model="sentence-transformers/all-MiniLM-L6-v2"), embedding_cache)
+writer = HybridDocumentWriter(document_store=document_store, text_index=text_index)
 
 indexing = Pipeline()
 indexing.add_component("fetcher", fetcher)
 indexing.add_component("converter", converter)
 indexing.add_component("embedder", embedder)
+indexing.add_component("recorder", PageDocumentRecorder(fetcher.cache))
+indexing.add_component("joiner", DocumentJoiner())
 indexing.add_component("writer", writer)
 
 indexing.connect("fetcher.streams", "converter.sources")
 indexing.connect("converter", "embedder")
-indexing.connect("embedder", "writer")
+indexing.connect("embedder", "recorder")
+indexing.connect("recorder", "joiner")
+indexing.connect("fetcher.documents", "joiner")
+indexing.connect("joiner", "writer")
 
 indexing.run(
     {
@@ -55,32 +80,80 @@ Context:
 Question: {{ query }}
 """
 
-query_embedder = SentenceTransformersTextEmbedder(model_name_or_path="sentence-transformers/all-MiniLM-L6-v2")
-retriever = InMemoryEmbeddingRetriever(document_store=document_store)
+query_embedder = CachedTextEmbedder(PooledTextEmbedder(model="sentence-transformers/all-MiniLM-L6-v2"), embedding_cache)
+# Hybrid retrieval: BM25 and embedding results are fused; the query embedding computed for
+# the answer cache is reused, and semantic search only runs when the keyword match is not conclusive
+retriever = HybridRetriever(
+    document_store=document_store,
+    text_index=text_index,
+    text_embedder=query_embedder,
+    embedding_retriever=IVFEmbeddingRetriever(document_store=document_store, nprobe=8),
+)
 prompt_builder = PromptBuilder(template=prompt)
-generator = OpenAIGenerator()
+generator = CachedGenerator(OpenAIGenerator(), response_cache)
+# Paraphrases of an answered question ("How do I use Cohere in Haystack") are answered from
+# the semantic answer cache right after the query is embedded, without retrieval or generation
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")), document_store=document_store
+)
 
 rag = Pipeline()
 rag.add_component("query_embedder", query_embedder)
+rag.add_component("answer_cache", AnswerCacheLookup(answer_cache))
 rag.add_component("retriever", retriever)
+rag.add_component("packer", ContextPacker(max_tokens=RAG_CONTEXT_TOKENS))
 rag.add_component("prompt", prompt_builder)
 rag.add_component("generator", generator)
-
-rag.connect("query_embedder.embedding", "retriever.query_embedding")
-rag.connect("retriever.documents", "prompt.documents")
+rag.add_component("answer_writer", AnswerCacheWriter(answer_cache))
+rag.add_component("answer", BranchJoiner(List[str]))
+
+rag.connect("query_embedder.embedding", "answer_cache.embedding")
+rag.connect("answer_cache.query", "retriever.query")
+rag.connect("answer_cache.query_embedding", "retriever.query_embedding")
+rag.connect("answer_cache.query", "prompt.query")
+rag.connect("answer_cache.query", "packer.query")
+rag.connect("retriever.documents", "packer.documents")
+rag.connect("packer.documents", "prompt.documents")
 rag.connect("prompt", "generator")
-
-question = "How can I use Cohere with Haystack?"
-
-result = rag.run(
-    {
-        "query_embedder": {"text": question},
-        "retriever": {"top_k": 1},
-        "prompt": {"query": question},
-    }
-)
-
-print(result["generator"]["replies"][0])
+rag.connect("answer_cache.query_embedding", "answer_writer.query_embedding")
+rag.connect("answer_cache.params", "answer_writer.params")
+rag.connect("retriever.documents", "answer_writer.documents")
+rag.connect("generator.replies", "answer_writer.replies")
+rag.connect("answer_cache.replies", "answer.value")
+rag.connect("answer_writer.replies", "answer.value")
+
+for question in ["How can I use Cohere with Haystack?", "How do I use Cohere in Haystack"]:
+    result = rag.run(
+        {
+            "query_embedder": {"text": question},
+            "answer_cache": {"query": question, "params": {"top_k": 1}},
+            "retriever": {"top_k": 1},
+        }
+    )
+    print(result["answer"]["value"][0])
+print(retriever.stats())
+print(answer_cache.stats())
+
+# Batch RAG: retrieval for all questions runs at once, generation then runs per question
+batch_retrieval = Pipeline()
+batch_retrieval.add_component("query_embedder", BatchQueryEmbedder(CachedDocumentEmbedder(PooledDocumentEmbedder(model="sentence-transformers/all-MiniLM-L6-v2"), embedding_cache)))
+batch_retrieval.add_component("retriever", BatchEmbeddingRetriever(document_store=document_store))
+batch_retrieval.connect("query_embedder.embeddings", "retriever.query_embeddings")
+
+batch_generation = Pipeline()
+batch_generation.add_component("packer", ContextPacker(max_tokens=RAG_CONTEXT_TOKENS))
+batch_generation.add_component("prompt", PromptBuilder(template=prompt))
+batch_generation.add_component("generator", CachedGenerator(OpenAIGenerator(), response_cache))
+batch_generation.connect("packer.documents", "prompt.documents")
+batch_generation.connect("prompt", "generator")
+
+questions = ["How can I use Cohere with Haystack?", "How can I use Jina with Haystack?", "Which NVIDIA models can I use with Haystack?"]
+batch_results = batch_retrieval.run({"query_embedder": {"queries": questions}, "retriever": {"top_k": 1}})
+for batch_question, documents in zip(questions, batch_results["retriever"]["documents"]):
+    answer = batch_generation.run(
+        {"packer": {"query": batch_question, "documents": documents}, "prompt": {"query": batch_question}}
+    )
+    print(batch_question, answer["generator"]["replies"][0])
 
 prompt = """
 You will be provided some context, followed by the URL that this context comes from.
@@ -95,27 +168,65 @@ Question: {{ query }}
 Answer:
 """
 
-query_embedder = CohereTextEmbedder(model="embed-english-v3.0", api_base_url=os.getenv("CO_API_URL"))
-retriever = InMemoryEmbeddingRetriever(document_store=document_store)
+query_embedder = CachedTextEmbedder(CohereTextEmbedder(model="embed-english-v3.0", api_base_url=os.getenv("CO_API_URL")), embedding_cache)
+retriever = IVFEmbeddingRetriever(document_store=document_store, nprobe=8)
 prompt_builder = PromptBuilder(template=prompt)
-generator = OpenAIGenerator(model="gpt-3.5-turbo")
-
-rag = Pipeline()
-rag.add_component("query_embedder", query_embedder)
-rag.add_component("retriever", retriever)
-rag.add_component("prompt", prompt_builder)
-rag.add_component("generator", generator)
-
-rag.connect("query_embedder.embedding", "retriever.query_embedding")
-rag.connect("retriever.documents", "prompt.documents")
-rag.connect("prompt", "generator")
+generator = CachedGenerator(OpenAIGenerator(model="gpt-3.5-turbo"), response_cache)
+# Answers depend on the prompt, so this pipeline has its own answer cache
+cohere_answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")), document_store=document_store
+)
 
-result = rag.run(
-    {
-        "query_embedder": {"text": question},
-        "retriever": {"top_k": 1},
-        "prompt": {"query": question, "language": "French"},
-    }
+cohere_rag = Pipeline()
+cohere_rag.add_component("query_embedder", query_embedder)
+cohere_rag.add_component("answer_cache", AnswerCacheLookup(cohere_answer_cache))
+cohere_rag.add_component("retriever", retriever)
+cohere_rag.add_component("packer", ContextPacker(max_tokens=RAG_CONTEXT_TOKENS))
+cohere_rag.add_component("prompt", prompt_builder)
+cohere_rag.add_component("generator", generator)
+cohere_rag.add_component("answer_writer", AnswerCacheWriter(cohere_answer_cache))
+cohere_rag.add_component("answer", BranchJoiner(List[str]))
+
+cohere_rag.connect("query_embedder.embedding", "answer_cache.embedding")
+cohere_rag.connect("answer_cache.query_embedding", "retriever.query_embedding")
+cohere_rag.connect("answer_cache.query", "prompt.query")
+cohere_rag.connect("answer_cache.query", "packer.query")
+cohere_rag.connect("retriever.documents", "packer.documents")
+cohere_rag.connect("packer.documents", "prompt.documents")
+cohere_rag.connect("prompt", "generator")
+cohere_rag.connect("answer_cache.query_embedding", "answer_writer.query_embedding")
+cohere_rag.connect("answer_cache.params", "answer_writer.params")
+cohere_rag.connect("retriever.documents", "answer_writer.documents")
+cohere_rag.connect("generator.replies", "answer_writer.replies")
+cohere_rag.connect("answer_cache.replies", "answer.value")
+cohere_rag.connect("answer_writer.replies", "answer.value")
+
+# Both variants answer the question at the same time, so this takes as long as the slower one
+question = "How can I use Cohere with Haystack?"
+result, cohere_result = run_pipelines(
+    [
+        (
+            rag,
+            {
+                "query_embedder": {"text": question},
+                "answer_cache": {"query": question, "params": {"top_k": 1}},
+                "retriever": {"top_k": 1},
+            },
+        ),
+        (
+            cohere_rag,
+            {
+                "query_embedder": {"text": question},
+                "answer_cache": {"query": question, "params": {"top_k": 1, "language": "French"}},
+                "retriever": {"top_k": 1},
+                "prompt": {"language": "French"},
+            },
+        ),
+    ]
 )
 
-print(result["generator"]["replies"][0])
+print(result["answer"]["value"][0])
+print(cohere_result["answer"]["value"][0])
+
+print(embedding_cache.stats())
+print(generator.stats())
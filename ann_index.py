@@ -0,0 +1,279 @@
+import math
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component, default_from_dict, default_to_dict
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+from haystack.document_stores.types import DuplicatePolicy
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(vectors, centroids)
+        for cluster in range(k):
+            members = vectors[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+            else:
+                centroids[cluster] = vectors[rng.integers(len(vectors))]
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, n: int = 1) -> np.ndarray:
+    # argmin ||v - c||^2 == argmax 2 v.c - ||c||^2
+    scores = 2 * vectors @ centroids.T - (centroids ** 2).sum(axis=1)
+    if n == 1:
+        return scores.argmax(axis=1)
+    n = min(n, centroids.shape[0])
+    return np.argpartition(-scores, n - 1, axis=1)[:, :n]
+
+
+# Inverted file index over the rows of an embedding matrix owned by the caller.
+# Rows are bucketed by nearest k-means centroid; a query scans only the `nprobe`
+# closest buckets. Rows added before training are scanned exhaustively until the
+# index trains itself, and it retrains once the corpus has grown `retrain_factor` times.
+class IVFIndex:
+    def __init__(self, nlist: Optional[int] = None, min_train_size: int = 1024, retrain_factor: float = 4.0):
+        self.nlist = nlist
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._lists: List[List[int]] = []
+        self._arrays: List[Optional[np.ndarray]] = []
+        self._untrained: List[int] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, matrix: np.ndarray, rows: List[int]):
+        if not rows:
+            return
+        self._size += len(rows)
+        if self.centroids is None:
+            self._untrained.extend(rows)
+            if len(self._untrained) >= self.min_train_size:
+                self.train(matrix, self._untrained)
+            return
+        if self._size > self.trained_size * self.retrain_factor:
+            self.train(matrix, self.rows() + list(rows))
+            return
+        for row, cluster in zip(rows, nearest_centroids(matrix[rows], self.centroids)):
+            self._lists[cluster].append(row)
+            self._arrays[cluster] = None
+
+    def rows(self) -> List[int]:
+        return self._untrained + [row for rows in self._lists for row in rows]
+
+    def train(self, matrix: np.ndarray, rows: List[int]):
+        rows = np.asarray(rows)
+        nlist = self.nlist or max(1, int(4 * math.sqrt(len(rows))))
+        nlist = min(nlist, len(rows))
+        sample = rows
+        if len(rows) > 256 * nlist:
+            sample = np.random.default_rng(0).choice(rows, size=256 * nlist, replace=False)
+        self.centroids = kmeans(np.asarray(matrix[np.sort(sample)], dtype=np.float32), nlist)
+        self._lists = [[] for _ in range(nlist)]
+        for row, cluster in zip(rows.tolist(), nearest_centroids(matrix[rows], self.centroids)):
+            self._lists[cluster].append(row)
+        self._arrays = [None] * nlist
+        self._untrained = []
+        self._size = len(rows)
+        self.trained_size = len(rows)
+
+    def _list_array(self, cluster: int) -> np.ndarray:
+        if self._arrays[cluster] is None:
+            self._arrays[cluster] = np.asarray(self._lists[cluster], dtype=np.int64)
+        return self._arrays[cluster]
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        parts = [np.asarray(self._untrained, dtype=np.int64)]
+        if self.centroids is not None:
+            for cluster in np.ravel(nearest_centroids(query[None, :], self.centroids, n=nprobe)):
+                parts.append(self._list_array(cluster))
+        return np.concatenate(parts)
+
+    def search(
+        self, matrix: np.ndarray, query: np.ndarray, top_k: int, nprobe: int, alive: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self.candidates(query, nprobe)
+        if alive is not None:
+            rows = rows[alive[rows]]
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+        rows = np.sort(rows)
+        scores = matrix[rows] @ query
+        if len(rows) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
+
+
+# InMemoryDocumentStore that also keeps its embeddings in one contiguous float32 matrix
+# indexed by an IVFIndex. Every write (e.g. from DocumentWriter) is inserted incrementally.
+class IVFDocumentStore(InMemoryDocumentStore):
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, min_train_size: int = 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.ivf = IVFIndex(nlist=nlist, min_train_size=min_train_size)
+        self._matrix: Optional[np.ndarray] = None
+        self._rows = 0
+        self._row_ids: List[Optional[str]] = []
+        self._id_rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+
+    def _vector(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.embedding_similarity_function == "cosine":
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm > 0 else vector
+        return vector
+
+    def _append(self, documents: List[Document]):
+        if not documents:
+            return
+        vectors = np.stack([self._vector(doc.embedding) for doc in documents])
+        needed = self._rows + len(vectors)
+        if self._matrix is None:
+            self._matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        if self._matrix.shape[0] < needed:
+            capacity = max(needed, 2 * self._matrix.shape[0], 1024)
+            grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+            grown[: self._rows] = self._matrix[: self._rows]
+            self._matrix = grown
+            alive = np.zeros(capacity, dtype=bool)
+            alive[: self._rows] = self._alive[: self._rows]
+            self._alive = alive
+        rows = list(range(self._rows, needed))
+        self._matrix[self._rows : needed] = vectors
+        self._alive[self._rows : needed] = True
+        for row, doc in zip(rows, documents):
+            self._row_ids.append(doc.id)
+            self._id_rows[doc.id] = row
+        self._rows = needed
+        self.ivf.add(self._matrix, rows)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = super().to_dict()
+        data["init_parameters"].update(nlist=self.nlist, nprobe=self.nprobe, min_train_size=self.min_train_size)
+        return data
+
+    def write_documents(self, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.NONE) -> int:
+        written = super().write_documents(documents, policy)
+        stored = [doc for doc in documents if self.storage.get(doc.id) is doc]
+        # An overwritten document's old row is retired before its new embedding is appended
+        self._remove_rows([doc.id for doc in stored])
+        self._append([doc for doc in stored if doc.embedding is not None])
+        return written
+
+    def _remove_rows(self, document_ids: List[str]):
+        for doc_id in document_ids:
+            row = self._id_rows.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._row_ids[row] = None
+
+    def delete_documents(self, document_ids: List[str]) -> None:
+        super().delete_documents(document_ids)
+        self._remove_rows(document_ids)
+
+    # Rows are unit-normalized when the similarity function is cosine; deleted rows have id None
+    def embedding_matrix(self) -> Tuple[np.ndarray, List[Optional[str]]]:
+        if self._matrix is None:
+            return np.zeros((0, 0), dtype=np.float32), []
+        return self._matrix[: self._rows], list(self._row_ids)
+
+    def ann_retrieval(
+        self,
+        query_embedding: List[float],
+        top_k: int = 10,
+        nprobe: Optional[int] = None,
+        scale_score: bool = False,
+        return_embedding: bool = False,
+    ) -> List[Document]:
+        if self._rows == 0 or top_k == 0:
+            return []
+        rows, scores = self.ivf.search(
+            self._matrix, self._vector(query_embedding), top_k, nprobe or self.nprobe, self._alive
+        )
+        documents = []
+        for row, score in zip(rows, scores):
+            doc = self.storage[self._row_ids[row]]
+            score = float(score)
+            if scale_score:
+                if self.embedding_similarity_function == "cosine":
+                    score = (score + 1) / 2
+                else:
+                    score = float(1 / (1 + np.exp(-score / 100)))
+            documents.append(replace(doc, score=score, embedding=doc.embedding if return_embedding else None))
+        return documents
+
+
+# Drop-in for InMemoryEmbeddingRetriever with the same inputs/outputs plus `nprobe`,
+# the number of IVF buckets scanned per query (higher = better recall, slower).
+# Queries with filters fall back to the store's exact scan.
+@component
+class IVFEmbeddingRetriever:
+    def __init__(
+        self,
+        document_store: IVFDocumentStore,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        nprobe: Optional[int] = None,
+    ):
+        if not isinstance(document_store, IVFDocumentStore):
+            raise TypeError("document_store must be an instance of IVFDocumentStore")
+        if top_k <= 0:
+            raise ValueError(f"top_k must be greater than 0, but got {top_k}")
+        self.document_store = document_store
+        self.filters = filters
+        self.top_k = top_k
+        self.nprobe = nprobe
+
+    def to_dict(self) -> Dict[str, Any]:
+        return default_to_dict(
+            self, document_store=self.document_store.to_dict(), filters=self.filters, top_k=self.top_k, nprobe=self.nprobe
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IVFEmbeddingRetriever":
+        init_params = data["init_parameters"]
+        init_params["document_store"] = IVFDocumentStore.from_dict(init_params["document_store"])
+        return default_from_dict(cls, data)
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        scale_score: bool = False,
+        return_embedding: bool = False,
+    ):
+        filters = filters or self.filters
+        top_k = self.top_k if top_k is None else top_k
+        if filters:
+            documents = self.document_store.embedding_retrieval(
+                query_embedding=query_embedding,
+                filters=filters,
+                top_k=top_k,
+                scale_score=scale_score,
+                return_embedding=return_embedding,
+            )
+        else:
+            documents = self.document_store.ann_retrieval(
+                query_embedding=query_embedding,
+                top_k=top_k,
+                nprobe=nprobe or self.nprobe,
+                scale_score=scale_score,
+                return_embedding=return_embedding,
+            )
+        return {"documents": documents}
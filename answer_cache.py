@@ -0,0 +1,221 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from haystack import Document, component
+
+from batch_search import documents_by_id
+
+
+def content_hash(doc: Document) -> str:
+    return hashlib.sha256((doc.content or "").encode("utf-8")).hexdigest()
+
+
+# Answers of past questions indexed by their normalized query embedding. A lookup returns the
+# most similar past question's answer when its cosine similarity is at least `threshold`, so
+# paraphrases of an answered question skip retrieval and generation. Every entry remembers the
+# documents its answer was built from: `invalidate` drops the entries that used given
+# documents, and with a `document_store` each hit is first checked against the store, so an
+# answer is never served once one of its documents was deleted or its content changed.
+# Entries expire after `ttl` seconds; beyond `max_entries` the least recently used go first.
+# Answers also depend on the other inputs of the run (top_k, prompt variables such as the
+# language): these are passed as `params`, and a lookup only matches entries stored with equal
+# params. Use one cache per pipeline, as the prompt template itself is not part of the key.
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries: int = 10000,
+        ttl: Optional[float] = 24 * 3600,
+        document_store: Any = None,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.document_store = document_store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.clear()
+
+    def clear(self):
+        self._matrix: Optional[np.ndarray] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._last_used = np.zeros(0)
+        # Each distinct params value gets a number; rows store theirs to be filtered on in one step
+        self._param_codes: Dict[str, int] = {}
+        self._row_params = np.zeros(0, dtype=np.int32)
+        self._by_document: Dict[str, Set[int]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @staticmethod
+    def _params_key(params: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(params or {}, sort_keys=True, default=str)
+
+    def _remove(self, row: int):
+        entry = self._entries[row]
+        for doc_id in entry["documents"]:
+            entries = self._by_document.get(doc_id)
+            if entries is not None:
+                entries.discard(entry["id"])
+                if not entries:
+                    del self._by_document[doc_id]
+        # The last row takes the place of the removed one
+        last = len(self._entries) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._entries[row] = self._entries[last]
+            self._last_used[row] = self._last_used[last]
+            self._row_params[row] = self._row_params[last]
+        self._entries.pop()
+
+    def _is_current(self, entry: Dict[str, Any]) -> bool:
+        if self.ttl is not None and time.time() - entry["created"] > self.ttl:
+            return False
+        if self.document_store is None:
+            return True
+        stored = documents_by_id(self.document_store, list(entry["documents"]))
+        return len(stored) == len(entry["documents"]) and all(
+            entry["documents"].get(doc.id) == content_hash(doc) for doc in stored
+        )
+
+    # The best matching entry's answer among those stored with the same params, or None
+    def lookup(self, embedding: List[float], params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        query = self._normalize(embedding)
+        with self._lock:
+            code = self._param_codes.get(self._params_key(params))
+            while self._entries and code is not None:
+                count = len(self._entries)
+                if self._matrix.shape[1] != len(query):
+                    break
+                scores = np.where(self._row_params[:count] == code, self._matrix[:count] @ query, -np.inf)
+                row = int(np.argmax(scores))
+                if scores[row] < self.threshold:
+                    break
+                entry = self._entries[row]
+                if not self._is_current(entry):
+                    self._remove(row)
+                    self.invalidated += 1
+                    continue
+                self._last_used[row] = time.monotonic()
+                self.hits += 1
+                return {"replies": list(entry["replies"]), "documents": list(entry["sources"]), "similarity": float(scores[row])}
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        embedding: List[float],
+        replies: List[str],
+        documents: List[Document],
+        query: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+    ):
+        vector = self._normalize(embedding)
+        params_key = self._params_key(params)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != len(vector):
+                self.clear()
+                self._matrix = np.zeros((64, len(vector)), dtype=np.float32)
+                self._last_used = np.zeros(64)
+                self._row_params = np.zeros(64, dtype=np.int32)
+            if len(self._entries) >= self.max_entries:
+                self._remove(int(np.argmin(self._last_used[: len(self._entries)])))
+            row = len(self._entries)
+            if row == len(self._matrix):
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+                self._last_used = np.concatenate([self._last_used, np.zeros_like(self._last_used)])
+                self._row_params = np.concatenate([self._row_params, np.zeros_like(self._row_params)])
+            entry = {
+                "id": self._next_id,
+                "query": query,
+                "params": params_key,
+                "replies": list(replies),
+                "sources": [replace(doc, embedding=None) for doc in documents],
+                "documents": {doc.id: content_hash(doc) for doc in documents},
+                "created": time.time(),
+            }
+            self._next_id += 1
+            self._matrix[row] = vector
+            self._last_used[row] = time.monotonic()
+            self._row_params[row] = self._param_codes.setdefault(params_key, len(self._param_codes))
+            self._entries.append(entry)
+            for doc_id in entry["documents"]:
+                self._by_document.setdefault(doc_id, set()).add(entry["id"])
+
+    # Drops every answer that was built from one of `document_ids`; returns how many were dropped
+    def invalidate(self, document_ids: List[str]) -> int:
+        with self._lock:
+            stale = set()
+            for doc_id in document_ids:
+                stale |= self._by_document.get(doc_id, set())
+            rows = [row for row, entry in enumerate(self._entries) if entry["id"] in stale]
+            for row in reversed(rows):
+                self._remove(row)
+            self.invalidated += len(rows)
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidated": self.invalidated,
+        }
+
+
+# Goes right after the query embedder. On a hit it outputs the cached `replies` and `documents`,
+# and nothing else, so the retriever, prompt builder and generator connected to `query` and
+# `query_embedding` do not run; on a miss it passes the query, its embedding and `params` (the
+# run's other answer-shaping inputs, e.g. {"top_k": 1}) on to the AnswerCacheWriter.
+@component
+class AnswerCacheLookup:
+    def __init__(self, cache: SemanticAnswerCache):
+        self.cache = cache
+
+    @component.output_types(
+        replies=List[str],
+        documents=List[Document],
+        query=str,
+        query_embedding=List[float],
+        params=Dict[str, Any],
+        cache_hit=bool,
+    )
+    def run(self, query: str, embedding: List[float], params: Optional[Dict[str, Any]] = None):
+        cached = self.cache.lookup(embedding, params)
+        if cached is not None:
+            return {"replies": cached["replies"], "documents": cached["documents"], "cache_hit": True}
+        return {"query": query, "query_embedding": embedding, "params": params or {}, "cache_hit": False}
+
+
+# Goes after the generator: stores the new answer with the documents it was generated from
+@component
+class AnswerCacheWriter:
+    def __init__(self, cache: SemanticAnswerCache):
+        self.cache = cache
+
+    @component.output_types(replies=List[str])
+    def run(
+        self,
+        query_embedding: List[float],
+        replies: List[str],
+        documents: List[Document],
+        params: Optional[Dict[str, Any]] = None,
+    ):
+        self.cache.put(query_embedding, replies, documents, params=params)
+        return {"replies": replies}
@@ -0,0 +1,102 @@
+from dataclasses import replace
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component
+
+
+# Embedding matrix of any supported store plus the document id of every row (None = deleted row).
+# IVFDocumentStore and MemmapDocumentStore already keep a contiguous matrix; for a plain
+# InMemoryDocumentStore one is stacked from the stored documents.
+def document_matrix(document_store: Any) -> Tuple[np.ndarray, List[Optional[str]]]:
+    if hasattr(document_store, "embedding_matrix"):
+        return document_store.embedding_matrix()
+    documents = [doc for doc in document_store.storage.values() if doc.embedding is not None]
+    if not documents:
+        return np.zeros((0, 0), dtype=np.float32), []
+    return np.array([doc.embedding for doc in documents], dtype=np.float32), [doc.id for doc in documents]
+
+
+def documents_by_id(document_store: Any, document_ids: List[str]) -> List[Document]:
+    if hasattr(document_store, "get_documents"):
+        return document_store.get_documents(document_ids)
+    return [replace(document_store.storage[doc_id], embedding=None) for doc_id in document_ids if doc_id in document_store.storage]
+
+
+# Scores all queries against all documents with one (queries x documents) matrix multiply per
+# chunk of queries and picks each query's top_k with argpartition instead of a full sort.
+def batch_embedding_retrieval(
+    document_store: Any,
+    query_embeddings: List[List[float]],
+    top_k: int = 10,
+    scale_score: bool = False,
+    query_chunk_size: int = 256,
+) -> List[List[Document]]:
+    matrix, row_ids = document_matrix(document_store)
+    if len(row_ids) == 0 or top_k == 0 or not query_embeddings:
+        return [[] for _ in query_embeddings]
+
+    cosine = getattr(document_store, "embedding_similarity_function", "dot_product") == "cosine"
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    if cosine:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+    dead = np.array([doc_id is None for doc_id in row_ids], dtype=bool)
+    k = min(top_k, int((~dead).sum()))
+
+    results = []
+    for start in range(0, len(queries), query_chunk_size):
+        scores = queries[start : start + query_chunk_size] @ matrix.T
+        scores[:, dead] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        wanted = list({row_ids[row] for row in top.ravel()})
+        documents = {doc.id: doc for doc in documents_by_id(document_store, wanted)}
+        for rows, row_scores in zip(top, top_scores):
+            hits = []
+            for row, score in zip(rows, row_scores):
+                score = float(score)
+                if scale_score:
+                    score = (score + 1) / 2 if cosine else float(1 / (1 + np.exp(-score / 100)))
+                hits.append(replace(documents[row_ids[row]], score=score))
+            results.append(hits)
+    return results
+
+
+# Embeds many questions in one call of a document embedder (OpenAIDocumentEmbedder,
+# SentenceTransformersDocumentEmbedder, CachedDocumentEmbedder, ...), which batches requests internally
+@component
+class BatchQueryEmbedder:
+    def __init__(self, document_embedder: Any):
+        self.document_embedder = document_embedder
+
+    def warm_up(self):
+        if hasattr(self.document_embedder, "warm_up"):
+            self.document_embedder.warm_up()
+
+    @component.output_types(embeddings=List[List[float]])
+    def run(self, queries: List[str]):
+        result = self.document_embedder.run(documents=[Document(content=query) for query in queries])
+        return {"embeddings": [doc.embedding for doc in result["documents"]]}
+
+
+@component
+class BatchEmbeddingRetriever:
+    def __init__(self, document_store: Any, top_k: int = 10):
+        if top_k <= 0:
+            raise ValueError(f"top_k must be greater than 0, but got {top_k}")
+        self.document_store = document_store
+        self.top_k = top_k
+
+    @component.output_types(documents=List[List[Document]])
+    def run(self, query_embeddings: List[List[float]], top_k: Optional[int] = None, scale_score: bool = False):
+        documents = batch_embedding_retrieval(
+            self.document_store, query_embeddings, top_k=self.top_k if top_k is None else top_k, scale_score=scale_score
+        )
+        return {"documents": documents}
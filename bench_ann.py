@@ -0,0 +1,64 @@
+import time
+import warnings
+
+import numpy as np
+from haystack import Document
+from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+
+from ann_index import IVFDocumentStore, IVFEmbeddingRetriever
+
+warnings.filterwarnings('ignore')
+
+# Recall@k and per-query latency of IVFEmbeddingRetriever against the exact InMemoryEmbeddingRetriever
+NUM_DOCUMENTS = 50000
+NUM_QUERIES = 200
+DIMENSIONS = 384
+TOP_K = 10
+NPROBES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def clustered_vectors(rng, n, clusters=200):
+    centers = rng.normal(size=(clusters, DIMENSIONS))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, DIMENSIONS))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def percentile_ms(latencies, p):
+    return 1000 * float(np.percentile(latencies, p))
+
+
+rng = np.random.default_rng(42)
+vectors = clustered_vectors(rng, NUM_DOCUMENTS + NUM_QUERIES)
+documents = [Document(content=f"document {i}", embedding=vector.tolist()) for i, vector in enumerate(vectors[:NUM_DOCUMENTS])]
+queries = [vector.tolist() for vector in vectors[NUM_DOCUMENTS:]]
+
+exact_store = InMemoryDocumentStore()
+exact_store.write_documents(documents)
+exact_retriever = InMemoryEmbeddingRetriever(document_store=exact_store, top_k=TOP_K)
+
+start = time.perf_counter()
+ivf_store = IVFDocumentStore()
+ivf_store.write_documents(documents)
+print(f"IVF build: {time.perf_counter() - start:.2f}s for {NUM_DOCUMENTS} documents, nlist={len(ivf_store.ivf.centroids)}")
+ivf_retriever = IVFEmbeddingRetriever(document_store=ivf_store, top_k=TOP_K)
+
+truth = []
+latencies = []
+for query in queries:
+    start = time.perf_counter()
+    result = exact_retriever.run(query_embedding=query)
+    latencies.append(time.perf_counter() - start)
+    truth.append({doc.id for doc in result["documents"]})
+print(f"{'exact':>10}  recall@{TOP_K}=1.000  p50={percentile_ms(latencies, 50):8.2f}ms  p95={percentile_ms(latencies, 95):8.2f}ms")
+
+for nprobe in NPROBES:
+    hits = 0
+    latencies = []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = ivf_retriever.run(query_embedding=query, nprobe=nprobe)
+        latencies.append(time.perf_counter() - start)
+        hits += len(expected & {doc.id for doc in result["documents"]})
+    recall = hits / (TOP_K * len(queries))
+    print(f"{'nprobe=' + str(nprobe):>10}  recall@{TOP_K}={recall:.3f}  p50={percentile_ms(latencies, 50):8.2f}ms  p95={percentile_ms(latencies, 95):8.2f}ms")
@@ -0,0 +1,542 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+warnings.filterwarnings('ignore')
+
+# Offline benchmarks of the indexing, RAG, summarizer, re-fetch, self-reflecting agent and chat
+# agent pipelines, built from the same components as the scripts but run against fake_backends:
+# a fake OpenAI server, hash embedders instead of SentenceTransformers/Cohere/OpenAI
+# embeddings, and a fixture server instead of the web and Hacker News. Indexing and RAG run
+# over synthetic corpora of every size in --sizes. Each (scenario, size) runs in a fresh
+# process, so peak memory is its own, and reports throughput and p50/p95/p99 latency.
+#
+#   python bench_pipelines.py --sizes 1000,10000,100000 --save-baseline baseline.json
+#   python bench_pipelines.py --sizes 1000,10000,100000 --baseline baseline.json
+#
+# With --baseline the run exits with status 1 when throughput dropped, or p95 latency or
+# peak memory grew, by more than --tolerance against the saved results.
+SCALED_SCENARIOS = ("indexing", "rag")
+SCENARIOS = ("indexing", "rag", "summarizer", "refetch", "agent", "chat")
+DIMENSIONS = 384
+
+
+def percentile_ms(latencies: List[float], p: float) -> float:
+    return 1000 * float(np.percentile(latencies, p)) if latencies else 0.0
+
+
+def peak_memory_mb() -> float:
+    if resource is None:
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def api_key():
+    from haystack.utils.auth import Secret
+
+    return Secret.from_token("fake-key")
+
+
+def generator(options: Dict[str, Any], **kwargs):
+    from haystack.components.generators import OpenAIGenerator
+
+    return OpenAIGenerator(api_key=api_key(), api_base_url=options["openai_url"], **kwargs)
+
+
+# IndexingPipeline.py: embedder -> writer into a MemmapDocumentStore with a BM25 index on disk,
+# fed `size` synthetic chunks in batches of --batch-size. One operation is one chunk; latency
+# is per batch.
+def bench_indexing(size: int, options: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from haystack import Pipeline
+
+    from embedding_cache import CachedDocumentEmbedder, EmbeddingCache
+    from fake_backends import HashDocumentEmbedder, synthetic_corpus
+    from hybrid_retrieval import HybridDocumentWriter, InvertedIndex
+    from memmap_store import MemmapDocumentStore
+
+    document_store = MemmapDocumentStore(os.path.join(workdir, "index"))
+    text_index = InvertedIndex(os.path.join(document_store.path, "bm25.pkl"))
+    embedding_cache = EmbeddingCache(path=os.path.join(workdir, "embedding_cache.sqlite"))
+    indexing = Pipeline()
+    indexing.add_component("embedder", CachedDocumentEmbedder(HashDocumentEmbedder(DIMENSIONS), embedding_cache))
+    indexing.add_component("writer", HybridDocumentWriter(document_store=document_store, text_index=text_index))
+    indexing.connect("embedder", "writer")
+
+    latencies = []
+    batch = []
+    for doc in synthetic_corpus(size, seed=options["seed"]):
+        batch.append(doc)
+        if len(batch) == options["batch_size"]:
+            start = time.perf_counter()
+            indexing.run({"embedder": {"documents": batch}})
+            latencies.append(time.perf_counter() - start)
+            batch = []
+    if batch:
+        start = time.perf_counter()
+        indexing.run({"embedder": {"documents": batch}})
+        latencies.append(time.perf_counter() - start)
+    text_index.save()
+    return {"operations": size, "latencies": latencies, "extra": {"documents": document_store.count_documents()}}
+
+
+# RAGpipeline.py: the fixture pages are fetched and indexed through the same indexing pipeline
+# as the script, the synthetic corpus is written on top, then every query runs through
+# hybrid retrieval, prompt building and generation. One operation is one query.
+def bench_rag(size: int, options: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from haystack import Pipeline
+    from haystack.components.builders import PromptBuilder
+    from haystack.components.converters import HTMLToDocument
+    from haystack.components.fetchers import LinkContentFetcher
+
+    from ann_index import IVFDocumentStore, IVFEmbeddingRetriever
+    from context_packing import ContextPacker
+    from embedding_cache import CachedDocumentEmbedder, CachedTextEmbedder, EmbeddingCache
+    from fake_backends import HashDocumentEmbedder, HashTextEmbedder, SyntheticText, synthetic_corpus
+    from generator_cache import CachedGenerator, ResponseCache
+    from hybrid_retrieval import HybridDocumentWriter, HybridRetriever, InvertedIndex
+    from parallel_preprocess import ParallelConvertSplit
+
+    embedding_cache = EmbeddingCache(path=os.path.join(workdir, "embedding_cache.sqlite"))
+    response_cache = ResponseCache(path=os.path.join(workdir, "response_cache.sqlite"))
+    document_store = IVFDocumentStore()
+    text_index = InvertedIndex()
+    writer = HybridDocumentWriter(document_store=document_store, text_index=text_index)
+
+    indexing = Pipeline()
+    indexing.add_component("fetcher", LinkContentFetcher())
+    indexing.add_component("converter", ParallelConvertSplit(converter=HTMLToDocument()))
+    indexing.add_component("embedder", CachedDocumentEmbedder(HashDocumentEmbedder(DIMENSIONS), embedding_cache))
+    indexing.add_component("writer", writer)
+    indexing.connect("fetcher.streams", "converter.sources")
+    indexing.connect("converter", "embedder")
+    indexing.connect("embedder", "writer")
+    start = time.perf_counter()
+    urls = [f"{options['fixture_url']}/pages/{page}.html" for page in range(1, options["pages"] + 1)]
+    indexing.run({"fetcher": {"urls": urls}})
+    fetch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embedder = HashDocumentEmbedder(DIMENSIONS)
+    batch = []
+    for doc in synthetic_corpus(size, seed=options["seed"]):
+        batch.append(doc)
+        if len(batch) == options["batch_size"]:
+            writer.run(documents=embedder.run(documents=batch)["documents"])
+            batch = []
+    if batch:
+        writer.run(documents=embedder.run(documents=batch)["documents"])
+    write_seconds = time.perf_counter() - start
+
+    prompt = """
+Answer the question based on the provided context.
+Context:
+{% for doc in documents %}
+   {{ doc.content }}
+{% endfor %}
+Question: {{ query }}
+"""
+    retriever = HybridRetriever(
+        document_store=document_store,
+        text_index=text_index,
+        text_embedder=CachedTextEmbedder(HashTextEmbedder(DIMENSIONS), embedding_cache),
+        embedding_retriever=IVFEmbeddingRetriever(document_store=document_store, nprobe=8),
+    )
+    packer = ContextPacker(max_tokens=options["context_tokens"])
+    rag = Pipeline()
+    rag.add_component("retriever", retriever)
+    rag.add_component("packer", packer)
+    rag.add_component("prompt", PromptBuilder(template=prompt))
+    rag.add_component("generator", CachedGenerator(generator(options), response_cache))
+    rag.connect("retriever.documents", "packer.documents")
+    rag.connect("packer.documents", "prompt.documents")
+    rag.connect("prompt", "generator")
+
+    latencies = []
+    questions = SyntheticText(seed=options["seed"] + 1).queries(options["queries"])
+    for question in questions:
+        start = time.perf_counter()
+        rag.run({"retriever": {"query": question, "top_k": 3}, "packer": {"query": question}, "prompt": {"query": question}})
+        latencies.append(time.perf_counter() - start)
+    extra = {
+        "fetch_seconds": fetch_seconds,
+        "write_seconds": write_seconds,
+        **retriever.stats(),
+        "context_saved_ratio": packer.stats()["saved_ratio"],
+    }
+    return {"operations": len(questions), "latencies": latencies, "extra": extra}
+
+
+# Newswithbranching.py summarizer: top Hacker News stories from the fixture server, fetched
+# concurrently, summarized in one generator call. One operation is one summary.
+def bench_summarizer(size: int, options: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from haystack import Pipeline
+    from haystack.components.builders import PromptBuilder
+
+    from context_packing import ContextPacker
+    from hackernews import HackernewsNewestFetcher
+
+    prompt_template = """
+You will be provided a few of the top posts in HackerNews.
+For each post, provide a brief summary if possible.
+
+Posts:
+{% for article in articles %}
+  Post:\n
+  {{ article.content}}
+{% endfor %}
+"""
+    packer = ContextPacker(max_tokens=options["summary_tokens"])
+    summarizer = Pipeline()
+    summarizer.add_component("fetcher", HackernewsNewestFetcher(api_url=f"{options['fixture_url']}/v0"))
+    summarizer.add_component("packer", packer)
+    summarizer.add_component("prompt", PromptBuilder(template=prompt_template))
+    summarizer.add_component("llm", generator(options))
+    summarizer.connect("fetcher.articles", "packer.documents")
+    summarizer.connect("packer.documents", "prompt.articles")
+    summarizer.connect("prompt", "llm")
+
+    latencies = []
+    failures = 0
+    for _ in range(options["runs"]):
+        start = time.perf_counter()
+        result = summarizer.run({"fetcher": {"top_k": options["top_k"]}})
+        latencies.append(time.perf_counter() - start)
+        failures += len(result["fetcher"]["failures"])
+    extra = {"fetch_failures": failures, "context_saved_ratio": packer.stats()["saved_ratio"]}
+    return {"operations": options["runs"], "latencies": latencies, "extra": extra}
+
+
+# Re-running the RAGpipeline.py indexing pipeline over --refetch-pages pages of its own fixture
+# server, with --changed of them edited before each of --runs runs after the first (cold) one.
+# Unchanged pages answer 304 and replay their recorded documents. One operation is one URL;
+# latency is one run.
+def bench_refetch(size: int, options: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from haystack import Pipeline
+    from haystack.components.converters import HTMLToDocument
+    from haystack.components.joiners import DocumentJoiner
+
+    from ann_index import IVFDocumentStore
+    from embedding_cache import CachedDocumentEmbedder, EmbeddingCache
+    from fake_backends import FixtureServer, HashDocumentEmbedder
+    from http_cache import CachedLinkFetcher, HTTPCache, PageDocumentRecorder
+    from hybrid_retrieval import HybridDocumentWriter, InvertedIndex
+    from parallel_preprocess import ParallelConvertSplit
+
+    pages = options["refetch_pages"]
+    changed = max(1, int(pages * options["changed"])) if options["changed"] > 0 else 0
+    http_cache = HTTPCache(path=os.path.join(workdir, "http_cache"))
+    embedding_cache = EmbeddingCache(path=os.path.join(workdir, "embedding_cache.sqlite"))
+    latencies = []
+    stats = {"not_modified": 0, "changed": 0, "replayed": 0, "failed": 0}
+    cold_seconds = 0.0
+    with FixtureServer(latency=options["fetch_latency"]) as server:
+        urls = [server.page_url(page) for page in range(1, pages + 1)]
+        for run in range(options["runs"] + 1):
+            if run > 0:
+                first = 1 + (run - 1) * changed % pages
+                server.edit([1 + (page - 1) % pages for page in range(first, first + changed)])
+            # The document store starts empty on every run, as in the script
+            fetcher = CachedLinkFetcher(http_cache)
+            indexing = Pipeline()
+            indexing.add_component("fetcher", fetcher)
+            indexing.add_component("converter", ParallelConvertSplit(converter=HTMLToDocument()))
+            indexing.add_component("embedder", CachedDocumentEmbedder(HashDocumentEmbedder(DIMENSIONS), embedding_cache))
+            indexing.add_component("recorder", PageDocumentRecorder(http_cache))
+            indexing.add_component("joiner", DocumentJoiner())
+            indexing.add_component("writer", HybridDocumentWriter(document_store=IVFDocumentStore(), text_index=InvertedIndex()))
+            indexing.connect("fetcher.streams", "converter.sources")
+            indexing.connect("converter", "embedder")
+            indexing.connect("embedder", "recorder")
+            indexing.connect("recorder", "joiner")
+            indexing.connect("fetcher.documents", "joiner")
+            indexing.connect("joiner", "writer")
+            start = time.perf_counter()
+            result = indexing.run({"fetcher": {"urls": urls}})
+            elapsed = time.perf_counter() - start
+            if run == 0:
+                cold_seconds = elapsed
+                continue
+            latencies.append(elapsed)
+            for name in stats:
+                stats[name] += result["fetcher"]["stats"][name]
+    extra = {"cold_seconds": cold_seconds, **stats}
+    return {"operations": options["runs"] * pages, "latencies": latencies, "extra": extra}
+
+
+# Agentswithloops.py: the self-reflecting agent over synthetic texts, --workers at a time.
+# One operation is one text; latency is one text's whole reflection loop.
+def bench_agent(size: int, options: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from entity_extraction import BatchEntityExtractor
+    from fake_backends import SyntheticText
+
+    texts = SyntheticText(seed=options["seed"]).entity_texts(options["texts"])
+    extractor = BatchEntityExtractor(max_workers=options["workers"], api_key=api_key(), generator_factory=lambda: generator(options))
+    latencies = []
+    iterations = []
+    errors = 0
+    start = time.perf_counter()
+    for result in extractor.run(texts):
+        if "error" in result:
+            errors += 1
+            continue
+        latencies.append(result["metrics"]["seconds"])
+        iterations.append(result["metrics"]["iterations"])
+    seconds = time.perf_counter() - start
+    extra = {"errors": errors, "mean_iterations": float(np.mean(iterations)) if iterations else 0.0}
+    return {"operations": len(texts), "latencies": latencies, "seconds": seconds, "extra": extra}
+
+
+# Chat agent.py: conversation memory, a streamed reply and the function-call loop, for --turns
+# user turns of one conversation. One operation is one turn.
+def bench_chat(size: int, options: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from haystack import Pipeline
+    from haystack.components.joiners import BranchJoiner
+    from haystack.dataclasses import ChatMessage
+
+    from chat_streaming import StreamingFunctionDispatcher
+    from conversation_memory import ConversationMemory
+    from fake_backends import SyntheticText
+    from tool_execution import ToolExecutor
+
+    def rag_pipeline_func(query: str) -> str:
+        return f"RAG pipeline result for query: {query}"
+
+    available_functions = {"rag_pipeline_func": rag_pipeline_func}
+    tool_executor = ToolExecutor(available_functions, pure_functions={"rag_pipeline_func"})
+    prompt_builder = ConversationMemory(summarizer=generator(options, model="gpt-3.5-turbo"))
+    function_caller = StreamingFunctionDispatcher(available_functions, output=io.StringIO(), tool_executor=tool_executor)
+
+    chat_agent = Pipeline()
+    chat_agent.add_component("message_collector", BranchJoiner(type_=List[ChatMessage]))
+    chat_agent.add_component("prompt_builder", prompt_builder)
+    chat_agent.add_component(
+        "generator", generator(options, model="gpt-3.5-turbo", streaming_callback=function_caller.streaming_callback)
+    )
+    chat_agent.add_component("function_caller", function_caller)
+    chat_agent.connect("message_collector.value", "prompt_builder.messages")
+    chat_agent.connect("prompt_builder.prompt", "generator.prompt")
+    chat_agent.connect("generator.replies", "function_caller.replies")
+    chat_agent.connect("function_caller.function_replies", "message_collector.value")
+    prompt_builder.add([ChatMessage.from_system("Use your tools to answer the user's questions.")])
+
+    latencies = []
+    time_to_first_token = []
+    for question in SyntheticText(seed=options["seed"]).queries(options["turns"], words=8):
+        function_caller.start()
+        start = time.perf_counter()
+        result = chat_agent.run({"message_collector": {"value": [ChatMessage.from_user(question)]}})
+        latencies.append(time.perf_counter() - start)
+        if function_caller.metrics["time_to_first_token"] is not None:
+            time_to_first_token.append(function_caller.metrics["time_to_first_token"])
+        replies = result.get("function_caller", {}).get("replies", [])
+        if replies:
+            prompt_builder.add([ChatMessage.from_assistant(replies[0])])
+    extra = {**prompt_builder.stats(), "p50_time_to_first_token_ms": percentile_ms(time_to_first_token, 50)}
+    return {"operations": len(latencies), "latencies": latencies, "extra": extra}
+
+
+BENCHMARKS: Dict[str, Callable[[int, Dict[str, Any], str], Dict[str, Any]]] = {
+    "indexing": bench_indexing,
+    "rag": bench_rag,
+    "summarizer": bench_summarizer,
+    "refetch": bench_refetch,
+    "agent": bench_agent,
+    "chat": bench_chat,
+}
+
+
+def _run_benchmark(scenario: str, size: int, options: Dict[str, Any], results):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    warnings.filterwarnings('ignore')
+    if resource is None:
+        tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            result = BENCHMARKS[scenario](size, options, workdir)
+            seconds = time.perf_counter() - start
+        latencies = result["latencies"]
+        # Sequential scenarios are timed per operation; concurrent ones report their wall time
+        measured = result.get("seconds", sum(latencies))
+        results.put({
+            "scenario": scenario,
+            "size": size,
+            "operations": result["operations"],
+            "seconds": seconds,
+            "throughput": result["operations"] / measured if measured else 0.0,
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95),
+            "p99_ms": percentile_ms(latencies, 99),
+            "peak_memory_mb": peak_memory_mb(),
+            "extra": result.get("extra", {}),
+        })
+    except Exception as error:
+        results.put({"scenario": scenario, "size": size, "error": f"{type(error).__name__}: {error}"})
+
+
+def run_in_process(scenario: str, size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_benchmark, args=(scenario, size, options, results))
+    process.start()
+    try:
+        # Polled, so a child that dies without reporting (killed, out of memory, crashed in native
+        # code) fails its scenario instead of hanging the run
+        while True:
+            try:
+                result = results.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    try:
+                        result = results.get(timeout=1.0)
+                    except queue.Empty:
+                        result = {"scenario": scenario, "size": size, "error": f"worker exited with code {process.exitcode}"}
+                    break
+    except KeyboardInterrupt:
+        process.terminate()
+        raise
+    process.join()
+    return result
+
+
+def key(result: Dict[str, Any]) -> str:
+    return f"{result['scenario']}@{result['size']}" if result["scenario"] in SCALED_SCENARIOS else result["scenario"]
+
+
+# Throughput may not drop, and p95 latency and peak memory may not grow, by more than `tolerance`
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    found = []
+    if baseline.get("throughput") and result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        found.append(f"throughput {result['throughput']:.1f}/s < {baseline['throughput']:.1f}/s")
+    for metric in ("p95_ms", "peak_memory_mb"):
+        if baseline.get(metric) and result[metric] > baseline[metric] * (1 + tolerance):
+            found.append(f"{metric} {result[metric]:.1f} > {baseline[metric]:.1f}")
+    return found
+
+
+def print_result(result: Dict[str, Any], baseline: Dict[str, Any] = None):
+    if "error" in result:
+        print(f"{key(result):<18} FAILED {result['error']}")
+        return
+    line = (
+        f"{key(result):<18} {result['throughput']:10.1f}/s  p50={result['p50_ms']:9.2f}ms  "
+        f"p95={result['p95_ms']:9.2f}ms  p99={result['p99_ms']:9.2f}ms  peak={result['peak_memory_mb']:7.1f}MB"
+    )
+    if baseline and baseline.get("throughput"):
+        line += f"  ({100 * (result['throughput'] / baseline['throughput'] - 1):+.1f}% throughput vs baseline)"
+    print(line)
+    if result["extra"]:
+        print(" " * 19 + ", ".join(f"{name}={value:.3g}" if isinstance(value, float) else f"{name}={value}"
+                                   for name, value in result["extra"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks against fake backends")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--sizes", default="1000,10000,100000", help="corpus sizes in chunks, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=20, help="fixture pages fetched by the RAG indexing pipeline")
+    parser.add_argument("--runs", type=int, default=20, help="summarizer and refetch runs")
+    parser.add_argument("--refetch-pages", type=int, default=500, help="fixture pages re-indexed by the refetch scenario")
+    parser.add_argument("--changed", type=float, default=0.05, help="fraction of pages edited before each refetch run")
+    parser.add_argument("--top-k", type=int, default=5, help="stories per summary")
+    parser.add_argument("--context-tokens", type=int, default=1500, help="RAG prompt context budget")
+    parser.add_argument("--summary-tokens", type=int, default=3000, help="summarizer prompt context budget")
+    parser.add_argument("--texts", type=int, default=64, help="agent texts")
+    parser.add_argument("--workers", type=int, default=8, help="agent workers")
+    parser.add_argument("--turns", type=int, default=50, help="chat turns")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="fake LLM seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake LLM seconds per completion token")
+    parser.add_argument("--fetch-latency", type=float, default=0.0, help="fixture server seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as the baseline to compare later runs with")
+    parser.add_argument("--baseline", help="compare with a saved baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    arguments = parser.parse_args()
+
+    from fake_backends import FakeOpenAIServer, FixtureServer
+
+    scenarios = [scenario.strip() for scenario in arguments.scenarios.split(",") if scenario.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {sorted(unknown)}, expected some of {SCENARIOS}")
+    sizes = [int(size) for size in arguments.sizes.split(",")]
+    baseline = {}
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = []
+    failed = []
+    with FakeOpenAIServer(latency=arguments.llm_latency, token_latency=arguments.token_latency) as openai_server, \
+            FixtureServer(stories=max(arguments.top_k, 1), latency=arguments.fetch_latency) as fixture_server:
+        options = {
+            "openai_url": openai_server.url,
+            "fixture_url": fixture_server.url,
+            "seed": arguments.seed,
+            "queries": arguments.queries,
+            "batch_size": arguments.batch_size,
+            "pages": arguments.pages,
+            "runs": arguments.runs,
+            "top_k": arguments.top_k,
+            "refetch_pages": arguments.refetch_pages,
+            "changed": arguments.changed,
+            "fetch_latency": arguments.fetch_latency,
+            "context_tokens": arguments.context_tokens,
+            "summary_tokens": arguments.summary_tokens,
+            "texts": arguments.texts,
+            "workers": arguments.workers,
+            "turns": arguments.turns,
+        }
+        print(f"python {platform.python_version()} on {platform.platform()}, {os.cpu_count()} CPUs")
+        for scenario in scenarios:
+            for size in sizes if scenario in SCALED_SCENARIOS else [0]:
+                result = run_in_process(scenario, size, options)
+                expected = baseline.get(key(result))
+                print_result(result, expected)
+                results.append(result)
+                if "error" in result:
+                    failed.append(f"{key(result)}: {result['error']}")
+                elif expected:
+                    failed.extend(f"{key(result)}: {problem}" for problem in regressions(result, expected, arguments.tolerance))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": {name: value for name, value in vars(arguments).items() if name not in ("output", "save_baseline", "baseline")},
+        "results": {key(result): result for result in results},
+    }
+    for path in (arguments.output, arguments.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    if failed:
+        print("\n".join(["", "Regressions:" if baseline else "Failures:"] + failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import sys
+import time
+import warnings
+
+import numpy as np
+from haystack import Document
+from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+
+from quantization import QuantizedDocumentStore
+
+warnings.filterwarnings('ignore')
+
+# Memory per vector, recall@k and per-query latency of QuantizedDocumentStore (with and
+# without full-precision rescoring) against the exact InMemoryDocumentStore
+NUM_DOCUMENTS = 20000
+NUM_QUERIES = 200
+DIMENSIONS = 1536
+TOP_K = 10
+CONFIGURATIONS = [
+    ("float16", False),
+    ("int8", False),
+    ("int8", True),
+    ("binary", False),
+    ("binary", True),
+]
+
+
+def clustered_vectors(rng, n, clusters=200):
+    centers = rng.normal(size=(clusters, DIMENSIONS))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, DIMENSIONS))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def percentile_ms(latencies, p):
+    return 1000 * float(np.percentile(latencies, p))
+
+
+def list_bytes(embedding):
+    return sys.getsizeof(embedding) + sum(sys.getsizeof(value) for value in embedding)
+
+
+rng = np.random.default_rng(42)
+vectors = clustered_vectors(rng, NUM_DOCUMENTS + NUM_QUERIES)
+documents = [Document(content=f"document {i}", embedding=vector.tolist()) for i, vector in enumerate(vectors[:NUM_DOCUMENTS])]
+queries = [vector.tolist() for vector in vectors[NUM_DOCUMENTS:]]
+
+exact_store = InMemoryDocumentStore()
+exact_store.write_documents(documents)
+exact_retriever = InMemoryEmbeddingRetriever(document_store=exact_store, top_k=TOP_K)
+
+list_bytes_per_vector = list_bytes(documents[0].embedding)
+float32_bytes_per_vector = 4 * DIMENSIONS
+print(f"{NUM_DOCUMENTS} documents x {DIMENSIONS} dimensions")
+print(f"{'python lists':>16}  {list_bytes_per_vector:6d} B/vector")
+
+truth = []
+latencies = []
+for query in queries:
+    start = time.perf_counter()
+    result = exact_retriever.run(query_embedding=query)
+    latencies.append(time.perf_counter() - start)
+    truth.append({doc.id for doc in result["documents"]})
+print(f"{'exact':>16}  {float32_bytes_per_vector:6d} B/vector  recall@{TOP_K}=1.000  "
+      f"p50={percentile_ms(latencies, 50):8.2f}ms  p95={percentile_ms(latencies, 95):8.2f}ms")
+
+for quantization, rescore in CONFIGURATIONS:
+    store = QuantizedDocumentStore(quantization=quantization, rescore=rescore)
+    store.write_documents(documents)
+    retriever = InMemoryEmbeddingRetriever(document_store=store, top_k=TOP_K)
+    hits = 0
+    latencies = []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = retriever.run(query_embedding=query)
+        latencies.append(time.perf_counter() - start)
+        hits += len(expected & {doc.id for doc in result["documents"]})
+    recall = hits / (TOP_K * len(queries))
+    bytes_per_vector = store.quantized.nbytes // NUM_DOCUMENTS
+    name = quantization + ("+rescore" if rescore else "")
+    print(f"{name:>16}  {bytes_per_vector:6d} B/vector  recall@{TOP_K}={recall:.3f}  "
+          f"p50={percentile_ms(latencies, 50):8.2f}ms  p95={percentile_ms(latencies, 95):8.2f}ms  "
+          f"({list_bytes_per_vector / bytes_per_vector:.0f}x smaller than lists, "
+          f"{float32_bytes_per_vector / bytes_per_vector:.0f}x smaller than float32)")
@@ -0,0 +1,172 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from haystack import component
+from haystack.dataclasses import ChatMessage, StreamingChunk
+
+from tool_execution import ToolExecutor
+
+
+def parse_function_call(content: str) -> Dict[str, Any]:
+    data = json.loads(content)
+    name = data["function"]["name"]
+    arguments = data["function"].get("arguments") or {}
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments)
+    return {"name": name, "arguments": arguments}
+
+
+# Incremental detector for function-call JSON in a token stream. A reply whose first
+# non-whitespace character is "{" is held back; braces are counted (skipping those inside
+# JSON strings) and the call is returned the moment its object is closed, without waiting
+# for the end of the stream. Anything else is plain text and is passed through as it arrives.
+class FunctionCallDetector:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.mode = None
+        self.buffer = ""
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.call = None
+
+    # Returns (text to show, completed function call or None)
+    def feed(self, text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        if self.mode == "text" or self.call is not None:
+            return ("" if self.call is not None else text), None
+        if self.mode is None:
+            stripped = text.lstrip()
+            if not stripped:
+                self.buffer += text
+                return "", None
+            self.mode = "json" if stripped[0] == "{" else "text"
+            if self.mode == "text":
+                text, self.buffer = self.buffer + text, ""
+                return text, None
+
+        start = len(self.buffer)
+        self.buffer += text
+        for position in range(start, len(self.buffer)):
+            char = self.buffer[position]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        self.call = parse_function_call(self.buffer[: position + 1])
+                        return "", self.call
+                    except (ValueError, KeyError, TypeError):
+                        # Valid-looking JSON that is not a function call: show it as text
+                        self.mode = "text"
+                        text, self.buffer = self.buffer, ""
+                        return text, None
+        return "", None
+
+
+# Streaming front end of the chat agent. `streaming_callback` is given to OpenAIGenerator:
+# text tokens are written to `output` as they arrive, and a function call is dispatched to a
+# ToolExecutor as soon as its JSON is complete, while the rest of the reply is still
+# streaming. `run` then collects the function results (running any call that was not
+# detected while streaming) and returns them as function messages.
+@component
+class StreamingFunctionDispatcher:
+    def __init__(
+        self,
+        available_functions: Dict[str, Callable[..., Any]],
+        output: Any = None,
+        prefix: str = "Assistant: ",
+        tool_executor: Optional[ToolExecutor] = None,
+    ):
+        self.available_functions = available_functions
+        self.output = output
+        self.prefix = prefix
+        self.tool_executor = tool_executor or ToolExecutor(available_functions)
+        self.detector = FunctionCallDetector()
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, Any] = {}
+        self.start()
+
+    # Call right before running the pipeline, so time to first token includes the request
+    def start(self):
+        with self._lock:
+            self.detector.reset()
+            self._dispatched: List[Tuple[Dict[str, Any], Future, float]] = []
+            self._started = time.perf_counter()
+            self._printed = False
+            self.metrics = {"time_to_first_token": None, "time_to_function_call": None, "chunks": 0}
+
+    def _write(self, text: str):
+        output = self.output or sys.stdout
+        if not self._printed:
+            text = self.prefix + text
+            self._printed = True
+        output.write(text)
+        output.flush()
+
+    # The submit time goes with the future, so the tool timeout counts from the dispatch
+    def _dispatch(self, call: Dict[str, Any]) -> Tuple[Dict[str, Any], Future, float]:
+        started = time.monotonic()
+        return call, self.tool_executor.submit(call["name"], call["arguments"]), started
+
+    def streaming_callback(self, chunk: StreamingChunk):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            self.metrics["chunks"] += 1
+            if self.metrics["time_to_first_token"] is None and chunk.content:
+                self.metrics["time_to_first_token"] = elapsed
+            text, call = self.detector.feed(chunk.content or "")
+            if text:
+                self._write(text)
+            if call is not None:
+                self.metrics["time_to_function_call"] = elapsed
+                self._dispatched.append(self._dispatch(call))
+
+    @component.output_types(function_replies=List[ChatMessage], replies=List[str])
+    def run(self, replies: List[str]):
+        with self._lock:
+            dispatched, self._dispatched = self._dispatched, []
+            printed = self._printed
+            self.detector.reset()
+            self._printed = False
+        if printed:
+            (self.output or sys.stdout).write("\n")
+
+        function_replies = []
+        for reply in replies:
+            if dispatched:
+                call, future, started = dispatched.pop(0)
+            else:
+                # Not streamed (or not recognised while streaming): parse the complete reply
+                if not reply.lstrip().startswith("{"):
+                    continue
+                try:
+                    call = parse_function_call(reply)
+                except (ValueError, KeyError, TypeError) as e:
+                    function_replies.append(
+                        ChatMessage.from_function(f"Error processing function call: {str(e)}", name="function_caller")
+                    )
+                    continue
+                call, future, started = self._dispatch(call)
+            result = self.tool_executor.result(call["name"], future, started)
+            function_replies.append(ChatMessage.from_function(result, name=call["name"]))
+
+        # Only emit function replies when there are any, so the agent loop ends on a text answer
+        if function_replies:
+            return {"function_replies": function_replies}
+        return {"replies": replies}
@@ -0,0 +1,162 @@
+import hashlib
+import re
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component
+
+from conversation_memory import estimate_tokens
+from hybrid_retrieval import tokenize
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# 64-bit SimHash over word 3-shingles: near-duplicate texts differ in only a few bits
+def simhash(text: str, shingle: int = 3) -> int:
+    words = _WORD.findall(text.lower())
+    shingles = [" ".join(words[i : i + shingle]) for i in range(max(1, len(words) - shingle + 1))]
+    codes = np.array([_hash64(value) for value in shingles], dtype=np.uint64)
+    ones = ((codes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)).sum(axis=0)
+    return sum(1 << bit for bit in range(64) if 2 * ones[bit] > len(codes))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text or "") if sentence.strip()]
+
+
+# Packs retrieved or fetched documents into a fixed prompt budget before the PromptBuilder:
+#   1. near-duplicate documents (SimHash within `max_distance` bits) are dropped, best ranked kept
+#   2. documents are split into sentences (cut to `max_sentence_tokens`, for pages without
+#      punctuation), and sentences already taken from an overlapping chunk are skipped
+#   3. with a query, sentences are ranked by the idf-weighted query terms they contain and
+#      taken best first (ties go to higher ranked documents and earlier sentences) until
+#      `max_tokens` is used; without a query (e.g. summarizing articles) every document gets
+#      its leading sentences in turn, so all of them fit however long some are; the same
+#      happens when no sentence contains a query term
+# The selected sentences are put back in their original order in copies of the documents
+# (meta kept), and `stats` reports the tokens before and after for the query.
+@component
+class ContextPacker:
+    def __init__(
+        self,
+        max_tokens: int = 1500,
+        max_distance: int = 6,
+        min_sentence_tokens: int = 3,
+        max_sentence_tokens: int = 120,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.max_distance = max_distance
+        self.min_sentence_tokens = min_sentence_tokens
+        self.max_sentence_tokens = max_sentence_tokens
+        self.count_tokens = count_tokens
+        self.totals = {"queries": 0, "tokens_before": 0, "tokens_after": 0, "duplicates": 0}
+
+    def _deduplicate(self, documents: List[Document]) -> List[Document]:
+        kept: List[Tuple[Document, int]] = []
+        for doc in documents:
+            fingerprint = simhash(doc.content or "")
+            if all(hamming(fingerprint, other) > self.max_distance for _, other in kept):
+                kept.append((doc, fingerprint))
+        return [doc for doc, _ in kept]
+
+    def _candidates(self, documents: List[Document]) -> List[Dict[str, Any]]:
+        seen = set()
+        candidates = []
+        for rank, doc in enumerate(documents):
+            for position, sentence in enumerate(split_sentences(doc.content or "")):
+                key = " ".join(_WORD.findall(sentence.lower()))
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                tokens = self.count_tokens(sentence)
+                if tokens > self.max_sentence_tokens:
+                    cut = sentence[: len(sentence) * self.max_sentence_tokens // tokens]
+                    sentence = (cut.rsplit(" ", 1)[0] if " " in cut else cut) + " ..."
+                    tokens = self.count_tokens(sentence)
+                candidates.append({"rank": rank, "position": position, "text": sentence, "tokens": tokens})
+        return candidates
+
+    def _select_by_query(self, candidates: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        sentence_terms = [set(tokenize(candidate["text"])) & terms for candidate in candidates]
+        frequency = {term: sum(term in matched for matched in sentence_terms) for term in terms}
+        for candidate, matched in zip(candidates, sentence_terms):
+            candidate["score"] = sum(1.0 / frequency[term] for term in matched)
+        if not any(candidate["score"] for candidate in candidates):
+            return self._select_in_turn(candidates)
+        ranked = sorted(candidates, key=lambda candidate: (-candidate["score"], candidate["rank"], candidate["position"]))
+        selected = []
+        budget = self.max_tokens
+        for candidate in ranked:
+            if candidate["score"] == 0:
+                break
+            if self.min_sentence_tokens <= candidate["tokens"] <= budget:
+                selected.append(candidate)
+                budget -= candidate["tokens"]
+        return selected
+
+    def _select_in_turn(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        queues: Dict[int, List[Dict[str, Any]]] = {}
+        for candidate in candidates:
+            queues.setdefault(candidate["rank"], []).append(candidate)
+        selected = []
+        budget = self.max_tokens
+        while queues and budget > 0:
+            for rank in list(queues):
+                queue = queues[rank]
+                candidate = queue.pop(0)
+                if candidate["tokens"] <= budget:
+                    selected.append(candidate)
+                    budget -= candidate["tokens"]
+                else:
+                    # This document's next sentence no longer fits; the others may still have room
+                    queue.clear()
+                if not queue:
+                    del queues[rank]
+        return selected
+
+    def stats(self) -> Dict[str, Any]:
+        before, after = self.totals["tokens_before"], self.totals["tokens_after"]
+        return {**self.totals, "saved_tokens": before - after, "saved_ratio": 1 - after / before if before else 0.0}
+
+    @component.output_types(documents=List[Document], stats=Dict[str, Any])
+    def run(self, documents: List[Document], query: Optional[str] = None):
+        tokens_before = sum(self.count_tokens(doc.content or "") for doc in documents)
+        unique = self._deduplicate(documents)
+        candidates = self._candidates(unique)
+        selected = self._select_by_query(candidates, query) if query else self._select_in_turn(candidates)
+
+        sentences: Dict[int, List[Dict[str, Any]]] = {}
+        for candidate in selected:
+            sentences.setdefault(candidate["rank"], []).append(candidate)
+        packed = []
+        for rank, doc in enumerate(unique):
+            if rank not in sentences:
+                continue
+            content = " ".join(candidate["text"] for candidate in sorted(sentences[rank], key=lambda c: c["position"]))
+            packed.append(replace(doc, content=content, embedding=None))
+        tokens_after = sum(self.count_tokens(doc.content) for doc in packed)
+
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "saved_tokens": tokens_before - tokens_after,
+            "duplicates": len(documents) - len(unique),
+            "documents_dropped": len(unique) - len(packed),
+        }
+        self.totals["queries"] += 1
+        self.totals["tokens_before"] += tokens_before
+        self.totals["tokens_after"] += tokens_after
+        self.totals["duplicates"] += stats["duplicates"]
+        return {"documents": packed, "stats": stats}
@@ -0,0 +1,123 @@
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+from haystack import component
+from haystack.dataclasses import ChatMessage
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text; pass a tiktoken-based counter for exact counts
+    return len(text) // 4 + 1
+
+
+def format_message(message: ChatMessage) -> str:
+    if message.role == "system":
+        return f"System: {message.content}"
+    if message.role == "user":
+        return f"User: {message.content}"
+    if message.role == "assistant":
+        return f"Assistant: {message.content}"
+    return f"{message.role.capitalize()}: {message.content}"
+
+
+SUMMARY_PROMPT = """Update the summary of a conversation with the new lines below.
+Keep names, facts, decisions and open questions. Answer with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New lines:
+{lines}
+
+Updated summary:"""
+
+
+# Bounded conversation memory for the chat agent. System messages are pinned, recent turns
+# are kept in a window of at most `max_tokens` tokens, and turns that fall out of the window
+# are folded into a rolling summary (by `summarizer`, any generator with run(prompt), or by
+# keeping the tail of the old transcript when there is none). Each message is formatted and
+# counted once when it is added and the window text is extended in place, so building the
+# prompt costs the same on turn 500 as on turn 5.
+@component
+class ConversationMemory:
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        summary_tokens: int = 300,
+        summarizer: Any = None,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.clear()
+
+    def clear(self):
+        self.system_lines: List[str] = []
+        self.summary = ""
+        self._window = deque()
+        self._window_text = ""
+        self._window_tokens = 0
+        self.turns = 0
+        self.summarized_turns = 0
+
+    def add(self, messages: List[ChatMessage]):
+        for message in messages:
+            line = format_message(message)
+            if message.role == "system":
+                self.system_lines.append(line)
+                continue
+            tokens = self.count_tokens(line)
+            self._window.append((line, tokens))
+            self._window_text += ("\n" if self._window_text else "") + line
+            self._window_tokens += tokens
+            self.turns += 1
+        if self._window_tokens > self.max_tokens:
+            self._evict()
+
+    # Evicts down to 3/4 of the budget, so the summarizer runs once every few turns, not every turn
+    def _evict(self):
+        evicted = []
+        target = self.max_tokens * 3 // 4
+        while len(self._window) > 1 and self._window_tokens > target:
+            line, tokens = self._window.popleft()
+            evicted.append(line)
+            self._window_tokens -= tokens
+        self._window_text = self._window_text[sum(len(line) + 1 for line in evicted) :]
+        self.summarized_turns += len(evicted)
+        self._summarize(evicted)
+
+    def _summarize(self, lines: List[str]):
+        if self.summarizer is not None:
+            prompt = SUMMARY_PROMPT.format(
+                max_words=self.summary_tokens * 3 // 4, summary=self.summary or "(empty)", lines="\n".join(lines)
+            )
+            self.summary = self.summarizer.run(prompt=prompt)["replies"][0].strip()
+            return
+        # No summarizer: keep the most recent part of the older transcript that fits the summary budget
+        summary = "\n".join(([self.summary] if self.summary else []) + lines)
+        max_chars = self.summary_tokens * 4
+        self.summary = summary[-max_chars:] if len(summary) > max_chars else summary
+
+    def prompt(self) -> str:
+        parts = list(self.system_lines)
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self._window_text:
+            parts.append(self._window_text)
+        return "\n".join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "summarized_turns": self.summarized_turns,
+            "window_turns": len(self._window),
+            "window_tokens": self._window_tokens,
+            "summary_tokens": self.count_tokens(self.summary) if self.summary else 0,
+        }
+
+    @component.output_types(prompt=str)
+    def run(self, messages: List[ChatMessage]):
+        self.add(messages)
+        return {"prompt": self.prompt()}
@@ -0,0 +1,197 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+from haystack import Document, component
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedder_model_name(embedder: Any) -> str:
+    for attribute in ("model", "model_name_or_path", "model_name"):
+        value = getattr(embedder, attribute, None)
+        if value:
+            return str(value)
+    return type(embedder).__name__
+
+
+# Two-tier embedding cache keyed on (model name, normalized text): a bounded in-memory
+# LRU in front of an optional SQLite file that survives restarts and is shared by scripts.
+# Lookups never write: disk hits are buffered as last_used touches and written by flush(), so
+# a process that only reads does not hold the database's write lock from other processes.
+class EmbeddingCache:
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None, max_disk_entries: int = 1000000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._rows = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, last_used REAL)"
+            )
+            self._db.commit()
+            (self._rows,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    # `count=False` leaves the hit/miss stats alone, for lookups that are not cache traffic
+    # (e.g. EmbeddingScheduler checking its checkpoint behind a CachedDocumentEmbedder)
+    def get(self, key: str, count: bool = True) -> Optional[List[float]]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return self._memory[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._touched[key] = time.time()
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    if count:
+                        self.hits += 1
+                        self.disk_hits += 1
+                    return vector
+            if count:
+                self.misses += 1
+            return None
+
+    def put(self, key: str, vector: List[float]):
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                if self._db.execute("SELECT 1 FROM embeddings WHERE key = ?", (key,)).fetchone() is None:
+                    self._rows += 1
+                self._touched.pop(key, None)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    (key, array("f", vector).tobytes(), time.time()),
+                )
+
+    # Writes buffered touches and commits. The row count is tracked from this process's inserts;
+    # it is only recounted, to take other processes' inserts into account, when it passes the limit.
+    def flush(self):
+        with self._lock:
+            if self._db is None:
+                return
+            if self._touched:
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(last_used, key) for key, last_used in self._touched.items()],
+                )
+                self._touched.clear()
+            if self._rows > self.max_disk_entries:
+                (self._rows,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                if self._rows > self.max_disk_entries:
+                    # Evict down to 90% of the limit so the next evictions (and recounts) are far apart
+                    excess = self._rows - self.max_disk_entries * 9 // 10
+                    self._db.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,),
+                    )
+                    self._rows -= excess
+            self._db.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+# Wraps any text embedder (OpenAITextEmbedder, SentenceTransformersTextEmbedder, CohereTextEmbedder, ...)
+@component
+class CachedTextEmbedder:
+    def __init__(self, embedder: Any, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = embedder_model_name(embedder)
+
+    def warm_up(self):
+        if hasattr(self.embedder, "warm_up"):
+            self.embedder.warm_up()
+
+    # The same text the wrapped embedder sees: an instruction prefix or suffix changes the vector
+    def _text_to_embed(self, text: str) -> str:
+        return getattr(self.embedder, "prefix", "") + text + getattr(self.embedder, "suffix", "")
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    def run(self, text: str):
+        key = self.cache.key(self.model, self._text_to_embed(text))
+        embedding = self.cache.get(key)
+        meta = {"model": self.model, "cache_hit": embedding is not None}
+        if embedding is None:
+            result = self.embedder.run(text=text)
+            embedding = result["embedding"]
+            meta.update(result.get("meta") or {})
+            self.cache.put(key, embedding)
+        self.cache.flush()
+        return {"embedding": embedding, "meta": meta}
+
+
+# Wraps any document embedder; only documents missing from the cache reach the wrapped embedder
+@component
+class CachedDocumentEmbedder:
+    def __init__(self, embedder: Any, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = embedder_model_name(embedder)
+
+    def warm_up(self):
+        if hasattr(self.embedder, "warm_up"):
+            self.embedder.warm_up()
+
+    # The same text the wrapped embedder sees: configured meta fields, prefix and suffix included
+    def _text_to_embed(self, doc: Document) -> str:
+        meta_fields = getattr(self.embedder, "meta_fields_to_embed", None) or []
+        separator = getattr(self.embedder, "embedding_separator", "\n")
+        values = [str(doc.meta[field]) for field in meta_fields if doc.meta.get(field) is not None]
+        text = separator.join(values + [doc.content or ""])
+        return getattr(self.embedder, "prefix", "") + text + getattr(self.embedder, "suffix", "")
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        keys = [self.cache.key(self.model, self._text_to_embed(doc)) for doc in documents]
+        embeddings = [self.cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        meta = {"model": self.model, "cache_hits": len(documents) - len(missing)}
+        if missing:
+            result = self.embedder.run(documents=[documents[i] for i in missing])
+            meta.update(result.get("meta") or {})
+            for i, embedded in zip(missing, result["documents"]):
+                embeddings[i] = embedded.embedding
+                self.cache.put(keys[i], embedded.embedding)
+        self.cache.flush()
+
+        documents = [replace(doc, embedding=embedding) for doc, embedding in zip(documents, embeddings)]
+        return {"documents": documents, "meta": meta}
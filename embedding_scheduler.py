@@ -0,0 +1,238 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from haystack import Document, component
+from haystack.utils.auth import Secret
+
+from embedding_cache import EmbeddingCache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def token_counter(model: str) -> Callable[[str], int]:
+    if tiktoken is None:
+        return lambda text: len(text) // 4 + 1
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+# Thread-safe token bucket refilled continuously at `rate_per_minute`. `pause` empties it for
+# a while, so that one 429 slows every worker down instead of each finding out on its own.
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self, amount: float):
+        # A request larger than the whole bucket waits for a full bucket and then goes into debt
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(min(delay, 1.0))
+
+    def pause(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = max(self.updated, now + seconds)
+
+
+# Drop-in for OpenAIDocumentEmbedder for large corpora. Chunks are packed into batches of at
+# most `max_batch_tokens` tokens, up to `max_concurrency` batches are in flight, and every
+# request first takes its tokens from a tokens-per-minute bucket (plus one from a
+# requests-per-minute bucket). 429s and 5xx responses are retried with exponential backoff
+# (or the server's Retry-After). With a `checkpoint` cache every finished batch is saved right
+# away, and chunks already in it are skipped, so a failed run resumes where it stopped.
+# OPENAI_BASE_URL can point to a local fake endpoint.
+@component
+class EmbeddingScheduler:
+    def __init__(
+        self,
+        api_key: Secret = Secret.from_env_var("OPENAI_API_KEY"),
+        model: str = "text-embedding-ada-002",
+        dimensions: Optional[int] = None,
+        api_base_url: Optional[str] = None,
+        prefix: str = "",
+        suffix: str = "",
+        meta_fields_to_embed: Optional[List[str]] = None,
+        embedding_separator: str = "\n",
+        max_batch_tokens: int = 50000,
+        max_batch_size: int = 2048,
+        max_concurrency: int = 4,
+        tokens_per_minute: int = 1000000,
+        requests_per_minute: int = 3000,
+        max_retries: int = 8,
+        max_backoff: float = 60.0,
+        timeout: float = 60.0,
+        checkpoint: Optional[EmbeddingCache] = None,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.dimensions = dimensions
+        self.api_base_url = (api_base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+        self.prefix = prefix
+        self.suffix = suffix
+        self.meta_fields_to_embed = meta_fields_to_embed or []
+        self.embedding_separator = embedding_separator
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.requests = TokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        self.count_tokens = token_counter(model)
+        self._client: Optional[httpx.Client] = None
+        self._stats_lock = threading.Lock()
+
+    def warm_up(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.Client(
+                base_url=self.api_base_url,
+                timeout=self.timeout,
+                limits=limits,
+                headers={"Authorization": f"Bearer {self.api_key.resolve_value()}"},
+            )
+
+    def _text_to_embed(self, doc: Document) -> str:
+        values = [str(doc.meta[field]) for field in self.meta_fields_to_embed if doc.meta.get(field) is not None]
+        text = self.embedding_separator.join(values + [doc.content or ""])
+        return self.prefix + text + self.suffix
+
+    def _batches(self, token_counts: Dict[int, int]) -> List[List[int]]:
+        batches = []
+        batch: List[int] = []
+        batch_tokens = 0
+        for i, tokens in token_counts.items():
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) == self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                if retry_after is not None:
+                    return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return min(self.max_backoff, 2**attempt) * (0.5 + random.random() / 2)
+
+    def _embed_batch(self, texts: List[str], batch: List[int], tokens: int, stats: Dict[str, Any]) -> Dict[int, List[float]]:
+        payload: Dict[str, Any] = {"model": self.model, "input": [texts[i] for i in batch]}
+        if self.dimensions is not None:
+            payload["dimensions"] = self.dimensions
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+            response = None
+            try:
+                response = self._client.post("/embeddings", json=payload)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    break
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            if attempt == self.max_retries:
+                response.raise_for_status()
+            delay = self._backoff(attempt, response)
+            with self._stats_lock:
+                stats["retries"] += 1
+                if response is not None and response.status_code == 429:
+                    stats["rate_limited"] += 1
+            if response is not None and response.status_code == 429:
+                self.tokens.pause(delay)
+            time.sleep(delay)
+
+        body = response.json()
+        embeddings = {batch[item["index"]]: item["embedding"] for item in body["data"]}
+        if self.checkpoint is not None:
+            for i, embedding in embeddings.items():
+                self.checkpoint.put(self.checkpoint.key(self.model, texts[i]), embedding)
+            self.checkpoint.flush()
+        with self._stats_lock:
+            stats["batches"] += 1
+            stats["prompt_tokens"] += (body.get("usage") or {}).get("prompt_tokens", tokens)
+        return embeddings
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        self.warm_up()
+        start = time.perf_counter()
+        texts = [self._text_to_embed(doc) for doc in documents]
+        embeddings: Dict[int, List[float]] = {}
+        pending = []
+        for i, text in enumerate(texts):
+            # Not counted: a miss here was already counted by the cache in front of the scheduler
+            stored = None
+            if self.checkpoint is not None:
+                stored = self.checkpoint.get(self.checkpoint.key(self.model, text), count=False)
+            if stored is not None:
+                embeddings[i] = stored
+            else:
+                pending.append(i)
+        token_counts = {i: self.count_tokens(texts[i]) for i in pending}
+        stats = {"batches": 0, "retries": 0, "rate_limited": 0, "prompt_tokens": 0, "resumed": len(embeddings)}
+
+        batches = self._batches(token_counts)
+        if batches:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = [
+                    executor.submit(self._embed_batch, texts, batch, sum(token_counts[i] for i in batch), stats)
+                    for batch in batches
+                ]
+                done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in not_done:
+                    future.cancel()
+                for future in futures:
+                    if not future.cancelled():
+                        embeddings.update(future.result())
+
+        seconds = time.perf_counter() - start
+        meta = {
+            "model": self.model,
+            "usage": {"prompt_tokens": stats["prompt_tokens"], "total_tokens": stats["prompt_tokens"]},
+            **stats,
+            "seconds": seconds,
+            "tokens_per_minute": 60 * stats["prompt_tokens"] / seconds if seconds else 0.0,
+        }
+        documents = [replace(doc, embedding=embeddings[i]) for i, doc in enumerate(documents)]
+        return {"documents": documents, "meta": meta}
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from colorama import Fore
+from haystack import Pipeline, component
+from haystack.components.builders.prompt_builder import PromptBuilder
+from haystack.components.generators.openai import OpenAIGenerator
+from haystack.utils.auth import Secret
+
+# Per-run budget of the self-reflecting agent
+MAX_LOOPS = int(os.getenv("AGENT_MAX_LOOPS", "10"))
+MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "8000"))
+MAX_SECONDS = float(os.getenv("AGENT_MAX_SECONDS", "60"))
+
+
+def parse_entities(reply: str) -> Optional[Dict[str, List[str]]]:
+    start, end = reply.find("{"), reply.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        entities = json.loads(reply[start : end + 1])
+    except ValueError:
+        return None
+    if not isinstance(entities, dict):
+        return None
+    return {
+        str(category): sorted({str(value) for value in values}) if isinstance(values, list) else [str(values)]
+        for category, values in entities.items()
+    }
+
+
+# Create an EntitiesValidator component
+# The loop ends when the model says DONE, when the parsed entities are the same as in the
+# previous iteration (no further LLM call is needed to confirm them), or when the run has
+# used up its budget of loops, tokens or seconds. The last reply is then returned as the
+# entities, together with the metrics of the run.
+@component
+class EntitiesValidator:
+    def __init__(
+        self, max_loops: int = MAX_LOOPS, max_tokens: int = MAX_TOKENS, max_seconds: float = MAX_SECONDS, verbose: bool = True
+    ):
+        self.max_loops = max_loops
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.verbose = verbose
+        self.reset()
+
+    def reset(self):
+        self.iterations = 0
+        self.tokens = 0
+        self.previous_entities = None
+        self.started = None
+
+    # Call right before running the pipeline so the first LLM call counts against max_seconds
+    def start(self):
+        self.reset()
+        self.started = time.perf_counter()
+
+    def _finish(self, reply: str, stop_reason: str) -> Dict[str, Any]:
+        metrics = {
+            "iterations": self.iterations,
+            "tokens": self.tokens,
+            "seconds": time.perf_counter() - self.started,
+            "stop_reason": stop_reason,
+        }
+        self.reset()
+        return {"entities": reply.replace('DONE', ''), "metrics": metrics}
+
+    @component.output_types(entities_to_validate=str, entities=str, metrics=Dict[str, Any])
+    def run(self, replies: List[str], meta: Optional[List[Dict[str, Any]]] = None):
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.iterations += 1
+        for reply_meta in meta or []:
+            self.tokens += (reply_meta.get("usage") or {}).get("total_tokens", 0)
+
+        if 'DONE' in replies[0]:
+            return self._finish(replies[0], "done")
+        entities = parse_entities(replies[0])
+        if entities is not None and entities == self.previous_entities:
+            return self._finish(replies[0], "converged")
+        if self.iterations >= self.max_loops:
+            return self._finish(replies[0], "max_loops")
+        if self.tokens >= self.max_tokens:
+            return self._finish(replies[0], "max_tokens")
+        if time.perf_counter() - self.started >= self.max_seconds:
+            return self._finish(replies[0], "max_seconds")
+
+        self.previous_entities = entities
+        if self.verbose:
+            print(Fore.RED + "Reflecting on entities\n", replies[0])
+        return {"entities_to_validate": replies[0]}
+
+# Prompt Template with an 'if' block
+template = """
+{% if entities_to_validate %}
+    Here was the text you were provided:
+    {{ text }}
+    Here are the entities you previously extracted: 
+    {{ entities_to_validate[0] }}
+    Are these the correct entities? 
+    Things to check for:
+    - Entity categories should exactly be "Person", "Location" and "Date"
+    - There should be no extra categories
+    - There should be no duplicate entities
+    - If there are no appropriate entities for a category, the category should have an empty list
+    If you are done say 'DONE' and return your new entities in the next line
+    If not, simply return the best entities you can come up with.
+    Entities:
+{% else %}
+    Extract entities from the following text
+    Text: {{ text }} 
+    The entities should be presented as key-value pairs in a JSON object.
+    Example: 
+    {
+        "Person": ["value1", "value2"], 
+        "Location": ["value3", "value4"],
+        "Date": ["value5", "value6"]
+    }
+    If there are no possibilities for a particular category, return an empty list for this
+    category
+    Entities:
+{% endif %}
+"""
+
+
+def build_self_reflecting_agent(
+    api_key: Secret = Secret.from_env_var("OPENAI_API_KEY"), generator: Any = None, verbose: bool = True
+) -> Pipeline:
+    # The validator enforces the loop budget; the pipeline limit is only a backstop
+    self_reflecting_agent = Pipeline(max_loops_allowed=MAX_LOOPS + 1)
+    self_reflecting_agent.add_component("prompt_builder", PromptBuilder(template=template))
+    self_reflecting_agent.add_component("entities_validator", EntitiesValidator(verbose=verbose))
+    self_reflecting_agent.add_component("llm", generator if generator is not None else OpenAIGenerator(api_key=api_key))
+
+    self_reflecting_agent.connect("prompt_builder.prompt", "llm.prompt")
+    self_reflecting_agent.connect("llm.replies", "entities_validator.replies")
+    self_reflecting_agent.connect("llm.meta", "entities_validator.meta")
+    self_reflecting_agent.connect("entities_validator.entities_to_validate", "prompt_builder.entities_to_validate")
+    return self_reflecting_agent
+
+
+def extract_entities(self_reflecting_agent: Pipeline, text: str) -> Dict[str, Any]:
+    self_reflecting_agent.get_component("entities_validator").start()
+    result = self_reflecting_agent.run({"prompt_builder": {"text": text}})
+    return result["entities_validator"]
+
+
+# Runs the self-reflecting agent over many texts with up to `max_workers` reflection loops in
+# flight. Every worker thread builds its own pipeline (the validator keeps per-run state), and
+# texts are pulled from the iterable only as results are taken (at most `max_pending` ahead),
+# so any number of texts can be streamed through. Results are yielded in input order, or as they complete with in_order=False;
+# each is a dict with the text's index, entities and metrics, or the error it failed with.
+class BatchEntityExtractor:
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_pending: Optional[int] = None,
+        api_key: Secret = Secret.from_env_var("OPENAI_API_KEY"),
+        generator_factory: Any = None,
+    ):
+        self.max_workers = max_workers
+        # Head-of-line texts in in_order mode should not leave the other workers idle
+        self.max_pending = max_pending or 4 * max_workers
+        self.api_key = api_key
+        self.generator_factory = generator_factory
+        self._local = threading.local()
+
+    def _agent(self) -> Pipeline:
+        if not hasattr(self._local, "agent"):
+            generator = self.generator_factory() if self.generator_factory is not None else None
+            self._local.agent = build_self_reflecting_agent(self.api_key, generator=generator, verbose=False)
+        return self._local.agent
+
+    def _extract(self, index: int, text: str) -> Dict[str, Any]:
+        try:
+            return {"index": index, **extract_entities(self._agent(), text)}
+        except Exception as error:
+            return {"index": index, "error": f"{type(error).__name__}: {error}"}
+
+    def run(self, texts: Iterable[str], in_order: bool = True) -> Iterator[Dict[str, Any]]:
+        texts = enumerate(texts)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+
+            def submit() -> bool:
+                for index, text in texts:
+                    pending.append(executor.submit(self._extract, index, text))
+                    return True
+                return False
+
+            while len(pending) < self.max_pending and submit():
+                pass
+            while pending:
+                if in_order:
+                    yield pending.popleft().result()
+                    submit()
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+                    submit()
@@ -0,0 +1,422 @@
+import base64
+import json
+import re
+import threading
+import time
+import zlib
+from dataclasses import replace
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import numpy as np
+from haystack import Document, component
+
+from hybrid_retrieval import tokenize
+
+# Deterministic local stand-ins for the services the scripts call (OpenAI chat and embeddings,
+# web pages, the Hacker News API), so pipelines can be run and benchmarked offline
+
+PEOPLE = ["Ada Lovelace", "Alan Turing", "Grace Hopper", "Leonardo da Vinci", "Marie Curie", "Niels Bohr", "Katherine Johnson"]
+PLACES = ["Florence", "Paris", "London", "Vinci", "Copenhagen", "Washington", "Amboise"]
+_DATE = re.compile(r"\b\d{1,2} (?:January|February|March|April|May|June|July|August|September|October|November|December) \d{4}\b")
+_SYLLABLES = ["ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "ve", "da", "zu", "qui", "mar", "sen", "tor", "bel"]
+
+
+def _bucket(token: str, dimensions: int):
+    code = zlib.crc32(token.encode("utf-8"))
+    return code % dimensions, 1.0 if (code >> 31) & 1 else -1.0
+
+
+# Signed feature hashing of the text's terms, normalized to unit length: deterministic across
+# processes and platforms, and texts sharing terms get similar vectors, so retrieval still ranks
+# sensibly. The buckets of seen terms are memoized, which keeps it cheap for large corpora.
+class HashEmbedding:
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+        self._buckets: Dict[str, Any] = {}
+
+    def __call__(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokenize(text):
+            bucket = self._buckets.get(token)
+            if bucket is None:
+                bucket = self._buckets[token] = _bucket(token, self.dimensions)
+            vector[bucket[0]] += bucket[1]
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+
+def _usage(texts: List[str]) -> Dict[str, int]:
+    tokens = sum(len(text) // 4 + 1 for text in texts)
+    return {"prompt_tokens": tokens, "total_tokens": tokens}
+
+
+# Offline stand-in for OpenAITextEmbedder / SentenceTransformersTextEmbedder
+@component
+class HashTextEmbedder:
+    def __init__(self, dimensions: int = 384, model: str = "hash-embedding"):
+        self.model = model
+        self.embed = HashEmbedding(dimensions)
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    def run(self, text: str):
+        return {"embedding": self.embed(text), "meta": {"model": self.model, "usage": _usage([text])}}
+
+
+# Offline stand-in for OpenAIDocumentEmbedder / SentenceTransformersDocumentEmbedder
+@component
+class HashDocumentEmbedder:
+    def __init__(self, dimensions: int = 384, model: str = "hash-embedding"):
+        self.model = model
+        self.embed = HashEmbedding(dimensions)
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        documents = [replace(doc, embedding=self.embed(doc.content or "")) for doc in documents]
+        return {"documents": documents, "meta": {"model": self.model, "usage": _usage([doc.content or "" for doc in documents])}}
+
+
+def vocabulary(size: int = 5000) -> List[str]:
+    words = []
+    for i in range(size):
+        word = ""
+        n = i + len(_SYLLABLES)
+        while n:
+            n, syllable = divmod(n, len(_SYLLABLES))
+            word += _SYLLABLES[syllable]
+        words.append(word)
+    return words
+
+
+# Text generator with a Zipf-like word distribution over a synthetic vocabulary, so term
+# statistics (and BM25 posting lengths) look like natural text. Same seed, same texts.
+class SyntheticText:
+    def __init__(self, seed: int = 0, vocabulary_size: int = 5000):
+        self.rng = np.random.default_rng(seed)
+        self.words = np.array(vocabulary(vocabulary_size))
+        weights = 1.0 / np.arange(1, vocabulary_size + 1) ** 1.07
+        self.probabilities = weights / weights.sum()
+
+    def texts(self, n: int, words: int, block: int = 10000) -> Iterator[str]:
+        for start in range(0, n, block):
+            rows = self.rng.choice(len(self.words), size=(min(block, n - start), words), p=self.probabilities)
+            for row in self.words[rows]:
+                yield " ".join(row)
+
+    # Queries use mid-frequency words, which is where both BM25 and embeddings have work to do
+    def queries(self, n: int, words: int = 4) -> List[str]:
+        rows = self.rng.integers(50, min(2000, len(self.words)), size=(n, words))
+        return [" ".join(row) for row in self.words[rows]]
+
+    def entity_texts(self, n: int, words: int = 40) -> List[str]:
+        texts = []
+        for text in self.texts(n, words):
+            person = PEOPLE[int(self.rng.integers(len(PEOPLE)))]
+            place = PLACES[int(self.rng.integers(len(PLACES)))]
+            day, year = int(self.rng.integers(1, 29)), int(self.rng.integers(1400, 2000))
+            texts.append(f"{person} was born in {place} on {day} April {year}. {text}")
+        return texts
+
+
+def synthetic_corpus(n: int, seed: int = 0, words: int = 60) -> Iterator[Document]:
+    for i, text in enumerate(SyntheticText(seed).texts(n, words)):
+        yield Document(content=text, meta={"source_id": i})
+
+
+# Every revision of a page is a different text
+def synthetic_page(page: int, paragraphs: int = 8, words: int = 80, revision: int = 0) -> str:
+    texts = SyntheticText(seed=page + 1000003 * revision).texts(paragraphs + 1, words)
+    title = " ".join(next(texts).split()[:6])
+    body = "\n".join(f"<p>{text}</p>" for text in texts)
+    return f"<html><head><title>{title}</title></head><body><h1>{title}</h1>\n<article>\n{body}\n</article></body></html>"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, value: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        self._send(status, json.dumps(value).encode("utf-8"), headers=headers)
+
+
+class _FakeServer:
+    handler = _Handler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self.handler)
+        self._server.daemon_threads = True
+        self._server.backend = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        backend: FakeOpenAIServer = self.server.backend
+        backend.count()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            backend.chat_completion(self, body)
+        elif path.endswith("/embeddings"):
+            backend.embeddings(self, body)
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+
+# OpenAI-compatible chat completions and embeddings endpoint. Replies are deterministic and
+# shaped for the pipelines in this repo: entity extraction prompts get the people, places and
+# dates found in the text as JSON (so the self-reflecting agent converges on the second call),
+# chat prompts whose last line is a user turn get a function call, and anything else gets a
+# short answer. Each request takes `latency` seconds plus `token_latency` per completion
+# token; streamed replies spread that over their chunks. With `rate_limit_every=n` every n-th
+# embeddings request is refused with 429 and a Retry-After of `retry_after` seconds. Point
+# OPENAI_BASE_URL (or api_base_url) at `url`.
+class FakeOpenAIServer(_FakeServer):
+    handler = _OpenAIHandler
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        token_latency: float = 0.0,
+        reply_tokens: int = 48,
+        dimensions: int = 1536,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__(host=host, port=port)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.reply_tokens = reply_tokens
+        self.dimensions = dimensions
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.embedding_requests = 0
+        self.rate_limited = 0
+        self._embeddings: Dict[int, HashEmbedding] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def reply(self, prompt: str) -> str:
+        if "Extract entities" in prompt or "entities you previously extracted" in prompt:
+            entities = {
+                "Person": sorted({person for person in PEOPLE if person in prompt}),
+                "Location": sorted({place for place in PLACES if re.search(rf"\b{place}\b", prompt)}),
+                "Date": sorted(set(_DATE.findall(prompt))),
+            }
+            return json.dumps(entities)
+        lines = [line for line in prompt.strip().splitlines() if line.strip()]
+        last = lines[-1] if lines else ""
+        if last.startswith("User:"):
+            call = {"function": {"name": "rag_pipeline_func", "arguments": {"query": last[len("User:") :].strip()}}}
+            return json.dumps(call)
+        words = tokenize(prompt)[: self.reply_tokens]
+        return "Answer: " + " ".join(words or ["ok"]) + "."
+
+    def chat_completion(self, handler: _Handler, body: Dict[str, Any]):
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(message.get("content") or "") for message in messages)
+        text = self.reply(str(messages[-1].get("content") or "") if messages else "")
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        usage = {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(pieces)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = body.get("model", "gpt-3.5-turbo")
+        created = int(time.time())
+        time.sleep(self.latency)
+        if not body.get("stream"):
+            time.sleep(self.token_latency * len(pieces))
+            handler._send_json({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            })
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def send(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        for piece in pieces:
+            time.sleep(self.token_latency)
+            send({"content": piece})
+        send({}, finish_reason="stop")
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+    def embeddings(self, handler: _Handler, body: Dict[str, Any]):
+        with self._lock:
+            self.embedding_requests += 1
+            limited = self.rate_limit_every > 0 and self.embedding_requests % self.rate_limit_every == 0
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            handler._send_json(error, status=429, headers={"Retry-After": str(self.retry_after)})
+            return
+        texts = body.get("input") or []
+        texts = [texts] if isinstance(texts, str) else texts
+        dimensions = int(body.get("dimensions") or self.dimensions)
+        embed = self._embeddings.setdefault(dimensions, HashEmbedding(dimensions))
+        time.sleep(self.latency)
+        data = []
+        for i, text in enumerate(texts):
+            embedding: Any = embed(str(text))
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        handler._send_json({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": _usage([str(text) for text in texts]),
+        })
+
+
+class _FixtureHandler(_Handler):
+    def do_GET(self):
+        backend: FixtureServer = self.server.backend
+        backend.count()
+        time.sleep(backend.latency)
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/pages/(\d+)\.html", path)
+        if match and int(match.group(1)) not in backend.removed:
+            page = int(match.group(1))
+            revision = backend.revisions.get(page, 0)
+            etag = f'"{page}-{revision}"'
+            if self.headers.get("If-None-Match") == etag:
+                backend.count_not_modified()
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            body = synthetic_page(page, revision=revision).encode("utf-8")
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(1700000000 + 3600 * revision, usegmt=True))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == "/v0/topstories.json":
+            self._send_json(list(range(1, backend.stories + 1)))
+            return
+        match = re.fullmatch(r"/v0/item/(\d+)\.json", path)
+        if match and 1 <= int(match.group(1)) <= backend.stories:
+            self._send_json(backend.item(int(match.group(1))))
+            return
+        self._send(404, b"not found", "text/plain")
+
+
+# Local web server for LinkContentFetcher (synthetic HTML pages at /pages/<n>.html) and
+# HackernewsNewestFetcher (a Hacker News API at /v0 whose stories link to those pages;
+# every fifth story is a text post instead). Pages carry an ETag and Last-Modified and answer
+# a matching If-None-Match with 304 Not Modified; `edit` publishes new revisions of pages and
+# `remove` takes pages down (404), so stories linking to them fail. `break_links` gives stories
+# a malformed url (with a control character) that the HTTP client refuses to request.
+class FixtureServer(_FakeServer):
+    handler = _FixtureHandler
+
+    def __init__(self, stories: int = 100, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host=host, port=port)
+        self.stories = stories
+        self.latency = latency
+        self.revisions: Dict[int, int] = {}
+        self.removed: Set[int] = set()
+        self.broken_links: Set[int] = set()
+        self.not_modified = 0
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def edit(self, pages: List[int]):
+        with self._lock:
+            for page in pages:
+                self.revisions[page] = self.revisions.get(page, 0) + 1
+
+    def remove(self, pages: List[int]):
+        with self._lock:
+            self.removed.update(pages)
+
+    def break_links(self, stories: List[int]):
+        with self._lock:
+            self.broken_links.update(stories)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def hackernews_url(self) -> str:
+        return f"{self.url}/v0"
+
+    def page_url(self, page: int) -> str:
+        return f"{self.url}/pages/{page}.html"
+
+    def item(self, story: int) -> Dict[str, Any]:
+        item = {"id": story, "type": "story", "by": "fixture", "title": f"Story {story}"}
+        if story % 5 == 0:
+            item["text"] = next(SyntheticText(seed=story).texts(1, 120))
+        elif story in self.broken_links:
+            item["url"] = f"{self.url}/pages/{story}\t.html"
+        else:
+            item["url"] = self.page_url(story)
+        return item
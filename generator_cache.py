@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from haystack import component
+
+
+# Exact-match cache of generator responses in SQLite, bounded by age (`ttl` seconds) and by
+# number of entries (least recently used rows are trimmed first). Without a path the
+# cache lives in memory for the lifetime of the process.
+class ResponseCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = 24 * 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL, last_used REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), now, now),
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._db.commit()
+
+
+# Wraps OpenAIGenerator (or any generator with the same run signature). The cache key covers
+# the rendered prompt, model, system prompt and the effective generation kwargs. Concurrent
+# calls with the same key share a single upstream request instead of each sending their own.
+@component
+class CachedGenerator:
+    def __init__(self, generator: Any, cache: ResponseCache):
+        self.generator = generator
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        if hasattr(self.generator, "warm_up"):
+            self.generator.warm_up()
+
+    def key(self, prompt: str, generation_kwargs: Optional[Dict[str, Any]] = None) -> str:
+        request = {
+            "model": getattr(self.generator, "model", type(self.generator).__name__),
+            "system_prompt": getattr(self.generator, "system_prompt", None),
+            "prompt": prompt,
+            "generation_kwargs": {**(getattr(self.generator, "generation_kwargs", None) or {}), **(generation_kwargs or {})},
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / calls if calls else 0.0,
+        }
+
+    @component.output_types(replies=List[str], meta=List[Dict[str, Any]])
+    def run(self, prompt: str, generation_kwargs: Optional[Dict[str, Any]] = None):
+        key = self.key(prompt, generation_kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return {"replies": cached["replies"], "meta": [{**meta, "cache_hit": True} for meta in cached["meta"]]}
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            result = future.result()
+            return {"replies": result["replies"], "meta": [{**meta, "cache_hit": True} for meta in result["meta"]]}
+
+        try:
+            # Another caller may have finished and cached the same request in the meantime
+            result = self.cache.get(key)
+            if result is None:
+                result = self.generator.run(prompt=prompt, generation_kwargs=generation_kwargs)
+                result = {"replies": list(result["replies"]), "meta": list(result.get("meta") or [])}
+                self.cache.put(key, result)
+            future.set_result(result)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return {"replies": result["replies"], "meta": [{**meta, "cache_hit": False} for meta in result["meta"]]}
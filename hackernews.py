@@ -0,0 +1,93 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import httpx
+from haystack import Document, component
+from haystack.components.converters import HTMLToDocument
+from haystack.dataclasses import ByteStream
+
+HACKERNEWS_API_URL = "https://hacker-news.firebaseio.com/v0"
+
+
+def run_coroutine(coroutine):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Already inside an event loop (e.g. a notebook): run on a separate thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+# Fetches the top Hacker News posts concurrently over one pooled keep-alive HTTP client.
+# At most `max_concurrency` requests are in flight and each has its own timeout, so the
+# wall time approaches that of the slowest single fetch. Posts that cannot be fetched
+# are listed in `failures` with their id, url and error instead of being printed.
+@component
+class HackernewsNewestFetcher:
+    def __init__(self, api_url: str = HACKERNEWS_API_URL, max_concurrency: int = 16, timeout: float = 10.0):
+        self.api_url = api_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.converter = HTMLToDocument()
+
+    async def _get(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str) -> httpx.Response:
+        async with semaphore:
+            response = await client.get(url)
+        response.raise_for_status()
+        return response
+
+    async def _fetch_post(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, post_id: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        meta: Dict[str, Any] = {"hn_id": post_id}
+        try:
+            post = (await self._get(client, semaphore, f"{self.api_url}/item/{post_id}.json")).json() or {}
+            meta["title"] = post.get("title")
+            if "url" in post:
+                meta["url"] = post["url"]
+                page = await self._get(client, semaphore, post["url"])
+                meta["content_type"] = page.headers.get("content-type", "text/html").split(";")[0]
+                meta["fetch_seconds"] = time.perf_counter() - start
+                return {"stream": ByteStream(data=page.content, meta=meta), "meta": meta}
+            if "text" in post:
+                meta["fetch_seconds"] = time.perf_counter() - start
+                return {"document": Document(content=post["text"], meta=meta), "meta": meta}
+            meta["error"] = "post has neither url nor text"
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError) as error:
+            meta["error"] = f"{type(error).__name__}: {error}"
+        meta["fetch_seconds"] = time.perf_counter() - start
+        return {"meta": meta}
+
+    async def _fetch(self, top_k: int) -> List[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=True) as client:
+            top_stories = await self._get(client, semaphore, f"{self.api_url}/topstories.json")
+            post_ids = top_stories.json()[0:top_k]
+            return await asyncio.gather(*(self._fetch_post(client, semaphore, post_id) for post_id in post_ids))
+
+    def _to_articles(self, results: List[Dict[str, Any]]):
+        articles = []
+        failures = []
+        for result in results:
+            if "document" in result:
+                articles.append(result["document"])
+            elif "stream" in result:
+                documents = self.converter.run(sources=[result["stream"]])["documents"]
+                if documents:
+                    articles.append(documents[0])
+                else:
+                    failures.append({**result["meta"], "error": "HTML conversion produced no document"})
+            else:
+                failures.append(result["meta"])
+        return {"articles": articles, "failures": failures}
+
+    @component.output_types(articles=List[Document], failures=List[Dict[str, Any]])
+    def run(self, top_k: int):
+        return self._to_articles(run_coroutine(self._fetch(top_k)))
+
+    @component.output_types(articles=List[Document], failures=List[Dict[str, Any]])
+    async def run_async(self, top_k: int):
+        return self._to_articles(await self._fetch(top_k))
@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from haystack import Document, component
+from haystack.dataclasses import ByteStream
+
+from batch_search import documents_by_id
+from hackernews import run_coroutine
+
+
+# Persistent HTTP cache for page ingestion. Bodies are stored once per SHA-256 under
+# `<path>/bodies`, so identical pages behind different URLs share a file; an SQLite index maps
+# every URL to its body hash and validators (ETag, Last-Modified). The documents a page body
+# was converted and embedded into can be stored next to it, keyed on (url, body hash), and are
+# replayed instead of converting and embedding the same body again. The ids of the chunks each
+# URL was last indexed as are kept as well, so they can be deleted once its body changes.
+class HTTPCache:
+    def __init__(self, path: str = "http_cache"):
+        self.path = path
+        os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages "
+            "(url TEXT PRIMARY KEY, sha256 TEXT, etag TEXT, last_modified TEXT, content_type TEXT, fetched REAL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS documents (url TEXT PRIMARY KEY, sha256 TEXT, documents TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (url TEXT PRIMARY KEY, sha256 TEXT, ids TEXT)")
+        self._db.commit()
+
+    def _body_path(self, sha256: str) -> str:
+        return os.path.join(self.path, "bodies", sha256[:2], sha256)
+
+    def entry(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256, etag, last_modified, content_type, fetched FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("sha256", "etag", "last_modified", "content_type", "fetched"), row))
+
+    def has_body(self, sha256: str) -> bool:
+        return os.path.exists(self._body_path(sha256))
+
+    def read_body(self, sha256: str) -> Optional[bytes]:
+        try:
+            with open(self._body_path(sha256), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, url: str, body: bytes, content_type: str, etag: Optional[str], last_modified: Optional[str]) -> str:
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self._body_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, sha256, etag, last_modified, content_type, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, sha256, etag, last_modified, content_type, time.time()),
+            )
+            self._db.commit()
+        return sha256
+
+    # After a 304: the stored body is still current, and the server may have sent new validators
+    def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET fetched = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url),
+            )
+            self._db.commit()
+
+    def documents(self, url: str, sha256: str) -> Optional[List[Document]]:
+        with self._lock:
+            row = self._db.execute("SELECT sha256, documents FROM documents WHERE url = ?", (url,)).fetchone()
+        if row is None or row[0] != sha256:
+            return None
+        return [Document.from_dict(data) for data in json.loads(row[1])]
+
+    def put_documents(self, url: str, sha256: str, documents: List[Document]):
+        data = json.dumps([doc.to_dict() for doc in documents])
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (url, sha256, documents) VALUES (?, ?, ?)", (url, sha256, data)
+            )
+            self._db.commit()
+
+    # {"sha256": body hash, "ids": chunk ids} of the URL's last indexed body, or None
+    def chunk_ids(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT sha256, ids FROM chunks WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {"sha256": row[0], "ids": json.loads(row[1])}
+
+    def put_chunk_ids(self, url: str, sha256: str, ids: List[str]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO chunks (url, sha256, ids) VALUES (?, ?, ?)", (url, sha256, json.dumps(ids))
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (pages,) = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+            (bodies,) = self._db.execute("SELECT COUNT(DISTINCT sha256) FROM pages").fetchone()
+            (recorded,) = self._db.execute("SELECT COUNT(*) FROM documents").fetchone()
+        return {"pages": pages, "bodies": bodies, "recorded_pages": recorded}
+
+
+# Replaces LinkContentFetcher in the indexing pipelines. Every URL is fetched with a conditional
+# GET (If-None-Match / If-Modified-Since from the cache) over one keep-alive client, with at most
+# `max_concurrency` requests in flight and `max_per_host` per host. Only new and changed pages
+# come out as `streams` for the converter; for a page answering 304, or 200 with the same body,
+# the documents recorded by PageDocumentRecorder on an earlier run come out as `documents`
+# (embeddings included) to be joined in front of the writer. With a long-lived document store,
+# set `replay_unchanged=False` and unchanged pages produce nothing at all, so a run costs in
+# proportion to the pages that changed; given that `document_store`, an unchanged page whose
+# chunks are no longer in it (e.g. a fresh in-memory store) is converted again from the cached
+# body. A page that cannot be fetched is listed in `failures`; when it was fetched before and
+# `replay_unchanged` is set, its recorded documents are replayed (`stale` in the failure).
+@component
+class CachedLinkFetcher:
+    def __init__(
+        self,
+        cache: HTTPCache,
+        max_concurrency: int = 32,
+        max_per_host: int = 6,
+        timeout: float = 10.0,
+        replay_unchanged: bool = True,
+        document_store: Any = None,
+        user_agent: str = "haystack/CachedLinkFetcher",
+    ):
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.replay_unchanged = replay_unchanged
+        self.document_store = document_store
+        self.user_agent = user_agent
+
+    async def _fetch_url(self, client: httpx.AsyncClient, semaphores: Dict[str, asyncio.Semaphore], url: str) -> Dict[str, Any]:
+        entry = self.cache.entry(url)
+        headers = {}
+        if entry is not None and self.cache.has_body(entry["sha256"]):
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        host = urlsplit(url).netloc
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        try:
+            # Host slot first, so requests queued behind a busy host do not hold global slots
+            async with semaphores[host], semaphores[""]:
+                response = await client.get(url, headers=headers)
+            if response.status_code == 304 and headers:
+                self.cache.touch(url, response.headers.get("etag"), response.headers.get("last-modified"))
+                return {"url": url, "status": "not_modified", "entry": entry}
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "text/html").split(";")[0]
+            sha256 = self.cache.store(
+                url, response.content, content_type, response.headers.get("etag"), response.headers.get("last-modified")
+            )
+            entry = {"sha256": sha256, "content_type": content_type, "previous": entry["sha256"] if entry else None}
+            status = "unchanged" if entry["previous"] == sha256 else "changed"
+            return {"url": url, "status": status, "entry": entry, "body": response.content}
+        except (httpx.HTTPError, httpx.InvalidURL) as error:
+            return {"url": url, "status": "failed", "entry": entry, "error": f"{type(error).__name__}: {error}"}
+
+    async def _fetch(self, urls: List[str]) -> List[Dict[str, Any]]:
+        semaphores = {"": asyncio.Semaphore(self.max_concurrency)}
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        headers = {"User-Agent": self.user_agent}
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, headers=headers, follow_redirects=True) as client:
+            return await asyncio.gather(*(self._fetch_url(client, semaphores, url) for url in urls))
+
+    def _indexed(self, url: str, sha256: str) -> bool:
+        recorded = self.cache.chunk_ids(url)
+        if recorded is None or recorded["sha256"] != sha256:
+            return False
+        if self.document_store is None:
+            return True
+        return len(documents_by_id(self.document_store, recorded["ids"])) == len(recorded["ids"])
+
+    def _collect(self, results: List[Dict[str, Any]]):
+        streams = []
+        documents = []
+        failures = []
+        stats = {"urls": len(results), "changed": 0, "not_modified": 0, "unchanged": 0, "replayed": 0, "failed": 0}
+        for result in results:
+            url, entry = result["url"], result["entry"]
+            stats[result["status"]] += 1
+            if result["status"] == "failed":
+                failure = {"url": url, "error": result["error"], "stale": False}
+                if entry is not None and self.replay_unchanged:
+                    replayed = self.cache.documents(url, entry["sha256"])
+                    if replayed is not None:
+                        documents.extend(replayed)
+                        failure["stale"] = True
+                failures.append(failure)
+                continue
+            if result["status"] != "changed":
+                if not self.replay_unchanged:
+                    if self._indexed(url, entry["sha256"]):
+                        continue
+                else:
+                    replayed = self.cache.documents(url, entry["sha256"])
+                    if replayed is not None:
+                        documents.extend(replayed)
+                        stats["replayed"] += 1
+                        continue
+            # New or changed, or unchanged but never recorded (e.g. the last run failed before writing)
+            body = result.get("body")
+            if body is None:
+                body = self.cache.read_body(entry["sha256"])
+            meta = {"url": url, "content_type": entry["content_type"], "page_sha256": entry["sha256"]}
+            streams.append(ByteStream(data=body, mime_type=entry["content_type"], meta=meta))
+        return {"streams": streams, "documents": documents, "failures": failures, "stats": stats}
+
+    @component.output_types(
+        streams=List[ByteStream], documents=List[Document], failures=List[Dict[str, Any]], stats=Dict[str, Any]
+    )
+    def run(self, urls: List[str]):
+        return self._collect(run_coroutine(self._fetch(urls)))
+
+    @component.output_types(
+        streams=List[ByteStream], documents=List[Document], failures=List[Dict[str, Any]], stats=Dict[str, Any]
+    )
+    async def run_async(self, urls: List[str]):
+        return self._collect(await self._fetch(urls))
+
+
+# Goes after the embedder: records each page's chunk ids and embedded documents (grouped by
+# the `url` and `page_sha256` meta the converter copies from CachedLinkFetcher's streams), the
+# documents for later replay unless `record_documents` is off. When a page's body changed, the
+# chunks of its previous body that are gone are deleted from `document_store` and `text_index`
+# (a hybrid_retrieval.InvertedIndex), so a long-lived store does not keep serving them.
+@component
+class PageDocumentRecorder:
+    def __init__(self, cache: HTTPCache, document_store: Any = None, text_index: Any = None, record_documents: bool = True):
+        self.cache = cache
+        self.document_store = document_store
+        self.text_index = text_index
+        self.record_documents = record_documents
+
+    @component.output_types(documents=List[Document], documents_deleted=int)
+    def run(self, documents: List[Document]):
+        pages: Dict[tuple, List[Document]] = {}
+        for doc in documents:
+            if doc.meta.get("url") and doc.meta.get("page_sha256"):
+                pages.setdefault((doc.meta["url"], doc.meta["page_sha256"]), []).append(doc)
+        stale_ids: List[str] = []
+        for (url, sha256), page_documents in pages.items():
+            ids = [doc.id for doc in page_documents]
+            previous = self.cache.chunk_ids(url)
+            if previous is not None and previous["sha256"] != sha256:
+                current = set(ids)
+                stale_ids.extend(doc_id for doc_id in previous["ids"] if doc_id not in current)
+            self.cache.put_chunk_ids(url, sha256, ids)
+            if self.record_documents:
+                self.cache.put_documents(url, sha256, page_documents)
+        if stale_ids:
+            if self.document_store is not None:
+                self.document_store.delete_documents(stale_ids)
+            if self.text_index is not None:
+                self.text_index.remove(stale_ids)
+        return {"documents": documents, "documents_deleted": len(stale_ids)}
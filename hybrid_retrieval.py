@@ -0,0 +1,233 @@
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component
+from haystack.document_stores.types import DuplicatePolicy
+
+from batch_search import documents_by_id
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to was what when where which who why will with you".split()
+)
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall((text or "").lower()) if token not in STOPWORDS]
+
+
+# Compact BM25 inverted index maintained at write time. Each term maps to two packed arrays
+# (document rows and term frequencies), so a query only touches the postings of its own
+# terms instead of re-tokenizing the corpus. Overwritten or deleted documents leave dead rows
+# behind until `compact` is called; with a `path` the index is saved by `save` and loaded on start.
+# Given the `document_store` it indexes, an index with no saved file (e.g. a store built before
+# hybrid retrieval was added) is backfilled from the documents the store already holds.
+class InvertedIndex:
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, document_store: Any = None):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._clear()
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                self.__dict__.update(pickle.load(f))
+        elif document_store is not None and document_store.count_documents():
+            self.add(document_store.filter_documents())
+            self.save()
+
+    def _clear(self):
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.row_ids: List[Optional[str]] = []
+        self.lengths = array("f")
+        self.rows: Dict[str, int] = {}
+        self.total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, documents: List[Document]):
+        with self._lock:
+            self.remove([doc.id for doc in documents])
+            for doc in documents:
+                tokens = tokenize(doc.content)
+                row = len(self.row_ids)
+                self.row_ids.append(doc.id)
+                self.lengths.append(len(tokens))
+                self.rows[doc.id] = row
+                self.total_length += len(tokens)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    postings = self.postings.get(token)
+                    if postings is None:
+                        postings = self.postings[token] = (array("i"), array("f"))
+                    postings[0].append(row)
+                    postings[1].append(count)
+
+    def remove(self, document_ids: List[str]):
+        with self._lock:
+            for doc_id in document_ids:
+                row = self.rows.pop(doc_id, None)
+                if row is not None:
+                    self.row_ids[row] = None
+                    self.total_length -= self.lengths[row]
+
+    # Rebuilds the postings without dead rows
+    def compact(self):
+        with self._lock:
+            live = [row for row, doc_id in enumerate(self.row_ids) if doc_id is not None]
+            if len(live) == len(self.row_ids):
+                return
+            new_rows = np.full(len(self.row_ids), -1, dtype=np.int32)
+            new_rows[live] = np.arange(len(live), dtype=np.int32)
+            postings = {}
+            for token, (rows, tfs) in self.postings.items():
+                rows = new_rows[np.frombuffer(rows, dtype=np.int32)]
+                keep = rows >= 0
+                if keep.any():
+                    postings[token] = (array("i", rows[keep].tobytes()), array("f", np.frombuffer(tfs, dtype=np.float32)[keep].tobytes()))
+            self.postings = postings
+            self.row_ids = [self.row_ids[row] for row in live]
+            self.lengths = array("f", np.frombuffer(self.lengths, dtype=np.float32)[live].tobytes())
+            self.rows = {doc_id: row for row, doc_id in enumerate(self.row_ids)}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if len(self.row_ids) > 2 * len(self.rows):
+                self.compact()
+            state = {key: getattr(self, key) for key in ("postings", "row_ids", "lengths", "rows", "total_length")}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+    # Returns [(document id, score, number of query terms the document contains)], best first
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float, int]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            count = len(self.rows)
+            if not terms or count == 0:
+                return []
+            lengths = np.frombuffer(self.lengths, dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths / (self.total_length / count or 1.0))
+            scores = np.zeros(len(self.row_ids), dtype=np.float32)
+            matched = np.zeros(len(self.row_ids), dtype=np.int16)
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                rows = np.frombuffer(postings[0], dtype=np.int32)
+                tfs = np.frombuffer(postings[1], dtype=np.float32)
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+                matched[rows] += 1
+            hits = np.flatnonzero(matched)
+            hits = hits[np.array([self.row_ids[row] is not None for row in hits], dtype=bool)]
+            if len(hits) > top_k:
+                hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            return [(self.row_ids[row], float(scores[row]), int(matched[row])) for row in hits]
+
+
+# Drop-in for DocumentWriter that also adds the written documents to an InvertedIndex. The index
+# is not saved here, as every save rewrites the whole file: call text_index.save() once per ingest.
+@component
+class HybridDocumentWriter:
+    def __init__(self, document_store: Any, text_index: InvertedIndex, policy: DuplicatePolicy = DuplicatePolicy.NONE):
+        self.document_store = document_store
+        self.text_index = text_index
+        self.policy = policy
+
+    @component.output_types(documents_written=int)
+    def run(self, documents: List[Document], policy: Optional[DuplicatePolicy] = None):
+        written = self.document_store.write_documents(documents=documents, policy=policy or self.policy)
+        self.text_index.add(documents)
+        return {"documents_written": written}
+
+
+# BM25 + embedding retrieval fused with reciprocal rank fusion. BM25 candidates come from the
+# InvertedIndex; the query is embedded only when lexical retrieval is not conclusive, i.e.
+# unless the best BM25 hit contains every query term and outscores the runner-up by
+# `skip_embedding_ratio`. Set skip_embedding_ratio=None to always run both retrievers.
+# A `query_embedding` computed upstream (e.g. for an answer cache) is used instead of the text_embedder.
+@component
+class HybridRetriever:
+    def __init__(
+        self,
+        document_store: Any,
+        text_index: InvertedIndex,
+        text_embedder: Any,
+        embedding_retriever: Any,
+        top_k: int = 10,
+        rrf_k: int = 60,
+        skip_embedding_ratio: Optional[float] = 2.0,
+    ):
+        if top_k <= 0:
+            raise ValueError(f"top_k must be greater than 0, but got {top_k}")
+        self.document_store = document_store
+        self.text_index = text_index
+        self.text_embedder = text_embedder
+        self.embedding_retriever = embedding_retriever
+        self.top_k = top_k
+        self.rrf_k = rrf_k
+        self.skip_embedding_ratio = skip_embedding_ratio
+        self.queries = 0
+        self.embeddings_skipped = 0
+
+    def warm_up(self):
+        if hasattr(self.text_embedder, "warm_up"):
+            self.text_embedder.warm_up()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queries": self.queries,
+            "embeddings_skipped": self.embeddings_skipped,
+            "skip_rate": self.embeddings_skipped / self.queries if self.queries else 0.0,
+        }
+
+    def _lexically_confident(self, query: str, hits: List[Tuple[str, float, int]]) -> bool:
+        if self.skip_embedding_ratio is None or not hits:
+            return False
+        terms = set(tokenize(query))
+        if hits[0][2] < len(terms):
+            return False
+        return len(hits) == 1 or hits[0][1] >= self.skip_embedding_ratio * hits[1][1]
+
+    @component.output_types(documents=List[Document], embedding_skipped=bool)
+    def run(self, query: str, top_k: Optional[int] = None, query_embedding: Optional[List[float]] = None):
+        top_k = self.top_k if top_k is None else top_k
+        self.queries += 1
+        lexical = self.text_index.search(query, top_k=top_k)
+        # Ids still in the index but already deleted from the store are dropped here
+        found = {doc.id: doc for doc in documents_by_id(self.document_store, [doc_id for doc_id, _, _ in lexical])}
+        lexical = [hit for hit in lexical if hit[0] in found]
+
+        rankings = [[doc_id for doc_id, _, _ in lexical]]
+        embedding_skipped = self._lexically_confident(query, lexical)
+        if embedding_skipped:
+            self.embeddings_skipped += 1
+        else:
+            embedding = query_embedding if query_embedding is not None else self.text_embedder.run(text=query)["embedding"]
+            semantic = self.embedding_retriever.run(query_embedding=embedding, top_k=top_k)["documents"]
+            for doc in semantic:
+                found.setdefault(doc.id, doc)
+            rankings.append([doc.id for doc in semantic])
+
+        fused: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        documents = [replace(found[doc_id], score=score) for doc_id, score in ranked]
+        return {"documents": documents, "embedding_skipped": embedding_skipped}
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, Optional
+
+from haystack import Document, component
+from haystack.document_stores.types import DuplicatePolicy
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def empty_pending() -> Dict[str, Any]:
+    return {"changed": {}, "unchanged": {}, "deleted": [], "reused": [], "chunks": {}}
+
+
+# Per-file fingerprints (mtime, size, content hash) and the chunks each file produced.
+# Changes detected during a run are kept in `pending` and only saved by `commit`,
+# so a run that fails halfway is simply detected again next time.
+class IndexManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f)["files"]
+        self.pending: Dict[str, Any] = empty_pending()
+        self.lock = threading.RLock()
+
+    def known_chunk_hashes(self, source_path: str) -> Dict[str, str]:
+        return {content_hash: chunk_id for chunk_id, content_hash in self.files.get(source_path, {}).get("chunks", {}).items()}
+
+    def take_reused(self) -> List[Document]:
+        with self.lock:
+            reused, self.pending["reused"] = self.pending["reused"], []
+        return reused
+
+    # Without `source_paths` everything pending is saved, including deletions. With it only
+    # those files are saved, which lets streaming ingestion commit micro-batch by micro-batch.
+    # Returns the ids of the chunks that were deleted from the document store.
+    def commit(self, document_store, source_paths: Optional[Iterable[str]] = None) -> List[str]:
+        with self.lock:
+            pending = self.pending
+            stale_ids = []
+            if source_paths is None:
+                source_paths = list(pending["changed"])
+                for source_path in pending["deleted"]:
+                    stale_ids.extend(self.files.pop(source_path, {}).get("chunks", {}))
+                self.pending = empty_pending()
+            for source_path in source_paths:
+                fingerprint = pending["changed"].pop(source_path, None)
+                if fingerprint is None:
+                    continue
+                old_chunks = self.files.get(source_path, {}).get("chunks", {})
+                new_chunks = pending["chunks"].pop(source_path, {})
+                stale_ids.extend(chunk_id for chunk_id in old_chunks if chunk_id not in new_chunks)
+                self.files[source_path] = {**fingerprint, "chunks": new_chunks}
+            for source_path, fingerprint in pending["unchanged"].items():
+                self.files[source_path].update(fingerprint)
+            pending["unchanged"] = {}
+            if stale_ids:
+                document_store.delete_documents(stale_ids)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"files": self.files}, f)
+            os.replace(tmp_path, self.path)
+            return stale_ids
+
+
+# Passes on only new or modified files. mtime and size are checked first and the
+# content hash is computed only when they differ from the manifest.
+@component
+class FileChangeDetector:
+    def __init__(self, manifest: IndexManifest):
+        self.manifest = manifest
+        self._seen = set()
+
+    # Returns the absolute path if the file is new or modified, otherwise None
+    def check(self, source: str) -> Optional[str]:
+        source_path = os.path.abspath(source)
+        self._seen.add(source_path)
+        stat = os.stat(source_path)
+        fingerprint = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+        known = self.manifest.files.get(source_path)
+        if known and known["mtime"] == fingerprint["mtime"] and known["size"] == fingerprint["size"]:
+            return None
+        fingerprint["sha256"] = file_sha256(source_path)
+        with self.manifest.lock:
+            if known and known["sha256"] == fingerprint["sha256"]:
+                self.manifest.pending["unchanged"][source_path] = fingerprint
+                return None
+            self.manifest.pending["changed"][source_path] = fingerprint
+        return source_path
+
+    # Called once every source has been checked: files in the manifest that were not seen are deleted
+    def finish(self):
+        with self.manifest.lock:
+            self.manifest.pending["deleted"] = [path for path in self.manifest.files if path not in self._seen]
+        self._seen = set()
+
+    @component.output_types(sources=List[str], meta=List[Dict[str, Any]])
+    def run(self, sources: List[str]):
+        changed = [source_path for source_path in map(self.check, sources) if source_path is not None]
+        self.finish()
+        return {"sources": changed, "meta": [{"source_path": source_path} for source_path in changed]}
+
+
+# Sits between the splitter and the embedder. Chunks whose content hash already exists
+# for the same file keep their stored embedding and bypass the embedder.
+@component
+class ChunkEmbeddingReuser:
+    def __init__(self, manifest: IndexManifest, document_store):
+        self.manifest = manifest
+        self.document_store = document_store
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        hashes = [chunk_sha256(doc.content) for doc in documents]
+        known = {}
+        reusable = {}
+        for i, doc in enumerate(documents):
+            source_path = doc.meta["source_path"]
+            if source_path not in known:
+                known[source_path] = self.manifest.known_chunk_hashes(source_path)
+            if hashes[i] in known[source_path]:
+                reusable[i] = known[source_path][hashes[i]]
+
+        stored = {}
+        if reusable and hasattr(self.document_store, "get_documents"):
+            stored = {doc.id: doc for doc in self.document_store.get_documents(list(reusable.values()), return_embedding=True)}
+        elif reusable:
+            filters = {"field": "id", "operator": "in", "value": list(reusable.values())}
+            stored = {doc.id: doc for doc in self.document_store.filter_documents(filters=filters)}
+
+        to_embed = []
+        with self.manifest.lock:
+            pending = self.manifest.pending
+            for i, doc in enumerate(documents):
+                doc = replace(doc, meta={**doc.meta, "content_hash": hashes[i]})
+                pending["chunks"].setdefault(doc.meta["source_path"], {})[doc.id] = hashes[i]
+                old = stored.get(reusable.get(i))
+                if old is not None and old.embedding is not None:
+                    pending["reused"].append(replace(doc, embedding=old.embedding))
+                else:
+                    to_embed.append(doc)
+        return {"documents": to_embed}
+
+
+# Replaces DocumentWriter in incremental mode: writes freshly embedded and reused chunks,
+# removes chunks of deleted or rewritten files and saves the manifest. An optional text
+# index (hybrid_retrieval.InvertedIndex) is kept in step with the document store.
+@component
+class IncrementalDocumentWriter:
+    def __init__(self, manifest: IndexManifest, document_store, text_index: Any = None):
+        self.manifest = manifest
+        self.document_store = document_store
+        self.text_index = text_index
+
+    @component.output_types(documents_written=int, documents_skipped=int)
+    def run(self, documents: List[Document]):
+        documents = documents + self.manifest.take_reused()
+        written = self.document_store.write_documents(documents, policy=DuplicatePolicy.OVERWRITE) if documents else 0
+        skipped = sum(len(entry.get("chunks", {})) for path, entry in self.manifest.files.items()
+                      if path not in self.manifest.pending["changed"] and path not in self.manifest.pending["deleted"])
+        stale_ids = self.manifest.commit(self.document_store)
+        if self.text_index is not None:
+            self.text_index.remove(stale_ids)
+            self.text_index.add(documents)
+            self.text_index.save()
+        return {"documents_written": written, "documents_skipped": skipped}
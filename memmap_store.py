@@ -0,0 +1,321 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component, default_from_dict, default_to_dict
+from haystack.document_stores.errors import DuplicateDocumentError
+from haystack.document_stores.types import DuplicatePolicy
+from haystack.utils.filters import document_matches_filter
+
+from ann_index import IVFIndex
+
+EMBEDDINGS_FILE = "embeddings.f32"
+DOCUMENTS_FILE = "documents.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+
+# Document store kept on disk: a contiguous float32 embedding matrix that is memory-mapped
+# read-only (so several processes share one copy in the page cache) plus an append-only
+# JSON lines sidecar holding ids, content and meta. A single process is expected to write.
+class MemmapDocumentStore:
+    def __init__(self, path: str, embedding_similarity_function: str = "dot_product"):
+        if embedding_similarity_function not in {"dot_product", "cosine"}:
+            raise ValueError("embedding_similarity_function must be 'dot_product' or 'cosine'")
+        self.path = path
+        self.embedding_similarity_function = embedding_similarity_function
+        os.makedirs(path, exist_ok=True)
+
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._row_ids: List[Optional[str]] = []
+        self._log_offset = 0
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        self._live: Optional[np.ndarray] = None
+        self._ann: Optional[IVFIndex] = None
+        self._ann_rows = 0
+        self._load_manifest()
+        self._sync()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load_manifest(self):
+        if os.path.exists(self._file(MANIFEST_FILE)):
+            with open(self._file(MANIFEST_FILE), encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+
+    def _save_manifest(self):
+        with open(self._file(MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim}, f)
+
+    # Replay any sidecar lines appended since the last read, so readers in other
+    # processes pick up writes without reopening the store.
+    def _sync(self):
+        log_path = self._file(DOCUMENTS_FILE)
+        if not os.path.exists(log_path) or os.path.getsize(log_path) == self._log_offset:
+            return
+        with open(log_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._log_offset += len(line)
+                self._apply(json.loads(line))
+        if self._dim is None:
+            self._load_manifest()
+        self._matrix = None
+
+    def _apply(self, record: Dict[str, Any]):
+        self._live = None
+        previous = self._records.pop(record["id"], None)
+        if previous is not None and previous.get("row") is not None:
+            self._row_ids[previous["row"]] = None
+        if record.get("deleted"):
+            return
+        row = record.get("row")
+        if row is not None:
+            self._row_ids.extend([None] * (row + 1 - len(self._row_ids)))
+            self._row_ids[row] = record["id"]
+        self._records[record["id"]] = record
+
+    # Rows physically present in the matrix file; can exceed the sidecar after an interrupted write
+    def _file_rows(self) -> int:
+        if self._dim is None or not os.path.exists(self._file(EMBEDDINGS_FILE)):
+            return 0
+        return os.path.getsize(self._file(EMBEDDINGS_FILE)) // (4 * self._dim)
+
+    def _embeddings(self) -> np.ndarray:
+        rows = len(self._row_ids)
+        if rows == 0 or self._dim is None:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(self._file(EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._matrix
+
+    # Candidate rows from an IVF index over the matrix, built lazily and extended with
+    # rows appended since the last query (rows are never rewritten outside compact()).
+    def _ann_candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        embeddings = self._embeddings()
+        if self._ann is None:
+            self._ann = IVFIndex()
+            self._ann_rows = 0
+        if embeddings.shape[0] > self._ann_rows:
+            self._ann.add(embeddings, list(range(self._ann_rows, embeddings.shape[0])))
+            self._ann_rows = embeddings.shape[0]
+        return np.sort(self._ann.candidates(query, nprobe))
+
+    def _to_document(self, record: Dict[str, Any], return_embedding: bool = True, score: Optional[float] = None) -> Document:
+        embedding = None
+        if return_embedding and record.get("row") is not None:
+            embedding = self._embeddings()[record["row"]].tolist()
+        return Document(id=record["id"], content=record.get("content"), meta=record.get("meta", {}), embedding=embedding, score=score)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return default_to_dict(self, path=self.path, embedding_similarity_function=self.embedding_similarity_function)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MemmapDocumentStore":
+        return default_from_dict(cls, data)
+
+    # The raw matrix (not normalized) and the document id of each row, None for deleted rows
+    def embedding_matrix(self) -> Tuple[np.ndarray, List[Optional[str]]]:
+        self._sync()
+        return self._embeddings(), list(self._row_ids)
+
+    def get_documents(self, document_ids: List[str], return_embedding: bool = False) -> List[Document]:
+        self._sync()
+        return [self._to_document(self._records[doc_id], return_embedding) for doc_id in document_ids if doc_id in self._records]
+
+    def count_documents(self) -> int:
+        self._sync()
+        return len(self._records)
+
+    def filter_documents(self, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        self._sync()
+        documents = [self._to_document(record) for record in self._records.values()]
+        if filters:
+            documents = [doc for doc in documents if document_matches_filter(filters=filters, document=doc)]
+        return documents
+
+    def write_documents(self, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.NONE) -> int:
+        if not isinstance(documents, list) or any(not isinstance(doc, Document) for doc in documents):
+            raise ValueError("Please provide a list of Documents.")
+        if policy == DuplicatePolicy.NONE:
+            policy = DuplicatePolicy.FAIL
+        self._sync()
+
+        records = []
+        vectors = []
+        seen = set()
+        next_row = self._file_rows()
+        for doc in documents:
+            if doc.id in self._records or doc.id in seen:
+                if policy == DuplicatePolicy.FAIL:
+                    raise DuplicateDocumentError(f"ID '{doc.id}' already exists.")
+                if policy == DuplicatePolicy.SKIP:
+                    continue
+            seen.add(doc.id)
+            record = {"id": doc.id, "content": doc.content, "meta": doc.meta}
+            if doc.embedding is not None:
+                if self._dim is None:
+                    self._dim = len(doc.embedding)
+                    self._save_manifest()
+                if len(doc.embedding) != self._dim:
+                    raise ValueError(f"Embedding of document '{doc.id}' has {len(doc.embedding)} dimensions, expected {self._dim}")
+                record["row"] = next_row
+                next_row += 1
+                vectors.append(doc.embedding)
+            records.append(record)
+
+        # Embeddings go to disk before the sidecar lines that point at them
+        if vectors:
+            with open(self._file(EMBEDDINGS_FILE), "ab") as f:
+                f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+        with open(self._file(DOCUMENTS_FILE), "ab") as f:
+            for record in records:
+                f.write(json.dumps(record).encode("utf-8") + b"\n")
+        self._sync()
+        return len(records)
+
+    def delete_documents(self, document_ids: List[str]) -> None:
+        self._sync()
+        lines = [json.dumps({"id": doc_id, "deleted": True}) for doc_id in document_ids if doc_id in self._records]
+        if not lines:
+            return
+        with open(self._file(DOCUMENTS_FILE), "ab") as f:
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._sync()
+
+    # Rewrite both files without deleted or overwritten rows. Other processes must reopen the store afterwards.
+    def compact(self):
+        self._sync()
+        live = list(self._records.values())
+        embeddings = self._embeddings()
+        vectors = []
+        for record in live:
+            if record.get("row") is not None:
+                vectors.append(np.array(embeddings[record["row"]]))
+                record["row"] = len(vectors) - 1
+        self._matrix = None
+
+        tmp_embeddings = self._file(EMBEDDINGS_FILE + ".tmp")
+        tmp_documents = self._file(DOCUMENTS_FILE + ".tmp")
+        with open(tmp_embeddings, "wb") as f:
+            if vectors:
+                f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+        with open(tmp_documents, "wb") as f:
+            for record in live:
+                f.write(json.dumps(record).encode("utf-8") + b"\n")
+        os.replace(tmp_embeddings, self._file(EMBEDDINGS_FILE))
+        os.replace(tmp_documents, self._file(DOCUMENTS_FILE))
+
+        self._records = {}
+        self._row_ids = []
+        self._log_offset = 0
+        self._ann = None
+        self._sync()
+
+    def embedding_retrieval(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = False,
+        return_embedding: bool = False,
+        nprobe: Optional[int] = None,
+    ) -> List[Document]:
+        if len(query_embedding) == 0:
+            raise ValueError("query_embedding should be a non-empty list of floats.")
+        self._sync()
+        embeddings = self._embeddings()
+        if embeddings.shape[0] == 0 or top_k == 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self._live is None:
+            self._live = np.array([doc_id is not None for doc_id in self._row_ids], dtype=bool)
+        live = self._live
+        if filters:
+            live = live.copy()
+            for row, doc_id in enumerate(self._row_ids):
+                if doc_id is not None and not document_matches_filter(filters, self._to_document(self._records[doc_id], False)):
+                    live[row] = False
+
+        # Filtered queries always get the exact scan
+        if nprobe and not filters:
+            candidates = self._ann_candidates(query, nprobe)
+            candidates = candidates[live[candidates]]
+        else:
+            candidates = np.flatnonzero(live)
+        vectors = embeddings[candidates]
+        scores = vectors @ query
+        if self.embedding_similarity_function == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            scores = np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+
+        order = np.arange(len(candidates))
+        if len(candidates) > top_k:
+            order = np.argpartition(-scores, top_k - 1)[:top_k]
+        order = order[np.argsort(-scores[order])]
+
+        documents = []
+        for row, score in zip(candidates[order], scores[order]):
+            score = float(score)
+            if scale_score:
+                if self.embedding_similarity_function == "cosine":
+                    score = (score + 1) / 2
+                else:
+                    score = float(1 / (1 + np.exp(-score / 100)))
+            documents.append(self._to_document(self._records[self._row_ids[row]], return_embedding, score))
+        return documents
+
+
+@component
+class MemmapEmbeddingRetriever:
+    def __init__(
+        self,
+        document_store: MemmapDocumentStore,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        nprobe: Optional[int] = None,
+    ):
+        if not isinstance(document_store, MemmapDocumentStore):
+            raise TypeError("document_store must be an instance of MemmapDocumentStore")
+        if top_k <= 0:
+            raise ValueError(f"top_k must be greater than 0, but got {top_k}")
+        self.document_store = document_store
+        self.filters = filters
+        self.top_k = top_k
+        self.nprobe = nprobe
+
+    def to_dict(self) -> Dict[str, Any]:
+        return default_to_dict(
+            self, document_store=self.document_store.to_dict(), filters=self.filters, top_k=self.top_k, nprobe=self.nprobe
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MemmapEmbeddingRetriever":
+        init_params = data["init_parameters"]
+        init_params["document_store"] = MemmapDocumentStore.from_dict(init_params["document_store"])
+        return default_from_dict(cls, data)
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+        scale_score: bool = False,
+        return_embedding: bool = False,
+        nprobe: Optional[int] = None,
+    ):
+        documents = self.document_store.embedding_retrieval(
+            query_embedding=query_embedding,
+            filters=filters or self.filters,
+            top_k=self.top_k if top_k is None else top_k,
+            scale_score=scale_score,
+            return_embedding=return_embedding,
+            nprobe=nprobe or self.nprobe,
+        )
+        return {"documents": documents}
@@ -0,0 +1,275 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Dynamically quantized weights published next to the ONNX export on the Hub; AVX2 runs on any
+# recent x86 CPU, set EMBEDDING_ONNX_INT8_FILE to e.g. onnx/model_qint8_avx512_vnni.onnx on servers
+ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+# Name the embedding cache keys on: ONNX and int8 vectors differ slightly from the PyTorch ones
+def variant_name(model: str, backend: str = "torch") -> str:
+    return model if backend == "torch" else f"{model}:{backend}"
+
+
+def load_sentence_transformer(model: str, backend: str = "torch", device: Optional[str] = None) -> Any:
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, but got {backend!r}")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model, device=device)
+    # Needs sentence-transformers>=3.2 with the ONNX extra: pip install "sentence-transformers[onnx]"
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(f'The {backend} backend needs onnxruntime: pip install "sentence-transformers[onnx]"') from e
+    model_kwargs = {"file_name": ONNX_INT8_FILE} if backend == "onnx-int8" else None
+    return SentenceTransformer(model, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+class _EncodeRequest:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.taken = 0
+        self.parts: List[np.ndarray] = []
+        self.future: Future = Future()
+
+
+# Merges concurrent encode requests into one forward pass. A single worker thread owns the
+# model, so callers never run it concurrently: it takes the first waiting request, waits up to
+# `max_wait_ms` for more to arrive while the batch has room, then encodes up to
+# `max_batch_size` texts in one call of `encode` and hands each caller its rows. Requests are
+# served in arrival order, but one larger than the room left (a list of documents) only gives
+# a slice to each batch and goes back in the queue once that slice is encoded, behind the
+# queries that arrived meanwhile, which are thus encoded between its slices and not after all of it.
+class MicroBatcher:
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        if max_batch_size <= 0:
+            raise ValueError(f"max_batch_size must be greater than 0, but got {max_batch_size}")
+        self.encode_batch = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "deque[_EncodeRequest]" = deque()
+        self._waiting_texts = 0
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        request = _EncodeRequest(texts)
+        with self._condition:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="micro-batcher", daemon=True)
+                self._worker.start()
+            self._queue.append(request)
+            self._waiting_texts += len(texts)
+            self._condition.notify()
+        return request.future.result()
+
+    # Returns (request, start, end) for each slice of a request in the next batch
+    def _take(self) -> List[Tuple[_EncodeRequest, int, int]]:
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = time.monotonic() + self.max_wait
+            while self._waiting_texts < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            taken = []
+            room = self.max_batch_size
+            while self._queue and room:
+                request = self._queue.popleft()
+                start = request.taken
+                request.taken = min(len(request.texts), start + room)
+                taken.append((request, start, request.taken))
+                room -= request.taken - start
+            self._waiting_texts -= self.max_batch_size - room
+            return taken
+
+    def _work(self):
+        while True:
+            taken = self._take()
+            texts = [text for request, start, end in taken for text in request.texts[start:end]]
+            try:
+                vectors = np.asarray(self.encode_batch(texts), dtype=np.float32)
+            except Exception as e:
+                with self._condition:
+                    self._waiting_texts -= sum(len(request.texts) - end for request, _, end in taken)
+                for request, _, _ in taken:
+                    request.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            self.largest_batch = max(self.largest_batch, len(texts))
+            offset = 0
+            for request, start, end in taken:
+                request.parts.append(vectors[offset : offset + end - start])
+                offset += end - start
+                if end == len(request.texts):
+                    parts = request.parts
+                    request.future.set_result(parts[0] if len(parts) == 1 else np.concatenate(parts))
+            with self._condition:
+                self._queue.extend(request for request, _, end in taken if end < len(request.texts))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+
+class PooledModel:
+    def __init__(self, name: str, model: Any, batcher: MicroBatcher):
+        self.name = name
+        self.model = model
+        self.batcher = batcher
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = False) -> np.ndarray:
+        vectors = self.batcher.encode(texts)
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1)
+        return vectors
+
+
+# Process-wide registry: each (model, backend, device) is loaded once and shared by every pooled
+# embedder, with one MicroBatcher in front of it. `loader` returns an object with the
+# SentenceTransformer `encode` signature.
+class ModelPool:
+    def __init__(
+        self,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        loader: Callable[[str, str, Optional[str]], Any] = load_sentence_transformer,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.loader = loader
+        self._models: Dict[Tuple[str, str, Optional[str]], PooledModel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str, backend: str = "torch", device: Optional[str] = None) -> PooledModel:
+        key = (model, backend, device)
+        with self._lock:
+            if key not in self._models:
+                loaded = self.loader(model, backend, device)
+                batcher = MicroBatcher(
+                    lambda texts: loaded.encode(
+                        texts, batch_size=self.max_batch_size, convert_to_numpy=True, show_progress_bar=False
+                    ),
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                )
+                self._models[key] = PooledModel(variant_name(model, backend), loaded, batcher)
+            return self._models[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {pooled.name: pooled.batcher.stats() for pooled in self._models.values()}
+
+
+model_pool = ModelPool(
+    max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH", "32")),
+    max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")),
+)
+
+
+# Drop-in for SentenceTransformersTextEmbedder backed by the shared pool: concurrent queries
+# (service threads, parallel pipelines) are encoded together instead of one forward pass each
+@component
+class PooledTextEmbedder:
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        backend: Optional[str] = None,
+        device: Optional[str] = None,
+        prefix: str = "",
+        suffix: str = "",
+        normalize_embeddings: bool = False,
+        pool: Optional[ModelPool] = None,
+    ):
+        backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}, but got {backend!r}")
+        self.model = variant_name(model, backend)
+        self.model_id = model
+        self.backend = backend
+        self.device = device
+        self.prefix = prefix
+        self.suffix = suffix
+        self.normalize_embeddings = normalize_embeddings
+        self.pool = pool or model_pool
+        self._pooled: Optional[PooledModel] = None
+
+    def warm_up(self):
+        if self._pooled is None:
+            self._pooled = self.pool.get(self.model_id, self.backend, self.device)
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    def run(self, text: str):
+        self.warm_up()
+        vector = self._pooled.encode([self.prefix + text + self.suffix], self.normalize_embeddings)[0]
+        return {"embedding": vector.tolist(), "meta": {"model": self.model}}
+
+
+# Drop-in for SentenceTransformersDocumentEmbedder backed by the shared pool
+@component
+class PooledDocumentEmbedder:
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        backend: Optional[str] = None,
+        device: Optional[str] = None,
+        prefix: str = "",
+        suffix: str = "",
+        normalize_embeddings: bool = False,
+        meta_fields_to_embed: Optional[List[str]] = None,
+        embedding_separator: str = "\n",
+        pool: Optional[ModelPool] = None,
+    ):
+        backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}, but got {backend!r}")
+        self.model = variant_name(model, backend)
+        self.model_id = model
+        self.backend = backend
+        self.device = device
+        self.prefix = prefix
+        self.suffix = suffix
+        self.normalize_embeddings = normalize_embeddings
+        self.meta_fields_to_embed = meta_fields_to_embed or []
+        self.embedding_separator = embedding_separator
+        self.pool = pool or model_pool
+        self._pooled: Optional[PooledModel] = None
+
+    def warm_up(self):
+        if self._pooled is None:
+            self._pooled = self.pool.get(self.model_id, self.backend, self.device)
+
+    def _text_to_embed(self, doc: Document) -> str:
+        values = [str(doc.meta[field]) for field in self.meta_fields_to_embed if doc.meta.get(field) is not None]
+        return self.prefix + self.embedding_separator.join(values + [doc.content or ""]) + self.suffix
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        self.warm_up()
+        vectors = self._pooled.encode([self._text_to_embed(doc) for doc in documents], self.normalize_embeddings)
+        documents = [replace(doc, embedding=vector.tolist()) for doc, vector in zip(documents, vectors)]
+        return {"documents": documents, "meta": {"model": self.model}}
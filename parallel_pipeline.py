@@ -0,0 +1,168 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import networkx
+from haystack import Pipeline
+
+from hackernews import run_coroutine
+
+
+# Runs a Pipeline's components as soon as their inputs are ready, independent branches at the
+# same time on a pool of `max_workers` threads, so a run takes as long as the graph's critical
+# path instead of the sum of its components. Components with a `run_async` coroutine (the
+# fetchers) run on the event loop instead of a thread. Outputs are routed like Pipeline.run:
+# a component runs once every component upstream of it has finished, unless one of its
+# mandatory inputs is missing or none of its connected inputs received anything (the branch
+# not taken after a router or an answer-cache hit), in which case it is skipped along with
+# everything that depends only on it. Unconnected outputs are returned per component.
+# Pipelines with loops ("Chat agent.py", the self-reflecting agent) depend on Pipeline.run's
+# visit order and are handed to it unchanged, on the pool, so `run_async` still never blocks
+# the event loop. Components must not modify their inputs in place, as several of them may
+# receive the same object at once.
+class ParallelPipelineRunner:
+    def __init__(self, pipeline: Pipeline, max_workers: Optional[int] = None):
+        self.pipeline = pipeline
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.acyclic = networkx.is_directed_acyclic_graph(pipeline.graph)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._warmed_up = False
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+        return self._executor
+
+    def close(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    # Accepts both {"component": {"input": value}} and the flat {"input": value} form, which
+    # goes to every component with an unconnected input of that name
+    def _initial_inputs(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        graph = self.pipeline.graph
+        inputs: Dict[str, Dict[str, Any]] = {name: {} for name in graph.nodes}
+        nested = bool(data) and all(isinstance(value, dict) for value in data.values())
+        if nested:
+            for key in data:
+                if key not in graph.nodes:
+                    raise ValueError(f"Component named {key} not found in the pipeline.")
+            items = [(name, socket, value) for name, values in data.items() for socket, value in values.items()]
+        else:
+            items = [
+                (name, socket, value)
+                for socket, value in data.items()
+                for name in graph.nodes
+                if socket in graph.nodes[name]["input_sockets"] and not graph.nodes[name]["input_sockets"][socket].senders
+            ]
+        for name, socket, value in items:
+            sockets = graph.nodes[name]["input_sockets"]
+            if socket not in sockets:
+                raise ValueError(f"Input {socket} not found in component {name}.")
+            inputs[name][socket] = [value] if sockets[socket].is_variadic else value
+        return inputs
+
+    def _ready_inputs(self, name: str, inputs: Dict[str, Any], received: Set[str]) -> Optional[Dict[str, Any]]:
+        sockets = self.pipeline.graph.nodes[name]["input_sockets"]
+        for socket_name, socket in sockets.items():
+            if socket.is_mandatory and socket_name not in inputs:
+                return None
+        if any(socket.senders for socket in sockets.values()) and not received:
+            return None
+        return inputs
+
+    async def _call(self, name: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        instance = self.pipeline.graph.nodes[name]["instance"]
+        run_async = getattr(instance, "run_async", None)
+        if run_async is not None and asyncio.iscoroutinefunction(run_async):
+            return await run_async(**inputs)
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, lambda: context.run(instance.run, **inputs))
+
+    async def run_async(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        if not self.acyclic:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, lambda: context.run(self.pipeline.run, data))
+        if not self._warmed_up:
+            self.pipeline.warm_up()
+            self._warmed_up = True
+
+        graph = self.pipeline.graph
+        inputs = self._initial_inputs(data)
+        received: Dict[str, Set[str]] = {name: set() for name in graph.nodes}
+        waiting = {name: len(set(graph.predecessors(name))) for name in graph.nodes}
+        results: Dict[str, Dict[str, Any]] = {}
+        running: Dict[asyncio.Future, str] = {}
+        finished: List[str] = [name for name, count in waiting.items() if count == 0]
+
+        def settle(name: str, outputs: Optional[Dict[str, Any]]):
+            # Routes the outputs of a finished (or skipped, without outputs) component downstream
+            unconnected = dict(outputs or {})
+            for _, receiver, edge in graph.out_edges(name, data=True):
+                sender_socket, receiver_socket = edge["from_socket"].name, edge["to_socket"]
+                unconnected.pop(sender_socket, None)
+                if outputs is not None and sender_socket in outputs:
+                    value = outputs[sender_socket]
+                    if receiver_socket.is_variadic:
+                        inputs[receiver].setdefault(receiver_socket.name, []).append(value)
+                    else:
+                        inputs[receiver][receiver_socket.name] = value
+                    received[receiver].add(receiver_socket.name)
+            if unconnected:
+                results[name] = unconnected
+            for receiver in set(graph.successors(name)):
+                waiting[receiver] -= 1
+                if waiting[receiver] == 0:
+                    finished.append(receiver)
+
+        while finished or running:
+            while finished:
+                name = finished.pop()
+                ready = self._ready_inputs(name, inputs[name], received[name])
+                if ready is None:
+                    settle(name, None)
+                else:
+                    running[asyncio.ensure_future(self._call(name, ready))] = name
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    outputs = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                if not isinstance(outputs, dict):
+                    raise TypeError(f"Component '{name}' didn't return a dictionary.")
+                settle(name, outputs)
+        return results
+
+    def run(self, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        return run_coroutine(self.run_async(data))
+
+
+# Runs independent pipelines (e.g. the same question through two RAG variants) at the same
+# time; returns their results in order
+async def run_pipelines_async(
+    jobs: List[Tuple[Pipeline, Dict[str, Any]]], max_workers: Optional[int] = None
+) -> List[Dict[str, Dict[str, Any]]]:
+    runners = [ParallelPipelineRunner(pipeline, max_workers=max_workers) for pipeline, _ in jobs]
+    try:
+        return list(await asyncio.gather(*(runner.run_async(data) for runner, (_, data) in zip(runners, jobs))))
+    finally:
+        for runner in runners:
+            runner.close(wait=False)
+
+
+def run_pipelines(
+    jobs: List[Tuple[Pipeline, Dict[str, Any]]], max_workers: Optional[int] = None
+) -> List[Dict[str, Dict[str, Any]]]:
+    return run_coroutine(run_pipelines_async(jobs, max_workers=max_workers))
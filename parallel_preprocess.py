@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional
+
+from haystack import Document, component
+
+_worker_stages = None
+
+
+def _init_worker(converter: Any, splitter: Any):
+    global _worker_stages
+    for stage in (converter, splitter):
+        if stage is not None and hasattr(stage, "warm_up"):
+            stage.warm_up()
+    _worker_stages = (converter, splitter)
+
+
+def _convert_split(converter: Any, splitter: Any, sources: List[Any], meta: Optional[List[Dict[str, Any]]]) -> List[Document]:
+    documents = converter.run(sources=sources, meta=meta)["documents"]
+    if splitter is not None:
+        documents = splitter.run(documents=documents)["documents"]
+    return documents
+
+
+# Runs in a worker: the text of every document in the shard goes into one shared memory
+# block, so only ids, meta and offsets are pickled back to the parent.
+def _process_shard(sources: List[Any], meta: Optional[List[Dict[str, Any]]]):
+    converter, splitter = _worker_stages
+    documents = _convert_split(converter, splitter, sources, meta)
+    encoded = [(doc.content or "").encode("utf-8") for doc in documents]
+    offsets = [0]
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    block = None
+    if offsets[-1]:
+        block = shared_memory.SharedMemory(create=True, size=offsets[-1])
+        block.buf[: offsets[-1]] = b"".join(encoded)
+        block.close()
+    headers = [(doc.id, doc.meta, doc.content is None) for doc in documents]
+    return (block.name if block else None), offsets, headers
+
+
+def _read_shard(name: Optional[str], offsets: List[int], headers: List[Any]) -> List[Document]:
+    block = shared_memory.SharedMemory(name=name) if name else None
+    try:
+        documents = []
+        for i, (doc_id, meta, empty) in enumerate(headers):
+            content = None
+            if not empty:
+                content = bytes(block.buf[offsets[i] : offsets[i + 1]]).decode("utf-8") if block else ""
+            documents.append(Document(id=doc_id, content=content, meta=meta))
+        return documents
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
+
+
+# Process-pool execution of the CPU-bound convert (+ optional split) stages. Sources are cut
+# into contiguous shards, processed by `max_workers` processes and reassembled in input order,
+# so the output is identical to running converter and splitter in a single process.
+# The pool uses fork so the calling script is not re-imported by workers; where fork is not
+# available (Windows) the stages simply run in-process.
+@component
+class ParallelConvertSplit:
+    def __init__(self, converter: Any, splitter: Any = None, max_workers: Optional[int] = None, shard_size: int = 8):
+        self.converter = converter
+        self.splitter = splitter
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def warm_up(self):
+        if self._executor is not None or self.max_workers < 2:
+            return
+        if "fork" not in multiprocessing.get_all_start_methods():
+            return
+        # Workers must share the parent's resource tracker, so blocks they create and the
+        # parent unlinks are not reported as leaked when the workers exit
+        resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self.converter, self.splitter),
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @component.output_types(documents=List[Document])
+    def run(self, sources: List[Any], meta: Optional[List[Dict[str, Any]]] = None):
+        self.warm_up()
+        if self._executor is None or len(sources) <= self.shard_size:
+            return {"documents": _convert_split(self.converter, self.splitter, sources, meta)}
+
+        shards = []
+        for start in range(0, len(sources), self.shard_size):
+            shard_meta = meta[start : start + self.shard_size] if isinstance(meta, list) else meta
+            shards.append((sources[start : start + self.shard_size], shard_meta))
+        futures = [self._executor.submit(_process_shard, shard_sources, shard_meta) for shard_sources, shard_meta in shards]
+
+        documents = []
+        error = None
+        for future in futures:
+            try:
+                shard_documents = _read_shard(*future.result())
+            except Exception as shard_error:
+                error = error or shard_error
+                continue
+            if error is None:
+                documents.extend(shard_documents)
+        if error is not None:
+            raise error
+        return {"documents": documents}
@@ -0,0 +1,311 @@
+import argparse
+import contextvars
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from haystack import Pipeline
+
+from parallel_pipeline import ParallelPipelineRunner
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("current_run", default=None)
+_profiler: Optional["Profiler"] = None
+
+
+def _size(value: Any) -> Optional[int]:
+    if isinstance(value, (list, tuple, dict, set, str, bytes)):
+        return len(value)
+    return None
+
+
+def _sizes(values: Dict[str, Any]) -> Dict[str, int]:
+    sizes = {}
+    for name, value in (values or {}).items():
+        size = _size(value)
+        if size is not None:
+            sizes[name] = size
+    return sizes
+
+
+# Token usage reported by generators (meta is a list with one dict per reply) and embedders (meta is a dict)
+def _tokens(outputs: Any) -> Dict[str, int]:
+    if not isinstance(outputs, dict):
+        return {}
+    meta = outputs.get("meta")
+    metas = meta if isinstance(meta, list) else [meta]
+    tokens: Dict[str, int] = {}
+    for entry in metas:
+        usage = entry.get("usage") if isinstance(entry, dict) else None
+        for key, value in (usage or {}).items():
+            if isinstance(value, int):
+                tokens[key] = tokens.get(key, 0) + value
+    return tokens
+
+
+def _span_id() -> str:
+    return os.urandom(8).hex()
+
+
+# metadata["name"] when the pipeline has one, otherwise its component names
+def pipeline_name(pipeline: Pipeline) -> str:
+    name = (getattr(pipeline, "metadata", None) or {}).get("name")
+    if name:
+        return str(name)
+    components = list(pipeline.graph.nodes)
+    return "pipeline[" + ",".join(components[:4]) + (",..." if len(components) > 4 else "") + "]"
+
+
+# Collects one span per Pipeline.run and one child span per component call (a component in
+# a loop gets one span per iteration). Spans are appended to `trace_path` as JSON lines and,
+# with `otel_path`, as one OTLP/JSON document per run, which OpenTelemetry collectors and
+# viewers can import. After every run a flame-style summary is printed to stderr.
+class Profiler:
+    def __init__(self, trace_path: Optional[str] = None, otel_path: Optional[str] = None, summary: bool = True):
+        self.trace_path = trace_path
+        self.otel_path = otel_path
+        self.summary = summary
+        self._lock = threading.Lock()
+
+    def start_run(self, pipeline: Pipeline) -> Dict[str, Any]:
+        parent = _current_run.get()
+        run = {
+            "trace_id": parent["trace_id"] if parent else os.urandom(16).hex(),
+            "span_id": _span_id(),
+            "parent_id": parent["span_id"] if parent else None,
+            "name": pipeline_name(pipeline),
+            "kind": "pipeline",
+            "start": time.time(),
+            "wall_start": time.perf_counter(),
+            "cpu_start": time.thread_time(),
+            "spans": [],
+            "iterations": {},
+        }
+        run["token"] = _current_run.set(run)
+        return run
+
+    def end_run(self, run: Dict[str, Any], error: Optional[BaseException] = None):
+        _current_run.reset(run.pop("token"))
+        span = {
+            "trace_id": run["trace_id"],
+            "span_id": run["span_id"],
+            "parent_id": run["parent_id"],
+            "name": run["name"],
+            "kind": "pipeline",
+            "start": run["start"],
+            "wall_ms": 1000 * (time.perf_counter() - run["wall_start"]),
+            "cpu_ms": 1000 * (time.thread_time() - run["cpu_start"]),
+            "iterations": run["iterations"],
+            "error": repr(error) if error is not None else None,
+        }
+        spans = [span] + run["spans"]
+        parent = _current_run.get()
+        if parent is not None:
+            # Nested run (a pipeline called from inside a component): reported with its parent
+            parent["spans"].extend(spans)
+            return
+        self._export(spans)
+        if self.summary:
+            self.print_summary(spans)
+
+    def record(self, name: str, component: Any, inputs: Dict[str, Any], call):
+        run = _current_run.get()
+        start = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        outputs = None
+        error = None
+        try:
+            outputs = call()
+            return outputs
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            span = {
+                "trace_id": run["trace_id"] if run else None,
+                "span_id": _span_id(),
+                "parent_id": run["span_id"] if run else None,
+                "name": name,
+                "kind": "component",
+                "type": type(component).__name__,
+                "start": start,
+                "wall_ms": 1000 * (time.perf_counter() - wall_start),
+                "cpu_ms": 1000 * (time.thread_time() - cpu_start),
+                "inputs": _sizes(inputs),
+                "outputs": _sizes(outputs) if isinstance(outputs, dict) else {},
+                "tokens": _tokens(outputs),
+                "error": repr(error) if error is not None else None,
+            }
+            if run is not None:
+                run["iterations"][name] = run["iterations"].get(name, 0) + 1
+                span["iteration"] = run["iterations"][name]
+                run["spans"].append(span)
+            else:
+                self._export([span])
+
+    def _export(self, spans: List[Dict[str, Any]]):
+        with self._lock:
+            if self.trace_path:
+                with open(self.trace_path, "a", encoding="utf-8") as f:
+                    for span in spans:
+                        f.write(json.dumps(span) + "\n")
+            if self.otel_path:
+                with open(self.otel_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(to_otlp(spans)) + "\n")
+
+    @staticmethod
+    def print_summary(spans: List[Dict[str, Any]], width: int = 30):
+        root = spans[0]
+        total = max(root["wall_ms"], 1e-9)
+        by_name: Dict[str, Dict[str, Any]] = {}
+        for span in spans[1:]:
+            if span["kind"] != "component":
+                continue
+            entry = by_name.setdefault(span["name"], {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "tokens": 0})
+            entry["calls"] += 1
+            entry["wall_ms"] += span["wall_ms"]
+            entry["cpu_ms"] += span["cpu_ms"]
+            entry["tokens"] += span["tokens"].get("total_tokens", 0)
+        lines = [f"{root['name']}  {root['wall_ms']:.1f}ms wall, {root['cpu_ms']:.1f}ms cpu"]
+        for name, entry in sorted(by_name.items(), key=lambda item: item[1]["wall_ms"], reverse=True):
+            share = entry["wall_ms"] / total
+            bar = "#" * max(1, round(share * width))
+            tokens = f"  {entry['tokens']} tokens" if entry["tokens"] else ""
+            lines.append(
+                f"  {bar:<{width}} {name:<24} {entry['wall_ms']:9.1f}ms {100 * share:5.1f}%  "
+                f"cpu {entry['cpu_ms']:8.1f}ms  x{entry['calls']}{tokens}"
+            )
+        print("\n".join(lines), file=sys.stderr)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": value if isinstance(value, str) else json.dumps(value)}
+
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    otlp_spans = []
+    for span in spans:
+        attributes = {"haystack.kind": span["kind"], "cpu_ms": span["cpu_ms"]}
+        for key in ("type", "iteration", "error"):
+            if span.get(key) is not None:
+                attributes[f"haystack.{key}"] = span[key]
+        for group in ("inputs", "outputs", "tokens", "iterations"):
+            for key, value in (span.get(group) or {}).items():
+                attributes[f"haystack.{group}.{key}"] = value
+        start_ns = int(span["start"] * 1e9)
+        otlp_span = {
+            "traceId": span["trace_id"] or os.urandom(16).hex(),
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(span["wall_ms"] * 1e6)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2 if span.get("error") else 1},
+        }
+        if span.get("parent_id"):
+            otlp_span["parentSpanId"] = span["parent_id"]
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "haystack-pipelines"}}]},
+                "scopeSpans": [{"scope": {"name": "profiling"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def _wrap_component(name: str, instance: Any):
+    if getattr(instance, "_profiled", False):
+        return
+    run = instance.run
+
+    def profiled_run(*args, **kwargs):
+        if _profiler is None:
+            return run(*args, **kwargs)
+        return _profiler.record(name, instance, kwargs, lambda: run(*args, **kwargs))
+
+    instance.run = profiled_run
+    instance._profiled = True
+
+
+# Patches Pipeline.add_component, Pipeline.run and ParallelPipelineRunner.run_async, so every
+# pipeline built afterwards is profiled without changes to the scripts themselves
+def enable_profiling(trace_path: Optional[str] = None, otel_path: Optional[str] = None, summary: bool = True) -> Profiler:
+    global _profiler
+    _profiler = Profiler(trace_path=trace_path, otel_path=otel_path, summary=summary)
+    if getattr(Pipeline, "_profiling_patched", False):
+        return _profiler
+
+    add_component = Pipeline.add_component
+    run = Pipeline.run
+    run_async = ParallelPipelineRunner.run_async
+
+    def profiled_add_component(self, name: str, instance: Any):
+        result = add_component(self, name, instance)
+        _wrap_component(name, instance)
+        return result
+
+    def profiled_run(self, *args, **kwargs):
+        if _profiler is None:
+            return run(self, *args, **kwargs)
+        profile_run = _profiler.start_run(self)
+        error = None
+        try:
+            return run(self, *args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _profiler.end_run(profile_run, error)
+
+    async def profiled_run_async(self, *args, **kwargs):
+        # The runner hands cyclic pipelines to Pipeline.run, which opens their run span itself
+        if _profiler is None or not self.acyclic:
+            return await run_async(self, *args, **kwargs)
+        profile_run = _profiler.start_run(self.pipeline)
+        error = None
+        try:
+            return await run_async(self, *args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _profiler.end_run(profile_run, error)
+
+    Pipeline.add_component = profiled_add_component
+    Pipeline.run = profiled_run
+    ParallelPipelineRunner.run_async = profiled_run_async
+    Pipeline._profiling_patched = True
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    _profiler = None
+
+
+# python profiling.py [--trace traces.jsonl] [--otel traces.otlp.json] "Chat agent.py" [args...]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a script with every Haystack pipeline profiled")
+    parser.add_argument("--trace", default=os.getenv("PIPELINE_TRACE_PATH", "pipeline_traces.jsonl"))
+    parser.add_argument("--otel", default=os.getenv("PIPELINE_OTEL_PATH"))
+    parser.add_argument("--no-summary", action="store_true")
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    arguments = parser.parse_args()
+    enable_profiling(trace_path=arguments.trace, otel_path=arguments.otel, summary=not arguments.no_summary)
+    sys.argv = [arguments.script] + arguments.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(arguments.script)))
+    runpy.run_path(arguments.script, run_name="__main__")
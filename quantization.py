@@ -0,0 +1,261 @@
+import os
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+from haystack.document_stores.types import DuplicatePolicy
+from haystack.utils.filters import document_matches_filter
+
+QUANTIZATIONS = ("float32", "float16", "int8", "binary")
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# Rows scored per block, so dequantizing never materializes the whole matrix as float32
+_BLOCK_ROWS = 65536
+
+
+def popcount(codes: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(codes).sum(axis=-1, dtype=np.int32)
+    return _POPCOUNT[codes].sum(axis=-1, dtype=np.int32)
+
+
+# Embeddings packed into one contiguous array per quantization:
+#   float32 - 4 bytes per dimension, exact
+#   float16 - 2 bytes per dimension
+#   int8    - 1 byte per dimension plus a float32 scale per vector (symmetric, max-abs)
+#   binary  - 1 bit per dimension (the sign), scored by Hamming distance
+class QuantizedMatrix:
+    def __init__(self, quantization: str = "int8"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, but got {quantization!r}")
+        self.quantization = quantization
+        self.codes: Optional[np.ndarray] = None
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.rows = 0
+
+    @property
+    def nbytes(self) -> int:
+        if self.codes is None:
+            return 0
+        return self.codes[: self.rows].nbytes + (self.scales[: self.rows].nbytes if self.quantization == "int8" else 0)
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scales = np.ones(len(vectors), dtype=np.float32)
+        if self.quantization == "float32":
+            return vectors.astype(np.float32), scales
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), scales
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return np.packbits(vectors > 0, axis=1), scales
+
+    def append(self, vectors: np.ndarray) -> List[int]:
+        codes, scales = self.encode(np.asarray(vectors, dtype=np.float32))
+        needed = self.rows + len(codes)
+        if self.codes is None:
+            self.codes = np.zeros((0, codes.shape[1]), dtype=codes.dtype)
+        if self.codes.shape[0] < needed:
+            capacity = max(needed, 2 * self.codes.shape[0], 1024)
+            grown = np.zeros((capacity, self.codes.shape[1]), dtype=self.codes.dtype)
+            grown[: self.rows] = self.codes[: self.rows]
+            self.codes = grown
+            grown_scales = np.ones(capacity, dtype=np.float32)
+            grown_scales[: self.rows] = self.scales[: self.rows]
+            self.scales = grown_scales
+        self.codes[self.rows : needed] = codes
+        self.scales[self.rows : needed] = scales
+        rows = list(range(self.rows, needed))
+        self.rows = needed
+        return rows
+
+    def decode(self, rows: np.ndarray) -> np.ndarray:
+        codes = self.codes[rows]
+        if self.quantization == "binary":
+            return np.where(np.unpackbits(codes, axis=1).astype(bool), 1.0, -1.0).astype(np.float32)
+        return codes.astype(np.float32) * self.scales[rows, None]
+
+    # Approximate similarity of `query` to the given rows (all rows if None); for binary the
+    # score is the negated Hamming distance between sign bits
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is None:
+            rows = np.arange(self.rows)
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+            return -np.concatenate(
+                [popcount(self.codes[rows[i : i + _BLOCK_ROWS]] ^ query_bits) for i in range(0, len(rows), _BLOCK_ROWS)]
+                or [np.zeros(0, dtype=np.int32)]
+            ).astype(np.float32)
+        query = query.astype(np.float32)
+        scores = np.empty(len(rows), dtype=np.float32)
+        for i in range(0, len(rows), _BLOCK_ROWS):
+            block = rows[i : i + _BLOCK_ROWS]
+            scores[i : i + len(block)] = (self.codes[block].astype(np.float32) @ query) * self.scales[block]
+        return scores
+
+
+# InMemoryDocumentStore that keeps embeddings quantized in a QuantizedMatrix instead of as
+# Python lists on every Document. With `rescore`, full-precision float32 vectors are also kept
+# (in RAM, or in a file at `full_precision_path` that is memory-mapped, so they cost disk
+# rather than memory) and the best `rescore_factor * top_k` approximate hits are re-ranked
+# exactly. Works with InMemoryEmbeddingRetriever, and with filters.
+class QuantizedDocumentStore(InMemoryDocumentStore):
+    def __init__(
+        self,
+        quantization: str = "int8",
+        rescore: bool = True,
+        rescore_factor: Optional[int] = None,
+        full_precision_path: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.quantization = quantization
+        self.rescore = rescore
+        # Sign bits lose much more than float16/int8, so binary needs a wider candidate set
+        self.rescore_factor = rescore_factor or (16 if quantization == "binary" else 4)
+        self.full_precision_path = full_precision_path
+        self.quantized = QuantizedMatrix(quantization)
+        self._full: Optional[np.ndarray] = None
+        self._full_rows = 0
+        self._row_ids: List[Optional[str]] = []
+        self._id_rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        if full_precision_path and os.path.exists(full_precision_path):
+            # Vectors are only appended from this instance; a previous file would not match the rows
+            os.remove(full_precision_path)
+
+    def _vector(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.embedding_similarity_function == "cosine":
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm > 0 else vector
+        return vector
+
+    def _append_full(self, vectors: np.ndarray):
+        if self.full_precision_path:
+            with open(self.full_precision_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self._full_rows += len(vectors)
+            self._full = np.memmap(
+                self.full_precision_path, dtype=np.float32, mode="r", shape=(self._full_rows, vectors.shape[1])
+            )
+            return
+        if self._full is None:
+            self._full = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        needed = self._full_rows + len(vectors)
+        if self._full.shape[0] < needed:
+            grown = np.zeros((max(needed, 2 * self._full.shape[0], 1024), vectors.shape[1]), dtype=np.float32)
+            grown[: self._full_rows] = self._full[: self._full_rows]
+            self._full = grown
+        self._full[self._full_rows : needed] = vectors
+        self._full_rows = needed
+
+    def write_documents(self, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.NONE) -> int:
+        written = super().write_documents(documents, policy)
+        stored = [doc for doc in documents if doc.embedding is not None and self.storage.get(doc.id) is doc]
+        if not stored:
+            return written
+        self._remove_rows([doc.id for doc in stored])
+        vectors = np.stack([self._vector(doc.embedding) for doc in stored])
+        rows = self.quantized.append(vectors)
+        if self.rescore:
+            self._append_full(vectors)
+        if len(self._alive) < self.quantized.rows:
+            alive = np.zeros(max(self.quantized.rows, 2 * len(self._alive)), dtype=bool)
+            alive[: len(self._alive)] = self._alive
+            self._alive = alive
+        for row, doc in zip(rows, stored):
+            self._row_ids.append(doc.id)
+            self._id_rows[doc.id] = row
+            self._alive[row] = True
+            self.storage[doc.id] = replace(doc, embedding=None)
+        return written
+
+    def _remove_rows(self, document_ids: List[str]):
+        for doc_id in document_ids:
+            row = self._id_rows.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._row_ids[row] = None
+
+    def delete_documents(self, document_ids: List[str]) -> None:
+        super().delete_documents(document_ids)
+        self._remove_rows(document_ids)
+
+    def _embedding(self, row: int) -> List[float]:
+        if self._full is not None:
+            return self._full[row].tolist()
+        return self.quantized.decode(np.array([row]))[0].tolist()
+
+    def get_documents(self, document_ids: List[str], return_embedding: bool = False) -> List[Document]:
+        documents = [self.storage[doc_id] for doc_id in document_ids if doc_id in self.storage]
+        if return_embedding:
+            documents = [
+                replace(doc, embedding=self._embedding(self._id_rows[doc.id])) if doc.id in self._id_rows else doc
+                for doc in documents
+            ]
+        return documents
+
+    # Full-precision rows when they are kept, otherwise dequantized; deleted rows have id None
+    def embedding_matrix(self) -> Tuple[np.ndarray, List[Optional[str]]]:
+        rows = self.quantized.rows
+        if rows == 0:
+            return np.zeros((0, 0), dtype=np.float32), []
+        if self._full is not None:
+            return np.asarray(self._full[:rows]), list(self._row_ids)
+        return self.quantized.decode(np.arange(rows)), list(self._row_ids)
+
+    def memory_usage(self) -> Dict[str, int]:
+        return {
+            "quantized_bytes": self.quantized.nbytes,
+            "full_precision_bytes_in_memory": 0 if self.full_precision_path or self._full is None else self._full[: self._full_rows].nbytes,
+        }
+
+    def embedding_retrieval(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = False,
+        return_embedding: bool = False,
+    ) -> List[Document]:
+        if self.quantized.rows == 0 or top_k == 0:
+            return []
+        if filters:
+            rows = np.array(
+                [self._id_rows[doc.id] for doc in self.storage.values()
+                 if doc.id in self._id_rows and document_matches_filter(filters=filters, document=doc)],
+                dtype=np.int64,
+            )
+        else:
+            rows = np.flatnonzero(self._alive[: self.quantized.rows])
+        if len(rows) == 0:
+            return []
+
+        query = self._vector(query_embedding)
+        scores = self.quantized.scores(query, rows)
+        exact = self.quantization == "float32"
+        if self.rescore and self._full is not None and not exact:
+            candidates = min(len(rows), top_k * self.rescore_factor)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            rows = rows[top]
+            scores = np.asarray(self._full[rows]) @ query
+            exact = True
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        documents = []
+        for row, score in zip(rows[top], scores[top]):
+            doc = self.storage[self._row_ids[row]]
+            score = float(score)
+            if scale_score and exact:
+                if self.embedding_similarity_function == "cosine":
+                    score = (score + 1) / 2
+                else:
+                    score = float(1 / (1 + np.exp(-score / 100)))
+            embedding = self._embedding(row) if return_embedding else None
+            documents.append(replace(doc, score=score, embedding=embedding))
+        return documents
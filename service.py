@@ -0,0 +1,590 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+# Only the standard library is imported here: Haystack, the SentenceTransformers model and
+# the other components are imported and built when a pipeline is first used (or at startup
+# with --preload), so the client commands start instantly and the server pays the import
+# and model loading cost once instead of on every cron invocation.
+
+DEFAULT_PORT = int(os.getenv("SERVICE_PORT", "8765"))
+DEFAULT_SOCKET = os.getenv("SERVICE_SOCKET")
+EMBEDDING_MODEL = os.getenv("SERVICE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+INDEX_URLS = [
+    "https://haystack.deepset.ai/integrations/cohere",
+    "https://haystack.deepset.ai/integrations/anthropic",
+    "https://haystack.deepset.ai/integrations/jina",
+    "https://haystack.deepset.ai/integrations/nvidia",
+]
+PIPELINES = ("rag", "search", "summarize", "entities")
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "3000"))
+
+RAG_PROMPT = """
+Answer the question based on the provided context.
+Context:
+{% for doc in documents %}
+   {{ doc.content }}
+{% endfor %}
+Question: {{ query }}
+"""
+
+SUMMARY_PROMPT = """
+You will be provided a few of the top posts in HackerNews, followed by their URL.
+For each post, provide a brief summary followed by the URL the full post can be found at.
+
+Posts:
+{% for article in articles %}
+  {{ article.content }}
+  URL: {{ article.meta["url"] }}
+{% endfor %}
+"""
+
+
+def document_to_dict(doc: Any) -> Dict[str, Any]:
+    return {"id": doc.id, "content": doc.content, "score": doc.score, "meta": doc.meta}
+
+
+# A malformed request, answered with 400; any other error is the service's fault and a 500
+class RequestError(ValueError):
+    pass
+
+
+def required(request: Dict[str, Any], field: str, kind: type = str) -> Any:
+    if field not in request:
+        raise RequestError(f"Missing field '{field}'")
+    if not isinstance(request[field], kind):
+        raise RequestError(f"'{field}' must be of type {kind.__name__}, but got {type(request[field]).__name__}")
+    return request[field]
+
+
+def request_top_k(request: Dict[str, Any], default: int) -> int:
+    value = request.get("top_k", default)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise RequestError(f"'top_k' must be a positive integer, but got {value!r}")
+    return value
+
+
+# Many readers or one writer: queries run concurrently, indexing waits for them and blocks new
+# ones. A waiting writer goes before readers that arrive after it, so a steady stream of
+# queries cannot hold indexing off forever.
+class ReadWriteLock:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            try:
+                while self._writing or self._readers:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writing = True
+
+    def release_write(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+
+# Resident pipelines of RAGpipeline.py and Newswithbranching.py. The document store, BM25
+# index, caches and embedding model are created once and shared by the "rag" and "search"
+# pipelines, and `index_urls` are indexed when the store is first needed. Every pipeline is
+# built on first use and then reused for all later requests.
+class PipelineService:
+    def __init__(self, index_urls: Optional[List[str]] = None):
+        self.index_urls = INDEX_URLS if index_urls is None else index_urls
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self._pipelines: Dict[str, Any] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._shared: Optional[Dict[str, Any]] = None
+        self.answer_cache: Any = None
+        self._build_lock = threading.RLock()
+        self._store_lock = ReadWriteLock()
+        # The self-reflecting agent keeps per-run state in its validator, so it runs one text at a time
+        self._entities_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._builders: Dict[str, Callable[[], Any]] = {
+            "rag": self._build_rag,
+            "search": self._build_search,
+            "summarize": self._build_summarize,
+            "entities": self._build_entities,
+        }
+
+    def shared(self) -> Dict[str, Any]:
+        with self._build_lock:
+            if self._shared is not None:
+                return self._shared
+            from ann_index import IVFDocumentStore
+            from embedding_cache import CachedTextEmbedder, EmbeddingCache
+            from generator_cache import ResponseCache
+            from hybrid_retrieval import InvertedIndex
+            from model_pool import PooledTextEmbedder
+
+            embedding_cache = EmbeddingCache(path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"))
+            # Concurrent requests share one copy of the model and are encoded in micro-batches
+            query_embedder = CachedTextEmbedder(PooledTextEmbedder(model=EMBEDDING_MODEL), embedding_cache)
+            query_embedder.warm_up()
+            shared = {
+                "embedding_cache": embedding_cache,
+                "response_cache": ResponseCache(path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite")),
+                "document_store": IVFDocumentStore(),
+                "text_index": InvertedIndex(),
+                "query_embedder": query_embedder,
+            }
+            self._shared = shared
+            if self.index_urls:
+                self.index(self.index_urls)
+            return shared
+
+    def _build_indexing(self):
+        from haystack import Pipeline
+        from haystack.components.converters import HTMLToDocument
+        from haystack.document_stores.types import DuplicatePolicy
+
+        from embedding_cache import CachedDocumentEmbedder
+        from http_cache import CachedLinkFetcher, HTTPCache, PageDocumentRecorder
+        from hybrid_retrieval import HybridDocumentWriter
+        from model_pool import PooledDocumentEmbedder
+        from parallel_preprocess import ParallelConvertSplit
+
+        shared = self.shared()
+        embedder = CachedDocumentEmbedder(PooledDocumentEmbedder(model=EMBEDDING_MODEL), shared["embedding_cache"])
+        # The store lives as long as the service, so re-indexing only converts, embeds and writes
+        # the pages that changed since the last fetch, and deletes the chunks of their old versions
+        http_cache = HTTPCache(path=os.getenv("HTTP_CACHE_PATH", "http_cache"))
+        indexing = Pipeline()
+        indexing.add_component(
+            "fetcher", CachedLinkFetcher(http_cache, replay_unchanged=False, document_store=shared["document_store"])
+        )
+        indexing.add_component("converter", ParallelConvertSplit(converter=HTMLToDocument()))
+        indexing.add_component("embedder", embedder)
+        indexing.add_component(
+            "recorder",
+            PageDocumentRecorder(
+                http_cache,
+                document_store=shared["document_store"],
+                text_index=shared["text_index"],
+                record_documents=False,
+            ),
+        )
+        indexing.add_component(
+            "writer",
+            HybridDocumentWriter(
+                document_store=shared["document_store"], text_index=shared["text_index"], policy=DuplicatePolicy.OVERWRITE
+            ),
+        )
+        indexing.connect("fetcher.streams", "converter.sources")
+        indexing.connect("converter", "embedder")
+        indexing.connect("embedder", "recorder")
+        indexing.connect("recorder.documents", "writer.documents")
+        indexing.warm_up()
+        return indexing
+
+    def _build_search(self):
+        from haystack import Pipeline
+
+        from ann_index import IVFEmbeddingRetriever
+        from hybrid_retrieval import HybridRetriever
+
+        shared = self.shared()
+        search = Pipeline()
+        search.add_component(
+            "retriever",
+            HybridRetriever(
+                document_store=shared["document_store"],
+                text_index=shared["text_index"],
+                text_embedder=shared["query_embedder"],
+                embedding_retriever=IVFEmbeddingRetriever(document_store=shared["document_store"], nprobe=8),
+            ),
+        )
+        return search
+
+    def _build_rag(self):
+        from haystack.components.builders import PromptBuilder
+        from haystack.components.generators import OpenAIGenerator
+
+        from haystack.components.joiners import BranchJoiner
+
+        from answer_cache import AnswerCacheLookup, AnswerCacheWriter, SemanticAnswerCache
+        from context_packing import ContextPacker
+        from embedding_cache import CachedTextEmbedder
+        from generator_cache import CachedGenerator
+
+        shared = self.shared()
+        # Repeated and paraphrased questions are answered from the answer cache in a few milliseconds
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")), document_store=shared["document_store"]
+        )
+        query_embedder = shared["query_embedder"]
+        rag = self._build_search()
+        rag.add_component("query_embedder", CachedTextEmbedder(query_embedder.embedder, query_embedder.cache))
+        rag.add_component("answer_cache", AnswerCacheLookup(self.answer_cache))
+        rag.add_component("packer", ContextPacker(max_tokens=RAG_CONTEXT_TOKENS))
+        rag.add_component("prompt", PromptBuilder(template=RAG_PROMPT))
+        rag.add_component("generator", CachedGenerator(OpenAIGenerator(), shared["response_cache"]))
+        rag.add_component("answer_writer", AnswerCacheWriter(self.answer_cache))
+        rag.add_component("answer", BranchJoiner(List[str]))
+        rag.connect("query_embedder.embedding", "answer_cache.embedding")
+        rag.connect("answer_cache.query", "retriever.query")
+        rag.connect("answer_cache.query_embedding", "retriever.query_embedding")
+        rag.connect("answer_cache.query", "prompt.query")
+        rag.connect("answer_cache.query", "packer.query")
+        rag.connect("retriever.documents", "packer.documents")
+        rag.connect("packer.documents", "prompt.documents")
+        rag.connect("prompt", "generator")
+        rag.connect("answer_cache.query_embedding", "answer_writer.query_embedding")
+        rag.connect("answer_cache.params", "answer_writer.params")
+        rag.connect("retriever.documents", "answer_writer.documents")
+        rag.connect("generator.replies", "answer_writer.replies")
+        rag.connect("answer_cache.replies", "answer.value")
+        rag.connect("answer_writer.replies", "answer.value")
+        return rag
+
+    def _build_summarize(self):
+        from haystack import Pipeline
+        from haystack.components.builders import PromptBuilder
+        from haystack.components.generators import OpenAIGenerator
+
+        from context_packing import ContextPacker
+        from generator_cache import CachedGenerator, ResponseCache
+        from hackernews import HackernewsNewestFetcher
+
+        # Front pages change, so summaries are only reused for a few minutes
+        response_cache = ResponseCache(path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite"), ttl=300)
+        summarizer = Pipeline()
+        summarizer.add_component("fetcher", HackernewsNewestFetcher())
+        summarizer.add_component("packer", ContextPacker(max_tokens=SUMMARY_CONTEXT_TOKENS))
+        summarizer.add_component("prompt", PromptBuilder(template=SUMMARY_PROMPT))
+        summarizer.add_component("llm", CachedGenerator(OpenAIGenerator(), response_cache))
+        summarizer.connect("fetcher.articles", "packer.documents")
+        summarizer.connect("packer.documents", "prompt.articles")
+        summarizer.connect("prompt", "llm")
+        return summarizer
+
+    def _build_entities(self):
+        from entity_extraction import build_self_reflecting_agent
+
+        return build_self_reflecting_agent(verbose=False)
+
+    def pipeline(self, name: str) -> Any:
+        if name not in self._builders:
+            raise ValueError(f"Unknown pipeline '{name}', expected one of {list(self._builders)}")
+        pipeline = self._pipelines.get(name)
+        if pipeline is not None:
+            return pipeline
+        with self._build_lock:
+            if name not in self._pipelines:
+                start = time.perf_counter()
+                pipeline = self._builders[name]()
+                pipeline.warm_up()
+                self._pipelines[name] = pipeline
+                self._build_seconds[name] = time.perf_counter() - start
+            return self._pipelines[name]
+
+    def preload(self, names: List[str]):
+        for name in names:
+            self.pipeline(name)
+
+    def index(self, urls: List[str]) -> Dict[str, Any]:
+        with self._build_lock:
+            indexing = self._pipelines.get("indexing")
+            if indexing is None:
+                indexing = self._pipelines["indexing"] = self._build_indexing()
+        start = time.perf_counter()
+        self._store_lock.acquire_write()
+        try:
+            result = indexing.run({"fetcher": {"urls": urls}})
+        finally:
+            self._store_lock.release_write()
+        return {
+            "documents_written": result["writer"]["documents_written"],
+            "documents_deleted": result["recorder"]["documents_deleted"],
+            "fetch": result["fetcher"]["stats"],
+            "failures": result["fetcher"]["failures"],
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _run_rag(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        query = required(request, "query")
+        top_k = request_top_k(request, 1)
+        rag = self.pipeline("rag")
+        result = rag.run(
+            {
+                "query_embedder": {"text": query},
+                "answer_cache": {"query": query, "params": {"top_k": top_k}},
+                "retriever": {"top_k": top_k},
+            }
+        )
+        return {"answer": result["answer"]["value"][0], "cache_hit": result["answer_cache"]["cache_hit"]}
+
+    def _run_search(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        query, top_k = required(request, "query"), request_top_k(request, 5)
+        result = self.pipeline("search").run({"retriever": {"query": query, "top_k": top_k}})
+        return {
+            "documents": [document_to_dict(doc) for doc in result["retriever"]["documents"]],
+            "embedding_skipped": result["retriever"]["embedding_skipped"],
+        }
+
+    def _run_summarize(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        result = self.pipeline("summarize").run({"fetcher": {"top_k": request_top_k(request, 3)}})
+        return {"summary": result["llm"]["replies"][0], "failures": result["fetcher"]["failures"]}
+
+    def _run_entities(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        from entity_extraction import extract_entities
+
+        text = required(request, "text")
+        agent = self.pipeline("entities")
+        with self._entities_lock:
+            result = extract_entities(agent, text)
+        return {"entities": result["entities"], "metrics": result["metrics"]}
+
+    def query(self, name: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        with self._stats_lock:
+            self.requests += 1
+        try:
+            if name in ("rag", "search"):
+                self.pipeline(name)
+                self._store_lock.acquire_read()
+                try:
+                    result = self._run_rag(request) if name == "rag" else self._run_search(request)
+                finally:
+                    self._store_lock.release_read()
+            elif name == "summarize":
+                result = self._run_summarize(request)
+            elif name == "entities":
+                result = self._run_entities(request)
+            else:
+                raise RequestError(f"Unknown pipeline '{name}', expected one of {list(PIPELINES)}")
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "uptime_seconds": time.time() - self.started,
+            "requests": self.requests,
+            "errors": self.errors,
+            "pipelines": sorted(self._pipelines),
+            "build_seconds": dict(self._build_seconds),
+        }
+        if self._shared is not None:
+            stats["documents"] = self._shared["document_store"].count_documents()
+            stats["embedding_cache"] = self._shared["embedding_cache"].stats()
+            stats["embedding_models"] = self._shared["query_embedder"].embedder.pool.stats()
+        if self.answer_cache is not None:
+            stats["answer_cache"] = self.answer_cache.stats()
+        return stats
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service: PipelineService = self.server.service
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self._send(200, service.stats())
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        service: PipelineService = self.server.service
+        try:
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError as e:
+                raise RequestError(f"Request body is not valid JSON: {e}") from e
+            if not isinstance(request, dict):
+                raise RequestError(f"Request body must be a JSON object, but got {type(request).__name__}")
+            if self.path == "/index":
+                urls = required(request, "urls", list)
+                if not all(isinstance(url, str) for url in urls):
+                    raise RequestError("'urls' must be a list of strings")
+                self._send(200, service.index(urls))
+            elif self.path.startswith("/query/"):
+                self._send(200, service.query(self.path[len("/query/") :], request))
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+        except RequestError as e:
+            self._send(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socket, "AF_UNIX"):
+
+    class ServiceUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def get_request(self):
+            request, _ = super().get_request()
+            # BaseHTTPRequestHandler expects a (host, port) client address
+            return request, ("unix", 0)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 300):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+# Standard-library client for the service, over TCP or a Unix socket
+class ServiceClient:
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: Optional[str] = DEFAULT_SOCKET, timeout: float = 300):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if self.socket_path:
+            connection = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            data = json.dumps(body).encode("utf-8") if body is not None else None
+            connection.request(method, path, body=data, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            result = json.loads(response.read() or b"{}")
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"Service returned {response.status}: {result.get('error')}")
+        return result
+
+    def query(self, pipeline: str, **request) -> Dict[str, Any]:
+        return self.request("POST", f"/query/{pipeline}", request)
+
+    def index(self, urls: List[str]) -> Dict[str, Any]:
+        return self.request("POST", "/index", {"urls": urls})
+
+    def stats(self) -> Dict[str, Any]:
+        return self.request("GET", "/stats")
+
+
+def serve(service: PipelineService, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: Optional[str] = None):
+    if socket_path:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not available on this platform, use --port instead")
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ServiceUnixServer(socket_path, ServiceRequestHandler)
+        address = socket_path
+    else:
+        server = ServiceHTTPServer((host, port), ServiceRequestHandler)
+        address = f"http://{host}:{server.server_address[1]}"
+    server.service = service
+    print(f"Serving {', '.join(PIPELINES)} on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# python service.py serve [--port 8765 | --socket /tmp/haystack.sock] [--preload rag,search]
+# python service.py query rag "How can I use Cohere with Haystack?"
+# python service.py query summarize --top-k 3
+# python service.py index https://haystack.deepset.ai/integrations/jina
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident Haystack pipelines behind a local HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="serve on / connect to a Unix socket instead of TCP")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--preload", default="", help="pipelines to build before serving, e.g. rag,search")
+    serve_parser.add_argument("--no-index", action="store_true", help="start with an empty document store")
+    query_parser = commands.add_parser("query")
+    query_parser.add_argument("pipeline", choices=PIPELINES)
+    query_parser.add_argument("text", nargs="?", default="")
+    query_parser.add_argument("--top-k", type=int)
+    index_parser = commands.add_parser("index")
+    index_parser.add_argument("urls", nargs="+")
+    commands.add_parser("stats")
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+        start = time.perf_counter()
+        service = PipelineService(index_urls=[] if arguments.no_index else None)
+        service.preload([name for name in arguments.preload.split(",") if name])
+        print(f"Ready in {time.perf_counter() - start:.2f}s")
+        serve(service, host=arguments.host, port=arguments.port, socket_path=arguments.socket)
+        sys.exit(0)
+
+    client = ServiceClient(host=arguments.host, port=arguments.port, socket_path=arguments.socket)
+    if arguments.command == "query":
+        request: Dict[str, Any] = {"text": arguments.text} if arguments.pipeline == "entities" else {"query": arguments.text}
+        if arguments.top_k is not None:
+            request["top_k"] = arguments.top_k
+        result = client.query(arguments.pipeline, **request)
+        if "answer" in result:
+            print(result["answer"])
+        elif "summary" in result:
+            print(result["summary"])
+        elif "entities" in result:
+            print(result["entities"])
+        else:
+            for i, document in enumerate(result["documents"]):
+                print("\n--------------\n")
+                print(f"DOCUMENT {i}")
+                print(document["content"])
+    elif arguments.command == "index":
+        print(client.index(arguments.urls))
+    else:
+        print(json.dumps(client.stats(), indent=2, default=str))
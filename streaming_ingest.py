@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from glob import iglob
+from queue import Queue
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from haystack.document_stores.types import DuplicatePolicy
+
+from incremental_indexing import ChunkEmbeddingReuser, FileChangeDetector
+
+_DONE = object()
+
+
+def iter_files(pattern: str) -> Iterator[str]:
+    return iglob(pattern, recursive=True)
+
+
+def print_progress(stats: Dict[str, Any]):
+    print(
+        f"{stats['files']} files, {stats['documents']} documents, {stats['chunks']} chunks written "
+        f"({stats['documents_per_second']:.1f} docs/s, {stats['chunks_per_second']:.1f} chunks/s)"
+    )
+
+
+# Streams files through converter -> splitter -> embedder -> writer in micro-batches.
+# Sources are pulled lazily from any iterable (e.g. iter_files); a producer thread converts
+# and splits up to `max_queued_batches` batches ahead of the embedder, and blocks when the
+# queue is full, so peak memory depends on the batch size, not on the size of the corpus.
+# With a change detector (and optionally a reuser) only new or modified files are embedded,
+# and the manifest is saved after every micro-batch.
+class StreamingIngestor:
+    def __init__(
+        self,
+        converter: Any,
+        splitter: Any,
+        embedder: Any,
+        writer: Any,
+        files_per_batch: int = 16,
+        max_queued_batches: int = 2,
+        change_detector: Optional[FileChangeDetector] = None,
+        reuser: Optional[ChunkEmbeddingReuser] = None,
+        progress_interval: float = 5.0,
+        progress_callback: Callable[[Dict[str, Any]], None] = print_progress,
+    ):
+        self.converter = converter
+        self.splitter = splitter
+        self.embedder = embedder
+        self.writer = writer
+        self.files_per_batch = files_per_batch
+        self.max_queued_batches = max_queued_batches
+        self.change_detector = change_detector
+        self.reuser = reuser
+        self.progress_interval = progress_interval
+        self.progress_callback = progress_callback
+
+    def _prepare(self, source_paths: List[str]):
+        documents = self.converter.run(
+            sources=source_paths, meta=[{"source_path": source_path} for source_path in source_paths]
+        )["documents"]
+        chunks = self.splitter.run(documents=documents)["documents"]
+        return source_paths, len(documents), chunks
+
+    def _produce(self, sources: Iterable[str], queue: Queue):
+        try:
+            batch = []
+            for source in sources:
+                if self.change_detector is not None:
+                    source = self.change_detector.check(source)
+                    if source is None:
+                        continue
+                else:
+                    source = os.path.abspath(source)
+                batch.append(source)
+                if len(batch) == self.files_per_batch:
+                    queue.put(self._prepare(batch))
+                    batch = []
+            if batch:
+                queue.put(self._prepare(batch))
+            if self.change_detector is not None:
+                self.change_detector.finish()
+            queue.put(_DONE)
+        except BaseException as error:
+            queue.put(error)
+
+    def run(self, sources: Iterable[str]) -> Dict[str, Any]:
+        for stage in (self.converter, self.splitter, self.embedder, self.writer):
+            if hasattr(stage, "warm_up"):
+                stage.warm_up()
+
+        queue: Queue = Queue(maxsize=self.max_queued_batches)
+        producer = threading.Thread(target=self._produce, args=(sources, queue), daemon=True)
+        producer.start()
+
+        manifest = self.change_detector.manifest if self.change_detector is not None else None
+        document_store = self.writer.document_store
+        stats = {"files": 0, "documents": 0, "chunks": 0, "embedded": 0}
+        start = last_report = time.perf_counter()
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            source_paths, documents, chunks = item
+            total_chunks = len(chunks)
+            if self.reuser is not None:
+                chunks = self.reuser.run(documents=chunks)["documents"]
+            embedded = self.embedder.run(documents=chunks)["documents"] if chunks else []
+            to_write = embedded + (manifest.take_reused() if manifest is not None else [])
+            if to_write:
+                self.writer.run(documents=to_write, policy=DuplicatePolicy.OVERWRITE)
+            if manifest is not None:
+                self._remove_from_text_index(manifest.commit(document_store, source_paths))
+
+            stats["files"] += len(source_paths)
+            stats["documents"] += documents
+            stats["chunks"] += total_chunks
+            stats["embedded"] += len(embedded)
+            now = time.perf_counter()
+            if now - last_report >= self.progress_interval:
+                self.progress_callback(self._rates(stats, now - start))
+                last_report = now
+
+        producer.join()
+        if manifest is not None:
+            self._remove_from_text_index(manifest.commit(document_store))
+        text_index = getattr(self.writer, "text_index", None)
+        if text_index is not None:
+            text_index.save()
+        stats = self._rates(stats, time.perf_counter() - start)
+        self.progress_callback(stats)
+        return stats
+
+    # A HybridDocumentWriter also indexes text; chunks deleted by the manifest leave that index
+    # too. The index is saved once, at the end of the run.
+    def _remove_from_text_index(self, stale_ids: List[str]):
+        text_index = getattr(self.writer, "text_index", None)
+        if text_index is not None and stale_ids:
+            text_index.remove(stale_ids)
+
+    @staticmethod
+    def _rates(stats: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+        elapsed = max(elapsed, 1e-9)
+        return {
+            **stats,
+            "seconds": elapsed,
+            "documents_per_second": stats["documents"] / elapsed,
+            "chunks_per_second": stats["chunks"] / elapsed,
+        }
@@ -0,0 +1,74 @@
+from haystack import Document
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+from haystack.document_stores.types import DuplicatePolicy
+
+from answer_cache import AnswerCacheLookup, AnswerCacheWriter, SemanticAnswerCache
+from fake_backends import HashTextEmbedder
+
+embedder = HashTextEmbedder(dimensions=256)
+
+
+def embed(text: str):
+    return embedder.run(text=text)["embedding"]
+
+
+def answer(cache: SemanticAnswerCache, query: str, documents, params=None):
+    result = AnswerCacheLookup(cache).run(query=query, embedding=embed(query), params=params)
+    assert not result["cache_hit"]
+    AnswerCacheWriter(cache).run(
+        query_embedding=result["query_embedding"], replies=[f"answer to {query}"], documents=documents, params=result["params"]
+    )
+
+
+def test_paraphrase_at_or_above_threshold_is_a_hit():
+    # The paraphrase shares three of its four terms with the question: similarity ~0.87
+    cache = SemanticAnswerCache(threshold=0.85)
+    documents = [Document(id="cohere", content="Use the Cohere integration")]
+    answer(cache, "How can I use Cohere with Haystack?", documents, params={"top_k": 1})
+
+    paraphrase = "How do I use the Cohere integration in Haystack"
+    hit = AnswerCacheLookup(cache).run(query=paraphrase, embedding=embed(paraphrase), params={"top_k": 1})
+    assert hit["cache_hit"]
+    assert hit["replies"] == ["answer to How can I use Cohere with Haystack?"]
+    assert [doc.id for doc in hit["documents"]] == ["cohere"]
+
+    # A similarity exactly at the threshold is a hit, anything below it a miss
+    similarity = cache.lookup(embed(paraphrase), {"top_k": 1})["similarity"]
+    assert 0.85 <= similarity < 1.0
+    cache.threshold = similarity
+    assert cache.lookup(embed(paraphrase), {"top_k": 1}) is not None
+    cache.threshold = similarity + 1e-6
+    miss = AnswerCacheLookup(cache).run(query=paraphrase, embedding=embed(paraphrase), params={"top_k": 1})
+    assert not miss["cache_hit"]
+    assert miss["query"] == paraphrase
+
+
+def test_entries_only_match_the_same_params():
+    cache = SemanticAnswerCache(threshold=0.9)
+    question = "How can I use Cohere with Haystack?"
+    answer(cache, question, [Document(id="cohere", content="Use the Cohere integration")], params={"top_k": 1})
+
+    assert cache.lookup(embed(question), {"top_k": 3}) is None
+    assert cache.lookup(embed(question), {"top_k": 1, "language": "French"}) is None
+    assert cache.lookup(embed(question)) is None
+    assert cache.lookup(embed(question), {"top_k": 1}) is not None
+    assert cache.stats()["hits"] == 1
+
+
+def test_changed_or_deleted_document_invalidates_the_entry():
+    store = InMemoryDocumentStore()
+    cohere = Document(id="cohere", content="Use the Cohere integration")
+    jina = Document(id="jina", content="Use the Jina integration")
+    store.write_documents([cohere, jina])
+    cache = SemanticAnswerCache(threshold=0.9, document_store=store)
+    answer(cache, "How can I use Cohere with Haystack?", [cohere])
+    answer(cache, "How can I use Jina with Haystack?", [jina])
+    assert cache.lookup(embed("How can I use Cohere with Haystack?")) is not None
+
+    store.write_documents([Document(id="cohere", content="The Cohere integration moved")], policy=DuplicatePolicy.OVERWRITE)
+    store.delete_documents(["jina"])
+
+    assert cache.lookup(embed("How can I use Cohere with Haystack?")) is None
+    assert cache.lookup(embed("How can I use Jina with Haystack?")) is None
+    assert cache.stats()["invalidated"] == 2
+    assert len(cache) == 0
@@ -0,0 +1,38 @@
+import sqlite3
+
+from embedding_cache import CachedTextEmbedder, EmbeddingCache
+from fake_backends import HashTextEmbedder
+
+
+def test_disk_hits_do_not_lock_the_shared_cache_file(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    embedder = HashTextEmbedder(dimensions=8)
+    CachedTextEmbedder(embedder, EmbeddingCache(path=path)).run(text="What is Haystack?")
+
+    # A second process answers from disk only, then a third one writes to the same file
+    reader = CachedTextEmbedder(embedder, EmbeddingCache(path=path))
+    assert reader.run(text="What is Haystack?")["meta"]["cache_hit"]
+    writer = EmbeddingCache(path=path)
+    writer.put(writer.key("hash-embedding", "What is Jina?"), [0.0] * 8)
+    writer.flush()
+
+    (count,) = sqlite3.connect(path).execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    assert count == 2
+
+
+def test_disk_entries_are_evicted_least_recently_used_first(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(max_entries=1, path=path, max_disk_entries=10)
+    for i in range(10):
+        cache.put(f"key {i}", [float(i)])
+    cache.flush()
+    # Touching the oldest entry keeps it; the next insert evicts down to nine entries
+    assert cache.get("key 0") == [0.0]
+    cache.flush()
+    cache.put("key 10", [10.0])
+    cache.flush()
+
+    keys = {key for (key,) in sqlite3.connect(path).execute("SELECT key FROM embeddings")}
+    assert len(keys) == 9
+    assert "key 0" in keys and "key 10" in keys
+    assert "key 1" not in keys and "key 2" not in keys
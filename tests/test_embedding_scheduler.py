@@ -0,0 +1,67 @@
+import time
+
+from haystack import Document
+from haystack.utils.auth import Secret
+
+from embedding_cache import CachedDocumentEmbedder, EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler, TokenBucket
+from fake_backends import FakeOpenAIServer, HashEmbedding, SyntheticText
+
+
+def documents(n: int, words: int = 40):
+    return [Document(content=text) for text in SyntheticText(seed=7).texts(n, words)]
+
+
+def scheduler(server: FakeOpenAIServer, **kwargs) -> EmbeddingScheduler:
+    kwargs.setdefault("max_retries", 4)
+    return EmbeddingScheduler(api_key=Secret.from_token("test"), api_base_url=server.url, dimensions=64, **kwargs)
+
+
+def test_rate_limited_batches_are_retried_after_retry_after():
+    docs = documents(12)
+    with FakeOpenAIServer(latency=0.0, rate_limit_every=3, retry_after=0.2) as server:
+        result = scheduler(server, max_batch_size=2, max_concurrency=2).run(documents=docs)
+
+    meta = result["meta"]
+    assert server.rate_limited > 0
+    assert meta["rate_limited"] == server.rate_limited
+    assert meta["retries"] == server.rate_limited
+    assert meta["batches"] == 6
+    # Every retry waited for the server's Retry-After
+    assert meta["seconds"] >= 0.2
+    embed = HashEmbedding(64)
+    assert [doc.embedding for doc in result["documents"]] == [embed(doc.content) for doc in docs]
+
+
+def test_requests_are_paced_to_tokens_per_minute():
+    docs = documents(20)
+    with FakeOpenAIServer(latency=0.0) as server:
+        embedder = scheduler(server, max_batch_size=2, max_concurrency=4)
+        total = sum(embedder.count_tokens(doc.content) for doc in docs)
+        # The bucket starts full with a minute's worth of tokens; the rest must wait for about a second
+        embedder.tokens = TokenBucket(total * 60 / 61)
+        start = time.perf_counter()
+        result = embedder.run(documents=docs)
+        elapsed = time.perf_counter() - start
+
+    assert result["meta"]["batches"] == 10
+    assert server.embedding_requests == 10
+    assert 0.8 <= elapsed < 5.0
+
+
+def test_checkpoint_lookups_do_not_count_as_cache_misses(tmp_path):
+    docs = documents(6)
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite"))
+    with FakeOpenAIServer(latency=0.0) as server:
+        embedder = scheduler(server, checkpoint=cache)
+        CachedDocumentEmbedder(embedder, cache).run(documents=docs)
+        assert cache.stats()["misses"] == len(docs)
+
+        # A rerun is answered by the cache in front of the scheduler, and a direct rerun of the
+        # scheduler resumes every document from the checkpoint without touching the stats
+        CachedDocumentEmbedder(embedder, cache).run(documents=docs)
+        resumed = embedder.run(documents=docs)
+    assert resumed["meta"]["resumed"] == len(docs)
+    assert server.embedding_requests == 1
+    assert cache.stats()["misses"] == len(docs)
+    assert cache.stats()["hits"] == len(docs)
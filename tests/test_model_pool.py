@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from haystack import Document
+
+from model_pool import ModelPool, PooledDocumentEmbedder, PooledTextEmbedder
+
+
+# Stands in for a SentenceTransformer: records every forward pass and takes `delay` seconds each
+class FakeModel:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.passes: List[List[str]] = []
+        self.lock = threading.Lock()
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        with self.lock:
+            self.passes.append(list(texts))
+        time.sleep(self.delay)
+        return np.array([[len(text), sum(map(ord, text))] for text in texts], dtype=np.float32)
+
+
+def vector(text: str) -> List[float]:
+    return [float(len(text)), float(sum(map(ord, text)))]
+
+
+def pool_with(model: FakeModel, max_batch_size: int = 32, max_wait_ms: float = 20.0) -> ModelPool:
+    def loader(name: str, backend: str, device: Optional[str]) -> FakeModel:
+        return model
+
+    return ModelPool(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, loader=loader)
+
+
+def test_concurrent_queries_share_few_forward_passes():
+    model = FakeModel(delay=0.01)
+    pool = pool_with(model)
+    embedder = PooledTextEmbedder(pool=pool)
+    queries = [f"query number {i}" for i in range(256)]
+    results = {}
+    barrier = threading.Barrier(len(queries))
+
+    def ask(query: str):
+        barrier.wait()
+        results[query] = embedder.run(text=query)["embedding"]
+
+    threads = [threading.Thread(target=ask, args=(query,)) for query in queries]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results[query] == vector(query) for query in queries)
+    # 256 queries in batches of at most 32: eight full passes, plus a few partial ones at the edges
+    assert len(model.passes) <= 16
+    assert max(len(batch) for batch in model.passes) <= 32
+    assert pool.stats()[embedder.model]["texts"] == 256
+
+
+def test_queries_are_encoded_between_slices_of_a_large_request():
+    model = FakeModel(delay=0.05)
+    pool = pool_with(model, max_batch_size=16, max_wait_ms=1.0)
+    documents = [Document(content=f"document {i}") for i in range(160)]
+    document_embedder = PooledDocumentEmbedder(pool=pool)
+    query_embedder = PooledTextEmbedder(pool=pool)
+    embedded = {}
+
+    indexing = threading.Thread(target=lambda: embedded.update(document_embedder.run(documents=documents)))
+    indexing.start()
+    while not model.passes:
+        time.sleep(0.001)
+    query = query_embedder.run(text="what is haystack")["embedding"]
+    indexing.join()
+
+    assert query == vector("what is haystack")
+    # The query went out with the second slice of documents, not after all ten
+    assert [i for i, batch in enumerate(model.passes) if "what is haystack" in batch] == [1]
+    assert len(model.passes) == 11
+    assert all(len(batch) <= 16 for batch in model.passes)
+    assert [doc.embedding for doc in embedded["documents"]] == [vector(doc.content) for doc in documents]
@@ -0,0 +1,168 @@
+import threading
+
+from haystack.components.converters import HTMLToDocument
+from haystack.components.generators import OpenAIGenerator
+from haystack.document_stores.types import DuplicatePolicy
+from haystack.utils.auth import Secret
+
+from ann_index import IVFDocumentStore
+from chat_streaming import StreamingFunctionDispatcher
+from fake_backends import FakeOpenAIServer, FixtureServer, HashDocumentEmbedder
+from generator_cache import CachedGenerator, ResponseCache
+from hackernews import HackernewsNewestFetcher
+from http_cache import CachedLinkFetcher, HTTPCache, PageDocumentRecorder
+from hybrid_retrieval import HybridDocumentWriter, InvertedIndex
+from tool_execution import ToolExecutor
+
+
+def generator(server: FakeOpenAIServer, **kwargs) -> OpenAIGenerator:
+    return OpenAIGenerator(api_key=Secret.from_token("test"), api_base_url=server.url, **kwargs)
+
+
+def index_pages(fetcher: CachedLinkFetcher, recorder: PageDocumentRecorder, urls):
+    fetched = fetcher.run(urls=urls)
+    documents = HTMLToDocument().run(sources=fetched["streams"])["documents"]
+    documents = recorder.run(documents=HashDocumentEmbedder(dimensions=32).run(documents=documents)["documents"])["documents"]
+    return fetched, documents
+
+
+def test_unchanged_pages_are_revalidated_and_replayed(tmp_path):
+    cache = HTTPCache(str(tmp_path / "http_cache"))
+    fetcher = CachedLinkFetcher(cache)
+    recorder = PageDocumentRecorder(cache)
+    with FixtureServer() as server:
+        urls = [server.page_url(page) for page in (1, 2, 3)]
+        first, documents = index_pages(fetcher, recorder, urls)
+        assert first["stats"]["changed"] == 3
+        assert len(documents) == 3
+
+        server.edit([2])
+        second = fetcher.run(urls=urls)
+
+    # Pages 1 and 3 answer 304 and come back as their recorded, embedded documents
+    assert server.not_modified == 2
+    assert second["stats"]["not_modified"] == 2
+    assert second["stats"]["replayed"] == 2
+    assert second["stats"]["changed"] == 1
+    assert [stream.meta["url"] for stream in second["streams"]] == [urls[1]]
+    replayed = {doc.id: doc for doc in second["documents"]}
+    expected = [doc for doc in documents if doc.meta["url"] != urls[1]]
+    assert sorted(replayed) == sorted(doc.id for doc in expected)
+    assert all(replayed[doc.id].embedding == doc.embedding for doc in expected)
+
+
+def test_changed_page_replaces_its_chunks_in_a_long_lived_store(tmp_path):
+    cache = HTTPCache(str(tmp_path / "http_cache"))
+    store, text_index = IVFDocumentStore(), InvertedIndex()
+    fetcher = CachedLinkFetcher(cache, replay_unchanged=False, document_store=store)
+    recorder = PageDocumentRecorder(cache, document_store=store, text_index=text_index, record_documents=False)
+    writer = HybridDocumentWriter(document_store=store, text_index=text_index, policy=DuplicatePolicy.OVERWRITE)
+
+    def index(urls):
+        fetched, documents = index_pages(fetcher, recorder, urls)
+        writer.run(documents=documents)
+        return fetched
+
+    with FixtureServer() as server:
+        urls = [server.page_url(page) for page in (1, 2, 3)]
+        index(urls)
+        old_ids = {doc.meta["url"]: doc.id for doc in store.filter_documents()}
+
+        # Unchanged pages whose chunks are still in the store produce nothing
+        assert index(urls)["streams"] == []
+
+        server.edit([2])
+        refetch = index(urls)
+        assert [stream.meta["url"] for stream in refetch["streams"]] == [urls[1]]
+
+        # A new store no longer has the chunks, so the cached bodies are converted again
+        fresh = CachedLinkFetcher(cache, replay_unchanged=False, document_store=IVFDocumentStore()).run(urls=urls)
+        assert len(fresh["streams"]) == 3
+
+    ids = {doc.meta["url"]: doc.id for doc in store.filter_documents()}
+    assert store.count_documents() == 3
+    assert ids[urls[0]] == old_ids[urls[0]] and ids[urls[2]] == old_ids[urls[2]]
+    assert ids[urls[1]] != old_ids[urls[1]]
+    assert old_ids[urls[1]] not in text_index.rows
+    assert len(text_index) == 3
+    assert len(store.ann_retrieval([0.0] * 31 + [1.0], top_k=10)) == 3
+
+
+def test_malformed_link_fails_only_its_own_page(tmp_path):
+    fetcher = CachedLinkFetcher(HTTPCache(str(tmp_path / "http_cache")))
+    with FixtureServer() as server:
+        urls = [server.page_url(1), f"{server.url}/pages/2\t.html", server.page_url(3)]
+        result = fetcher.run(urls=urls)
+
+    assert [failure["url"] for failure in result["failures"]] == [urls[1]]
+    assert result["failures"][0]["error"].startswith("InvalidURL")
+    assert result["stats"]["failed"] == 1
+    assert [stream.meta["url"] for stream in result["streams"]] == [urls[0], urls[2]]
+
+
+def test_hackernews_failures_are_reported_per_story():
+    with FixtureServer(stories=6) as server:
+        server.remove([3])
+        result = HackernewsNewestFetcher(api_url=server.hackernews_url).run(top_k=6)
+
+    assert [failure["hn_id"] for failure in result["failures"]] == [3]
+    assert "404" in result["failures"][0]["error"]
+    assert sorted(article.meta["hn_id"] for article in result["articles"]) == [1, 2, 4, 5, 6]
+
+
+def test_hackernews_story_with_a_malformed_url_fails_alone():
+    with FixtureServer(stories=6) as server:
+        server.break_links([2])
+        result = HackernewsNewestFetcher(api_url=server.hackernews_url).run(top_k=6)
+
+    assert [failure["hn_id"] for failure in result["failures"]] == [2]
+    assert result["failures"][0]["error"].startswith("InvalidURL")
+    assert sorted(article.meta["hn_id"] for article in result["articles"]) == [1, 3, 4, 5, 6]
+
+
+def test_streamed_function_call_is_dispatched_once_while_streaming():
+    calls = []
+
+    def rag_pipeline_func(query: str):
+        calls.append(query)
+        return f"answer to {query}"
+
+    executor = ToolExecutor({"rag_pipeline_func": rag_pipeline_func})
+    dispatcher = StreamingFunctionDispatcher({"rag_pipeline_func": rag_pipeline_func}, tool_executor=executor)
+    with FakeOpenAIServer(latency=0.0, token_latency=0.05) as server:
+        chat = generator(server, streaming_callback=dispatcher.streaming_callback)
+        dispatcher.start()
+        replies = chat.run(prompt="System: use the tools\nUser: Where does Mark live?")["replies"]
+        result = dispatcher.run(replies=replies)
+
+    # The call was detected and sent while the reply was streaming, and was not run again
+    assert 0 < dispatcher.metrics["time_to_function_call"]
+    assert calls == ["Where does Mark live?"]
+    assert executor.stats()["rag_pipeline_func"]["calls"] == 1
+    assert len(result["function_replies"]) == 1
+
+
+def test_concurrent_identical_prompts_share_one_generator_request():
+    with FakeOpenAIServer(latency=0.3) as server:
+        cached = CachedGenerator(generator(server), ResponseCache())
+        barrier = threading.Barrier(8)
+        replies = []
+
+        def ask():
+            barrier.wait()
+            replies.append(cached.run(prompt="What is Haystack?")["replies"])
+
+        threads = [threading.Thread(target=ask) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        again = cached.run(prompt="What is Haystack?")
+
+    assert server.requests == 1
+    # One caller sent the request and the other seven waited for it; the last call is a cache hit
+    assert cached.stats()["misses"] == 1
+    assert cached.stats()["coalesced"] == 7
+    assert cached.stats()["hits"] == 1
+    assert all(reply == replies[0] for reply in replies)
+    assert again["meta"][0]["cache_hit"] is True
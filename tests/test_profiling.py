@@ -0,0 +1,43 @@
+import json
+
+from haystack import Pipeline, component
+
+from parallel_pipeline import ParallelPipelineRunner, run_pipelines
+from profiling import disable_profiling, enable_profiling
+
+
+@component
+class Upper:
+    @component.output_types(text=str)
+    def run(self, text: str):
+        return {"text": text.upper()}
+
+
+def pipeline() -> Pipeline:
+    pipe = Pipeline()
+    pipe.add_component("first", Upper())
+    pipe.add_component("second", Upper())
+    pipe.connect("first.text", "second.text")
+    return pipe
+
+
+def test_parallel_runner_runs_open_a_pipeline_root_span(tmp_path):
+    trace_path = tmp_path / "traces.jsonl"
+    enable_profiling(trace_path=str(trace_path), summary=False)
+    try:
+        result = ParallelPipelineRunner(pipeline()).run({"first": {"text": "haystack"}})
+        run_pipelines([(pipeline(), {"first": {"text": "rag"}}), (pipeline(), {"first": {"text": "news"}})])
+    finally:
+        disable_profiling()
+
+    assert result == {"second": {"text": "HAYSTACK"}}
+    spans = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    roots = [span for span in spans if span["kind"] == "pipeline"]
+    assert len(roots) == 3
+    assert all(root["parent_id"] is None and root["iterations"] == {"first": 1, "second": 1} for root in roots)
+    assert len({root["trace_id"] for root in roots}) == 3
+    # Every component span belongs to one of the runs
+    parents = {root["span_id"]: root["trace_id"] for root in roots}
+    components = [span for span in spans if span["kind"] == "component"]
+    assert len(components) == 6
+    assert all(parents[span["parent_id"]] == span["trace_id"] for span in components)
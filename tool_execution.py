@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Runs tool calls on a thread pool so independent calls overlap. Results of tools listed in
+# `pure_functions` are memoized per (function, arguments) for `ttl` seconds, and identical
+# calls that are still running share one execution. Every call waits at most the tool's
+# timeout (`timeouts[name]`, else `timeout`); a call that fails or times out yields an error
+# message instead of raising, so the model can see what went wrong.
+class ToolExecutor:
+    def __init__(
+        self,
+        available_functions: Dict[str, Callable[..., Any]],
+        pure_functions: Iterable[str] = (),
+        ttl: float = 300.0,
+        timeout: float = 30.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        max_workers: int = 8,
+    ):
+        self.available_functions = available_functions
+        self.pure_functions = set(pure_functions)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._memo: Dict[Tuple[str, str], Tuple[float, Future]] = {}
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def _record(self, name: str, **counts: float):
+        with self._lock:
+            metrics = self.metrics.setdefault(
+                name, {"calls": 0, "hits": 0, "errors": 0, "timeouts": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            for key, value in counts.items():
+                metrics[key] += value
+            if "seconds" in counts:
+                metrics["max_seconds"] = max(metrics["max_seconds"], counts["seconds"])
+
+    def _run(self, name: str, arguments: Dict[str, Any]) -> str:
+        start = time.perf_counter()
+        try:
+            return str(self.available_functions[name](**arguments))
+        finally:
+            self._record(name, calls=1, seconds=time.perf_counter() - start)
+
+    def submit(self, name: str, arguments: Dict[str, Any]) -> Future:
+        if name not in self.available_functions:
+            future = Future()
+            future.set_exception(ValueError(f"unknown function {name!r}"))
+            return future
+        if name not in self.pure_functions:
+            return self._executor.submit(self._run, name, arguments)
+
+        key = (name, json.dumps(arguments, sort_keys=True, default=str))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is not None and entry[0] > now and not (entry[1].done() and entry[1].exception()):
+                hit = True
+            else:
+                hit = False
+                entry = (now + self.ttl, self._executor.submit(self._run, name, arguments))
+                self._memo[key] = entry
+                # Drop expired entries so the memo does not grow without bound
+                for expired in [k for k, (expires, _) in self._memo.items() if expires <= now]:
+                    del self._memo[expired]
+        if hit:
+            self._record(name, hits=1)
+        return entry[1]
+
+    # `started` is when the call was submitted (time.monotonic()); the timeout counts from there
+    def result(self, name: str, future: Future, started: Optional[float] = None) -> str:
+        timeout = self.timeouts.get(name, self.timeout)
+        remaining = timeout if started is None else max(0.0, started + timeout - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            self._record(name, timeouts=1)
+            return f"Error processing function call: {name} timed out after {timeout}s"
+        except Exception as e:
+            self._record(name, errors=1)
+            return f"Error processing function call: {str(e)}"
+
+    def call(self, name: str, arguments: Dict[str, Any]) -> str:
+        return self.result(name, self.submit(name, arguments))
+
+    # Starts all calls at once and returns their results in order
+    def call_many(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        started = time.monotonic()
+        futures = [self.submit(name, arguments) for name, arguments in calls]
+        return [self.result(name, future, started) for (name, _), future in zip(calls, futures)]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {**metrics, "avg_seconds": metrics["seconds"] / metrics["calls"] if metrics["calls"] else 0.0}
+                for name, metrics in self.metrics.items()
+            }